@@ -1,15 +1,60 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///./email_assistant.db"
-
-#conexao com o banco de dados
-engine = create_engine(
+from app.core.config import (
     DATABASE_URL,
-    connect_args={"check_same_thread": False}  # necessário pro SQLite
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
 )
 
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Ajustes aplicados a cada conexão SQLite:
+    - WAL: leitores não ficam bloqueados enquanto o analyze-all grava
+    - synchronous=NORMAL: seguro com WAL e bem mais rápido que FULL
+    - busy_timeout: espera o lock em vez de falhar com "database is locked"
+    - mmap_size: leituras direto da memória mapeada
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Cria o engine com os ajustes do backend: pragmas no SQLite, pool dimensionado no Postgres."""
+    if url.startswith("sqlite"):
+        sqlite_engine = create_engine(
+            url,
+            connect_args={
+                "check_same_thread": False,  # necessário pro SQLite
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+        )
+        event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+        return sqlite_engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,  # descarta conexões derrubadas pelo servidor antes de usar
+    )
+
+
+#conexao com o banco de dados
+engine = create_db_engine()
+
 #criando sessao no banco de dados
 #autocommit = controle de salvamento
 #autoflush = controlar envio de alteracoes no banco
@@ -24,4 +69,28 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def upgrade_schema(bind=engine) -> None:
+    """
+    create_all não altera tabelas existentes (e ainda não usamos Alembic).
+    Adiciona ao banco as colunas e índices novos dos models que ainda não existem,
+    para que bancos criados em versões anteriores continuem funcionando.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from fastapi import HTTPException, Security
+from fastapi import HTTPException, Query, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 
@@ -14,8 +14,12 @@ if not _SECRET_KEY:
 SECRET_KEY = _SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 horas
+# Token de stream: vai na URL do EventSource (fica em logs de acesso), então vale pouco
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+_STREAM_SCOPE = "stream"
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 def create_access_token(data: dict) -> str:
@@ -26,6 +30,12 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_stream_token(user_id: int) -> str:
+    """JWT de curta duração que só abre rotas de stream (ver get_stream_user_id)."""
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    return jwt.encode({"sub": str(user_id), "scope": _STREAM_SCOPE, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+
 def decode_access_token(token: str) -> dict:
     """Decodifica e valida um JWT. Lança exceção se inválido."""
     try:
@@ -43,7 +53,32 @@ def get_current_user_id(
     Uso nas rotas: user_id: int = Depends(get_current_user_id)
     """
     payload = decode_access_token(credentials.credentials)
+    if payload.get("scope") == _STREAM_SCOPE:
+        raise HTTPException(status_code=401, detail="Token de stream não vale para esta rota.")
     user_id: int = payload.get("sub")
     if user_id is None:
         raise HTTPException(status_code=401, detail="Token sem identificação de usuário.")
-    return int(user_id)
\ No newline at end of file
+    return int(user_id)
+
+
+def get_stream_user_id(
+    credentials: HTTPAuthorizationCredentials | None = Security(optional_security),
+    token: str | None = Query(None),
+) -> int:
+    """
+    Igual a get_current_user_id, mas também aceita em ?token= um token de stream
+    (create_stream_token) — o EventSource do navegador não permite enviar o header
+    Authorization. O JWT de sessão nunca é aceito na query string. Só para rotas de stream.
+    """
+    if credentials:
+        payload = decode_access_token(credentials.credentials)
+    elif token:
+        payload = decode_access_token(token)
+        if payload.get("scope") != _STREAM_SCOPE:
+            raise HTTPException(status_code=401, detail="Use um token de stream em ?token=.")
+    else:
+        raise HTTPException(status_code=401, detail="Token não informado.")
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Token sem identificação de usuário.")
+    return int(user_id)
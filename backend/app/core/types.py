@@ -0,0 +1,33 @@
+import zlib
+
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+# Textos menores que isso não compensam o custo de comprimir
+_MIN_COMPRESS_SIZE = 64
+
+
+class CompressedText(TypeDecorator):
+    """
+    Texto guardado comprimido com zlib (corpos de e-mail em HTML encolhem ~5-10x).
+
+    Linhas gravadas antes da compressão (texto puro) continuam sendo lidas normalmente,
+    então a migração pode ser feita aos poucos (ver manage.py compress-bodies).
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = value.encode("utf-8")
+        if len(data) < _MIN_COMPRESS_SIZE:
+            return b"\x00" + data
+        return zlib.compress(data)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if value[:1] == b"\x00":
+            return value[1:].decode("utf-8")
+        return zlib.decompress(value).decode("utf-8")
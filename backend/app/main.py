@@ -1,18 +1,40 @@
+import logging
+import threading
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.database import engine, Base
+from app.core.database import engine, Base, SessionLocal, upgrade_schema
 
 from app.models import user_model            
 from app.models import email_model           
 from app.models import email_analysis_model  
+from app.models import backfill_model
+from app.models import rate_limit_model
+from app.models import analysis_cache_model
+from app.models import user_stats_model
+from app.models import email_rollup_model
+from app.models import analysis_job_model
+from app.models import analysis_job_item_model
+from app.models import analysis_event_model
+from app.models import thread_summary_model
 
 from app.routers import auth_router, email_router, ai_router
+from app.core.config import ANALYSIS_WORKER_EMBEDDED, BODY_PREFETCH_ENABLED
+from app.services.stats_store import initialize_missing_stats
+from app.services.analysis_jobs import run_worker
+from app.services.analysis_scheduler import run_activity_flusher
+from app.services.pre_classifier import run_retrainer
+from app.services import gmail_async, search_index, similarity_index, body_hydration
 
 app = FastAPI(title="Email Assistant API")
 
 # Criar tabelas automaticamente ao iniciar (sem Alembic por ora)
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+search_index.ensure_schema(engine)
+
+logger = logging.getLogger(__name__)
 
 # CORS — permite o front em localhost:3000 se comunicar com o back
 
@@ -31,6 +53,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Retoma importações de histórico interrompidas por restart/crash
+@app.on_event("startup")
+def resume_backfills():
+    email_router.resume_interrupted_backfills()
+
+
+# Bancos anteriores aos contadores do dashboard: calcula uma vez a partir dos e-mails
+@app.on_event("startup")
+def init_dashboard_stats():
+    db = SessionLocal()
+    try:
+        initialize_missing_stats(db)
+    finally:
+        db.close()
+
+
+# Bancos anteriores à busca e aos e-mails parecidos: indexa os e-mails existentes
+# em segundo plano (a API já responde)
+def _index_missing_emails():
+    db = SessionLocal()
+    try:
+        indexed = search_index.index_missing(db)
+        if indexed:
+            logger.info("Índice de busca: %d e-mails existentes indexados.", indexed)
+        indexed = similarity_index.index_missing(db)
+        if indexed:
+            logger.info("Índice de similaridade: %d e-mails existentes indexados.", indexed)
+    except Exception as e:
+        logger.error("Falha ao preencher os índices de busca: %s", str(e))
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def init_search_index():
+    threading.Thread(target=_index_missing_emails, daemon=True, name="search-index").start()
+
+
+# Worker da fila de análises dentro do processo da API (ver app/worker.py)
+_worker_stop = threading.Event()
+
+
+@app.on_event("startup")
+def start_analysis_worker():
+    if ANALYSIS_WORKER_EMBEDDED:
+        threading.Thread(target=run_worker, args=(_worker_stop,), daemon=True, name="analysis-worker").start()
+        threading.Thread(target=run_retrainer, args=(_worker_stop,), daemon=True, name="pre-classifier").start()
+
+
+# Sync só de metadados: adianta em background o corpo dos e-mails com mais chance de serem abertos
+@app.on_event("startup")
+def start_body_prefetcher():
+    if BODY_PREFETCH_ENABLED:
+        threading.Thread(
+            target=body_hydration.run_prefetcher, args=(_worker_stop,), daemon=True, name="body-prefetch",
+        ).start()
+
+
+# Atividade dos usuários (fair-share do analyze-all e prefetcher): gravada em lote, fora das requisições
+@app.on_event("startup")
+def start_activity_flusher():
+    threading.Thread(target=run_activity_flusher, args=(_worker_stop,), daemon=True, name="activity-flush").start()
+
+
+@app.on_event("shutdown")
+def stop_analysis_worker():
+    _worker_stop.set()
+
+
+@app.on_event("shutdown")
+async def close_gmail_http():
+    await gmail_async.aclose()
+
+
 @app.get("/")
 def root():
     return {"status": "Email Assistant API rodando ✅"}
\ No newline at end of file
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AnalysisCacheEntry(Base):
+    """
+    Resultado da Gemini indexado pelo hash do conteúdo (assunto + corpo normalizados,
+    modelo e versão do prompt). E-mails idênticos reaproveitam a mesma análise.
+    """
+    __tablename__ = "analysis_cache"
+
+    content_hash = Column(String, primary_key=True)
+    summary = Column(Text, nullable=True)
+    suggested_reply = Column(Text, nullable=True)
+    category = Column(String, nullable=True)
+    urgency = Column(String, nullable=True)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime, nullable=False, index=True)   # base da evicção LRU
@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from app.core.database import Base
+
+
+class AnalysisEvent(Base):
+    """
+    Resultado de um e-mail analisado pelo analyze-all, gravado junto com a análise.
+    É a ponte entre os workers (qualquer processo) e os streams SSE da API;
+    linhas antigas são apagadas depois de ANALYSIS_EVENTS_RETENTION segundos.
+    """
+    __tablename__ = "analysis_events"
+
+    id = Column(Integer, primary_key=True)           # também é o id do evento SSE
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    job_id = Column(Integer, nullable=False)
+    email_id = Column(Integer, nullable=False)
+    category = Column(String, nullable=True)
+    urgency = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
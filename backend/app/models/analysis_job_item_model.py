@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from app.core.database import Base
+
+
+class AnalysisJobItem(Base):
+    """
+    Ordem de prioridade dos e-mails de um job do analyze-all, calculada uma única vez
+    na primeira fatia (analysis_scheduler.next_slice). Cada fatia lê as próximas
+    posições a partir de AnalysisJob.next_position, sem reordenar os pendentes.
+    Cada linha é apagada quando o e-mail entra em done (no mesmo commit); as que
+    sobrarem, quando o job termina.
+    """
+    __tablename__ = "analysis_job_items"
+
+    job_id = Column(Integer, ForeignKey("analysis_jobs.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    email_id = Column(Integer, nullable=False)
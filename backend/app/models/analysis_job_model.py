@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AnalysisJob(Base):
+    """
+    Job do analyze-all na fila do banco, processado por workers (app/worker.py).
+    Um worker reivindica o job com um lease que renova por heartbeat; se ele cair,
+    o lease expira e outro worker retoma dos e-mails ainda sem análise.
+    Cada reivindicação processa só uma fatia de e-mails; entre fatias o job fica
+    "running" sem dono e volta à disputa pela ordem de `vtime` (ver analysis_scheduler).
+    """
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed
+    max_email_id = Column(Integer, nullable=True)    # e-mails sincronizados depois ficam para o próximo job
+    total = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)   # reivindicações interrompidas (crash) + a atual
+    vtime = Column(Float, nullable=True, default=0.0)       # tempo virtual do fair-share: menor é atendido primeiro
+    failed_email_ids = Column(Text, nullable=True)          # JSON: e-mails que falharam neste job (não são repetidos)
+    next_position = Column(Integer, nullable=True)          # próxima posição em analysis_job_items (nulo = ordem ainda não calculada)
+    fetch_failures = Column(Integer, nullable=True, default=0)  # falhas seguidas ao buscar corpos no Gmail
+    not_before = Column(DateTime, nullable=True)            # backoff: nenhum worker reivindica o job antes disso
+    worker_id = Column(String, nullable=True)        # worker dono do lease atual
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # No máximo um job ativo por usuário — garante o 409 mesmo com vários processos
+    __table_args__ = (
+        Index(
+            "ux_analysis_jobs_active_user", user_id, unique=True,
+            sqlite_where=status.in_(("queued", "running")),
+            postgresql_where=status.in_(("queued", "running")),
+        ),
+        Index("ix_analysis_jobs_status_lease", status, lease_expires_at),
+    )
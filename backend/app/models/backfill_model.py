@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class MailboxBackfill(Base):
+    """Checkpoint da importação completa da caixa de um usuário (uma linha por usuário)."""
+    __tablename__ = "mailbox_backfills"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+    status = Column(String, nullable=False, default="running")  # running, completed, failed
+    page_token = Column(String, nullable=True)      # próxima página do messages.list a buscar
+    fetched = Column(Integer, nullable=False, default=0)   # mensagens já processadas
+    inserted = Column(Integer, nullable=False, default=0)  # mensagens novas gravadas no banco
+    total = Column(Integer, nullable=True)          # estimativa do Gmail (messagesTotal da INBOX)
+    error = Column(Text, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # atualizado a cada página gravada
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -11,8 +11,9 @@ class EmailAnalysis(Base):
     email_id = Column(Integer, ForeignKey("emails.id"), unique=True, nullable=False)
     summary = Column(Text, nullable=True)           # resumo gerado pela IA
     suggested_reply = Column(Text, nullable=True)   # resposta sugerida pela IA
-    category = Column(String, nullable=True)        # trabalho, financeiro, pessoal, urgente...
-    urgency = Column(String, nullable=True)         # alta, média, baixa
+    category = Column(String, nullable=True, index=True)   # trabalho, financeiro, pessoal, urgente...
+    urgency = Column(String, nullable=True, index=True)    # alta, média, baixa
+    source = Column(String, nullable=True, default="gemini")  # gemini ou local (pré-classificador); nulo = gemini
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relacionamento
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.core.database import Base
+from app.core.types import CompressedText
 
 
 class Email(Base):
@@ -15,11 +16,24 @@ class Email(Base):
     sender = Column(String, nullable=True)
     recipient = Column(String, nullable=True)
     snippet = Column(String, nullable=True)                  # preview curto do Gmail
-    body = Column(Text, nullable=True)                       # corpo completo
+    # Corpos ficam comprimidos e só são carregados quando acessados (a listagem não os lê)
+    body = deferred(Column(CompressedText, nullable=True))        # corpo completo
+    clean_body = deferred(Column(CompressedText, nullable=True))  # corpo limpo e truncado usado no prompt da IA
+    # False = só metadados (o corpo é buscado no Gmail sob demanda); nulo = e-mail anterior ao sync por metadados
+    body_loaded = Column(Boolean, nullable=True)
     date = Column(DateTime, nullable=True)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relacionamentos
     user = relationship("User", back_populates="emails")
-    analysis = relationship("EmailAnalysis", back_populates="email", uselist=False)
\ No newline at end of file
+    analysis = relationship("EmailAnalysis", back_populates="email", uselist=False)
+
+    # Listagem da inbox: filtra por usuário e ordena por data (paginação keyset)
+    __table_args__ = (
+        Index("ix_emails_user_date_id", user_id, date.desc(), id.desc()),
+        # Mensagens de uma conversa (análise por thread)
+        Index("ix_emails_user_thread", user_id, thread_id),
+        # Prefetcher: e-mails ainda sem corpo
+        Index("ix_emails_body_loaded_user", body_loaded, user_id),
+    )
\ No newline at end of file
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from app.core.database import Base
+
+
+class DailyEmailRollup(Base):
+    """
+    Volume diário de e-mails por usuário × categoria × urgência (pela data do e-mail),
+    mantido incrementalmente pelo sync e pela análise. E-mails ainda não analisados
+    ficam com categoria e urgência "" e mudam de linha quando a análise é gravada.
+    """
+    __tablename__ = "email_daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True, default="")
+    urgency = Column(String, primary_key=True, default="")
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Float
+from app.core.database import Base
+
+
+class RateLimitBucket(Base):
+    """Estado de um token bucket compartilhado entre processos (GEMINI_RATE_LIMIT_BACKEND=database)."""
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)   # epoch em segundos
+    paused_until = Column(Float, nullable=True)  # epoch; backoff vale para todos os processos
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class ThreadSummary(Base):
+    """
+    Resumo corrente de uma conversa (thread do Gmail), usado como contexto na análise
+    por conversa no lugar do histórico citado. last_email_id é a última mensagem já
+    incorporada ao resumo; as seguintes são as que ainda vão para o prompt.
+    """
+    __tablename__ = "thread_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    thread_id = Column(String, primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    last_email_id = Column(Integer, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0)   # mensagens incorporadas ao resumo
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
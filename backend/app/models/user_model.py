@@ -14,6 +14,9 @@ class User(Base):
     google_id = Column(String, unique=True, nullable=False)
     access_token = Column(String, nullable=False)
     refresh_token = Column(String, nullable=True)
+    token_expiry = Column(DateTime, nullable=True)   # expiração do access_token (UTC)
+    history_id = Column(String, nullable=True)       # último historyId sincronizado do Gmail
+    last_active_at = Column(DateTime, nullable=True)  # último acesso à inbox (prioriza a fila de análises)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from app.core.database import Base
+
+
+class UserStatCounter(Base):
+    """
+    Contadores do dashboard mantidos incrementalmente (sync, análise, leitura).
+    Chaves: "total", "unread", "category:<categoria>", "urgency:<urgência>".
+    """
+    __tablename__ = "user_stat_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
@@ -1,82 +1,131 @@
+import asyncio
+import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+from starlette.concurrency import run_in_threadpool
 
 from app.core.database import get_db, SessionLocal
-from app.core.security import get_current_user_id
+from app.core.security import get_current_user_id, get_stream_user_id, create_stream_token, STREAM_TOKEN_EXPIRE_SECONDS
 from app.models.email_model import Email
 from app.models.email_analysis_model import EmailAnalysis
-from app.services.ai_service import analyze_email
+from app.models.thread_summary_model import ThreadSummary
+from app.services.ai_service import limiter
+from app.services.email_preprocessing import clean_email_body
+from app.services.analysis_cache import (
+    analyze_email_cached,
+    analyze_email_stream_cached,
+    analysis_cache,
+    result_events,
+)
+from app.services.analysis_jobs import enqueue_job, get_latest_job, JobAlreadyActiveError
+from app.services.job_events import job_events, replay_events
+from app.services.pre_classifier import pre_classifier
+from app.services.rate_limiter import GeminiUnavailableError
+from app.services import stats_store, search_index, thread_analysis, body_hydration
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
-# Dicionário em memória para rastrear o progresso dos jobs em background.
-# Chave: user_id | Valor: dict com status do job
-# Nota: em produção com múltiplos workers, substituir por Redis.
-_jobs: dict[int, dict] = {}
+# Intervalo (s) entre comentários keep-alive nos streams SSE
+_SSE_KEEPALIVE = 15
 
 
-def _run_analyze_all(user_id: int) -> None:
-    """
-    Função executada em background pelo FastAPI BackgroundTasks.
-    Usa sua própria sessão de banco, independente da requisição HTTP.
-    """
-    db = SessionLocal()
-    try:
-        analyzed_ids = db.query(EmailAnalysis.email_id).subquery()
-        emails = (
-            db.query(Email)
-            .filter(
-                Email.user_id == user_id,
-                Email.id.notin_(analyzed_ids),
-                Email.body.isnot(None),
-            )
-            .all()
-        )
+def _save_analysis(db: Session, user_id: int, email: Email, result: dict) -> EmailAnalysis:
+    analysis = EmailAnalysis(
+        email_id=email.id,
+        summary=result["summary"],
+        category=result["category"],
+        urgency=result["urgency"],
+        suggested_reply=result["suggested_reply"],
+        source=result.get("source", "gemini"),
+    )
+    db.add(analysis)
+    db.flush()
+    stats_store.record_analyses(db, user_id, [(email.date, result)])
+    search_index.index_summaries(db, [(email.id, result["summary"])])
+    db.commit()
+    db.refresh(analysis)
+    return analysis
 
-        total = len(emails)
-        _jobs[user_id] = {"status": "running", "total": total, "done": 0, "errors": 0}
-
-        if total == 0:
-            _jobs[user_id]["status"] = "completed"
-            return
-
-        for email in emails:
-            try:
-                result = analyze_email(email.subject or "", email.body)
-
-                analysis = EmailAnalysis(
-                    email_id=email.id,
-                    summary=result["summary"],
-                    category=result["category"],
-                    urgency=result["urgency"],
-                    suggested_reply=result["suggested_reply"],
-                )
-                db.add(analysis)
-                db.commit()
-                _jobs[user_id]["done"] += 1
-
-            except Exception as e:
-                db.rollback()
-                _jobs[user_id]["errors"] += 1
-                logger.error(
-                    "Falha ao analisar email_id=%d (user_id=%d): %s",
-                    email.id, user_id, str(e),
-                )
-
-        _jobs[user_id]["status"] = "completed"
-        logger.info(
-            "analyze-all concluído para user_id=%d: %d analisados, %d erros.",
-            user_id, _jobs[user_id]["done"], _jobs[user_id]["errors"],
-        )
 
-    except Exception as e:
-        logger.error("Erro fatal no job analyze-all para user_id=%d: %s", user_id, str(e))
-        _jobs[user_id] = {"status": "failed", "error": str(e)}
-    finally:
-        db.close()
+def _analysis_response(email_id: int, analysis: EmailAnalysis, cached: bool) -> dict:
+    return {
+        "email_id": email_id,
+        "summary": analysis.summary,
+        "category": analysis.category,
+        "urgency": analysis.urgency,
+        "suggested_reply": analysis.suggested_reply,
+        "source": analysis.source or "gemini",
+        "cached": cached,
+    }
+
+
+def _body_fetch_failed(e: body_hydration.BodyFetchError) -> HTTPException:
+    return HTTPException(status_code=502, detail=f"Não foi possível buscar o corpo do e-mail no Gmail: {e}")
+
+
+def _load_email_for_analysis(db: Session, email_id: int, user_id: int) -> Email:
+    email = (
+        db.query(Email)
+        .options(undefer(Email.body), undefer(Email.clean_body))
+        .filter(Email.id == email_id, Email.user_id == user_id)
+        .first()
+    )
+    if not email:
+        raise HTTPException(status_code=404, detail="E-mail não encontrado.")
+    if email.body_loaded is False:
+        # Sync só de metadados: baixa o corpo antes de analisar
+        try:
+            body_hydration.hydrate(db, user_id, [email.id])
+        except body_hydration.BodyFetchError as e:
+            raise _body_fetch_failed(e)
+    if not email.body:
+        raise HTTPException(status_code=400, detail="E-mail sem corpo para analisar.")
+    return email
+
+
+def _thread_response(db: Session, thread_id: str, state, emails: list[Email], fresh: set[int]) -> dict:
+    analyses = {
+        analysis.email_id: analysis
+        for analysis in db.query(EmailAnalysis).filter(EmailAnalysis.email_id.in_([email.id for email in emails]))
+    }
+    return {
+        "thread_id": thread_id,
+        "summary": state.summary if state else None,
+        "summarized_messages": state.message_count if state else 0,
+        "message_count": len(emails),
+        "messages": [
+            {
+                "email_id": email.id,
+                "subject": email.subject,
+                "sender": email.sender,
+                "date": email.date,
+                "analysis": _analysis_response(email.id, analyses[email.id], cached=email.id not in fresh)
+                if email.id in analyses else None,
+            }
+            for email in emails
+        ],
+    }
+
+
+def _event_data(event: dict) -> dict:
+    """Payload de um evento de analyze_email_stream, sem a chave "event"."""
+    return {key: value for key, value in event.items() if key != "event"}
+
+
+def _format_sse(event: dict) -> str:
+    lines = []
+    if "id" in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'], ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
 
 
 @router.post("/analyze/{email_id}")
@@ -89,117 +138,288 @@ def analyze_single_email(
     Analisa um e-mail específico com IA:
     gera resumo, classifica e sugere resposta.
     """
-    email = db.query(Email).filter(Email.id == email_id, Email.user_id == user_id).first()
-    if not email:
-        raise HTTPException(status_code=404, detail="E-mail não encontrado.")
-    if not email.body:
-        raise HTTPException(status_code=400, detail="E-mail sem corpo para analisar.")
+    email = _load_email_for_analysis(db, email_id, user_id)
 
     # Retorna cache se já analisado
     existing = db.query(EmailAnalysis).filter(EmailAnalysis.email_id == email_id).first()
     if existing:
-        return {
-            "email_id": email_id,
-            "summary": existing.summary,
-            "category": existing.category,
-            "urgency": existing.urgency,
-            "suggested_reply": existing.suggested_reply,
-            "cached": True,
-        }
-
-    # Análise em chamada única à Gemini
-    result = analyze_email(email.subject or "", email.body)
+        return _analysis_response(email_id, existing, cached=True)
 
-    analysis = EmailAnalysis(
-        email_id=email_id,
-        summary=result["summary"],
-        category=result["category"],
-        urgency=result["urgency"],
-        suggested_reply=result["suggested_reply"],
-    )
-    db.add(analysis)
-    db.commit()
-    db.refresh(analysis)
+    if email.clean_body is None:
+        email.clean_body = clean_email_body(email.body)
 
-    return {
-        "email_id": email_id,
-        "summary": analysis.summary,
-        "category": analysis.category,
-        "urgency": analysis.urgency,
-        "suggested_reply": analysis.suggested_reply,
-        "cached": False,
-    }
+    # Análise em chamada única à Gemini (ou reaproveitada de um e-mail de conteúdo idêntico)
+    try:
+        result, _ = analyze_email_cached(email.subject or "", email.clean_body)
+    except GeminiUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        )
+
+    analysis = _save_analysis(db, user_id, email, result)
+    return _analysis_response(email_id, analysis, cached=False)
+
+
+@router.post("/analyze/{email_id}/stream")
+def analyze_single_email_stream(
+    email_id: int,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Variante em streaming de POST /ai/analyze/{email_id} (text/event-stream):
+    - `field`: {"name": "summary"|"category"|"urgency", "value": ...} assim que cada campo fica pronto;
+    - `reply`: {"delta": "..."} com o texto da resposta sugerida conforme é gerado;
+    - `done`: a análise completa (mesmo formato da rota sem streaming), já gravada;
+    - `error`: {"detail", "retry_after"} se a Gemini estiver indisponível.
+    Use fetch com leitura do body — EventSource não faz POST.
+    """
+    email = _load_email_for_analysis(db, email_id, user_id)
+
+    existing = db.query(EmailAnalysis).filter(EmailAnalysis.email_id == email_id).first()
+    if existing:
+        response = _analysis_response(email_id, existing, cached=True)
+        events = [{"event": e["event"], "data": _event_data(e)} for e in result_events(response)]
+        events.append({"event": "done", "data": response})
+        return StreamingResponse((_format_sse(e) for e in events), media_type="text/event-stream")
+
+    if email.clean_body is None:
+        email.clean_body = clean_email_body(email.body)
+        db.commit()
+    subject, clean_body = email.subject or "", email.clean_body
+
+    def stream():
+        try:
+            for event in analyze_email_stream_cached(subject, clean_body):
+                if event["event"] != "done":
+                    yield _format_sse({"event": event["event"], "data": _event_data(event)})
+                    continue
+
+                # Sessão própria: a da requisição pode já ter sido fechada durante o stream
+                save_db = SessionLocal()
+                try:
+                    target = save_db.query(Email).filter(Email.id == email_id).first()
+                    try:
+                        analysis = _save_analysis(save_db, user_id, target, event["result"])
+                        response = _analysis_response(email_id, analysis, cached=event["cached"])
+                    except IntegrityError:
+                        # Analisado por outra requisição enquanto gerávamos
+                        save_db.rollback()
+                        analysis = save_db.query(EmailAnalysis).filter(EmailAnalysis.email_id == email_id).first()
+                        response = _analysis_response(email_id, analysis, cached=True)
+                finally:
+                    save_db.close()
+                yield _format_sse({"event": "done", "data": response})
+
+        except GeminiUnavailableError as e:
+            yield _format_sse({"event": "error", "data": {"detail": str(e), "retry_after": max(1, round(e.retry_after))}})
+        except Exception as e:
+            logger.error("Erro na análise em streaming do email_id=%d: %s", email_id, str(e))
+            yield _format_sse({"event": "error", "data": {"detail": "Erro ao analisar o e-mail."}})
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/analyze-all")
 def analyze_all_emails(
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """
-    Dispara a análise de todos os e-mails pendentes em background.
+    Coloca na fila a análise de todos os e-mails pendentes; um worker
+    (embutido na API ou `python -m app.worker`) processa em background.
     Retorna imediatamente — use GET /ai/analyze-all/status para acompanhar.
     """
-    # Impede múltiplos jobs simultâneos para o mesmo usuário
-    current_job = _jobs.get(user_id)
-    if current_job and current_job.get("status") == "running":
+    # Impede múltiplos jobs simultâneos para o mesmo usuário (vale entre processos)
+    try:
+        job = enqueue_job(db, user_id)
+    except JobAlreadyActiveError:
         raise HTTPException(
             status_code=409,
             detail="Já existe uma análise em andamento para este usuário.",
         )
 
-    analyzed_ids = db.query(EmailAnalysis.email_id).subquery()
-    pending_count = (
-        db.query(Email)
-        .filter(
-            Email.user_id == user_id,
-            Email.id.notin_(analyzed_ids),
-            Email.body.isnot(None),
-        )
-        .count()
-    )
-
-    if pending_count == 0:
+    if job is None:
         return {"message": "Todos os e-mails já foram analisados.", "pendentes": 0}
 
-    _jobs[user_id] = {"status": "running", "total": pending_count, "done": 0, "errors": 0}
-    background_tasks.add_task(_run_analyze_all, user_id)
-
     return {
         "message": "Análise iniciada em background.",
-        "pendentes": pending_count,
+        "pendentes": job.total,
+        "job_id": job.id,
         "status_url": "/ai/analyze-all/status",
     }
 
 
 @router.get("/analyze-all/status")
 def analyze_all_status(
+    db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """
-    Retorna o progresso do job de análise em background para o usuário autenticado.
+    Retorna o progresso do último job de análise do usuário autenticado.
     """
-    job = _jobs.get(user_id)
+    job = get_latest_job(db, user_id)
     if not job:
         return {"status": "idle", "message": "Nenhum job iniciado ainda."}
 
-    response = {"status": job["status"]}
+    response = {"status": job.status, "job_id": job.id}
+
+    if job.status in ("queued", "running"):
+        response["total"] = job.total
+        response["done"] = job.done
+        response["errors"] = job.errors
+        response["progress_pct"] = round((job.done / job.total) * 100) if job.total > 0 else 0
+
+    elif job.status == "completed":
+        response["total"] = job.total
+        response["done"] = job.done
+        response["errors"] = job.errors
+
+    elif job.status == "failed":
+        response["error"] = job.error or "Erro desconhecido."
+
+    return response
+
+
+@router.post("/stream-token")
+def stream_token(user_id: int = Depends(get_current_user_id)):
+    """
+    Token de curta duração para abrir os streams SSE com ?token= (o EventSource não
+    envia headers). Só vale nas rotas de stream, e só para abrir a conexão.
+    """
+    return {"token": create_stream_token(user_id), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+
+@router.get("/analyze-all/events")
+async def analyze_all_events(
+    request: Request,
+    user_id: int = Depends(get_stream_user_id),
+):
+    """
+    Stream SSE do analyze-all, substituindo o polling de /analyze-all/status:
+    - `progress`: status, total, done e errors do job atual (ao conectar e a cada mudança);
+    - `result`: email_id, categoria e urgência de cada e-mail assim que é gravado.
+    Aceita em ?token= um token de POST /ai/stream-token (EventSource não envia headers)
+    e retoma de Last-Event-ID.
+    """
+    queue = job_events.subscribe(user_id)
+    last_event_id = request.headers.get("last-event-id", "")
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            replayed: set[int] = set()
+            if last_event_id.isdigit():
+                for event in await run_in_threadpool(replay_events, user_id, int(last_event_id)):
+                    replayed.add(event["id"])
+                    yield _format_sse(event)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=_SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"   # mantém proxies abertos e detecta desconexão
+                    continue
+                if event.get("id") in replayed:
+                    continue   # já enviado no replay
+                yield _format_sse(event)
+        finally:
+            job_events.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/threads/{thread_id}/analyze")
+def analyze_thread(
+    thread_id: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Analisa uma conversa inteira: cada mensagem nova vai para a Gemini só com o seu
+    conteúdo novo e o resumo corrente da conversa, em vez do histórico citado.
+    Retorna a análise de cada mensagem e o resumo atualizado da conversa.
+    """
+    try:
+        state, emails, fresh = thread_analysis.analyze_thread(db, user_id, thread_id)
+    except body_hydration.BodyFetchError as e:
+        raise _body_fetch_failed(e)
+    except GeminiUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        )
+    if not emails:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada.")
+    return _thread_response(db, thread_id, state, emails, fresh)
+
+
+@router.get("/threads/{thread_id}")
+def get_thread_analysis(
+    thread_id: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Resumo gravado da conversa e análises das mensagens, sem chamar a Gemini."""
+    emails = thread_analysis.thread_messages(db, user_id, thread_id)
+    if not emails:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada.")
+    state = db.get(ThreadSummary, (user_id, thread_id))
+    return _thread_response(db, thread_id, state, emails, set())
+
+
+@router.get("/limiter/stats")
+def limiter_stats(
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Estado do rate limiter da Gemini: profundidade da fila, tempo de espera
+    e estado do circuit breaker — útil para dimensionar a cota contratada.
+    """
+    return limiter.stats()
 
-    if job["status"] == "running":
-        total = job.get("total", 0)
-        done = job.get("done", 0)
-        response["total"] = total
-        response["done"] = done
-        response["errors"] = job.get("errors", 0)
-        response["progress_pct"] = round((done / total) * 100) if total > 0 else 0
 
-    elif job["status"] == "completed":
-        response["total"] = job.get("total", 0)
-        response["done"] = job.get("done", 0)
-        response["errors"] = job.get("errors", 0)
+@router.get("/cache/stats")
+def cache_stats(
+    user_id: int = Depends(get_current_user_id),
+):
+    """Acertos e falhas do cache de análises por conteúdo (e-mails idênticos)."""
+    return analysis_cache.stats()
 
-    elif job["status"] == "failed":
-        response["error"] = job.get("error", "Erro desconhecido.")
 
-    return response
\ No newline at end of file
+@router.get("/classifier/stats")
+def classifier_stats(
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Pré-classificador local: modelo em uso (precisão na validação, categorias liberadas),
+    chamadas à Gemini evitadas neste processo e análises locais gravadas para o usuário.
+    """
+    counts = dict(
+        db.query(func.coalesce(EmailAnalysis.source, "gemini"), func.count(EmailAnalysis.id))
+        .join(Email, Email.id == EmailAnalysis.email_id)
+        .filter(Email.user_id == user_id)
+        .group_by(func.coalesce(EmailAnalysis.source, "gemini"))
+        .all()
+    )
+    total = sum(counts.values())
+    return {
+        **pre_classifier.stats(),
+        "user_analyses": {
+            "local": counts.get("local", 0),
+            "gemini": counts.get("gemini", 0),
+            "local_share": round(counts.get("local", 0) / total, 3) if total else 0.0,
+        },
+    }
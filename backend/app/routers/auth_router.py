@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 import requests
 
 from app.services.google_auth_service import get_google_auth_flow
+from app.services.gmail_client_manager import client_manager
 from app.core.database import get_db
 from app.core.security import create_access_token, get_current_user_id
 from app.models.user_model import User
@@ -50,6 +51,7 @@ def auth_callback(code: str, db: Session = Depends(get_db)):
     if user:
         user.access_token = credentials.token
         user.refresh_token = credentials.refresh_token or user.refresh_token
+        user.token_expiry = credentials.expiry
         user.name = name
         user.picture = picture
     else:
@@ -60,11 +62,13 @@ def auth_callback(code: str, db: Session = Depends(get_db)):
             google_id=google_id,
             access_token=credentials.token,
             refresh_token=credentials.refresh_token,
+            token_expiry=credentials.expiry,
         )
         db.add(user)
 
     db.commit()
     db.refresh(user)
+    client_manager.invalidate(user.id)
 
     # 4. Gerar JWT próprio da aplicação
     jwt_token = create_access_token(data={"sub": str(user.id), "email": user.email})
@@ -1,74 +1,357 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+import base64
+import json
+import logging
+import threading
+from datetime import date, datetime, timedelta
 
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload, undefer
+from sqlalchemy import or_, and_, tuple_
+
+from app.core.config import BACKFILL_PAGE_SIZE, BACKFILL_STALE_AFTER
+from app.core.database import get_db, SessionLocal
 from app.core.security import get_current_user_id
 from app.models.user_model import User
 from app.models.email_model import Email
 from app.models.email_analysis_model import EmailAnalysis
-from app.services.gmail_service import fetch_emails, send_email
+from app.models.backfill_model import MailboxBackfill
+from app.services.email_store import upsert_emails, apply_read_changes
+from app.services.stats_store import read_stats, read_timeseries, stats_etag
+from app.services import search_index, body_hydration
+from app.services.search_index import SearchUnavailableError
+from app.services.similarity_index import similarity_index
+from app.services.analysis_scheduler import touch_user
+from app.services.gmail_service import iter_mailbox_pages, count_inbox_messages
+from app.services.gmail_async import sync_mailbox_async, send_email_async
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/emails", tags=["Emails"])
 
 
+def _claim_backfill(db: Session, user_id: int) -> bool:
+    """
+    Marca a importação do usuário como "running" de forma atômica.
+    Só consegue se não houver outra em andamento (ou se a anterior parou de dar heartbeat).
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=BACKFILL_STALE_AFTER)
+    claimed = (
+        db.query(MailboxBackfill)
+        .filter(
+            MailboxBackfill.user_id == user_id,
+            or_(
+                MailboxBackfill.status != "running",
+                MailboxBackfill.heartbeat_at.is_(None),
+                MailboxBackfill.heartbeat_at < stale,
+            ),
+        )
+        .update(
+            {"status": "running", "error": None, "heartbeat_at": now},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return claimed == 1
+
+
+def _run_backfill(user_id: int) -> None:
+    """
+    Importa a caixa inteira página por página. Cada página é gravada junto com o
+    checkpoint (page_token + contadores) no mesmo commit, então uma falha ou um restart
+    retoma exatamente da página seguinte à última gravada.
+    """
+    db = SessionLocal()
+    try:
+        state = db.query(MailboxBackfill).filter(MailboxBackfill.user_id == user_id).first()
+        user = db.query(User).filter(User.id == user_id).first()
+
+        if state.total is None:
+            state.total = count_inbox_messages(user.access_token, user.refresh_token, user_id)
+            db.commit()
+
+        pages = iter_mailbox_pages(
+            user.access_token,
+            user.refresh_token,
+            user_id=user_id,
+            page_token=state.page_token,
+            page_size=BACKFILL_PAGE_SIZE,
+        )
+        for emails, next_page_token in pages:
+            state.inserted += len(upsert_emails(db, user_id, emails))
+            state.fetched += len(emails)
+            state.page_token = next_page_token
+            state.heartbeat_at = datetime.utcnow()
+            db.commit()
+            body_hydration.request_prefetch()
+            # Libera os objetos da página para manter o uso de memória constante
+            db.expunge_all()
+            db.add(state)
+
+        state.status = "completed"
+        db.commit()
+        logger.info(
+            "Backfill concluído para user_id=%d: %d mensagens, %d novas.",
+            user_id, state.fetched, state.inserted,
+        )
+
+    except Exception as e:
+        db.rollback()
+        logger.error("Erro no backfill para user_id=%d: %s", user_id, str(e))
+        db.query(MailboxBackfill).filter(MailboxBackfill.user_id == user_id).update(
+            {"status": "failed", "error": str(e)}, synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def resume_interrupted_backfills() -> None:
+    """
+    Chamado na inicialização da API: retoma, a partir do checkpoint,
+    importações que ficaram "running" quando o processo anterior caiu.
+    """
+    db = SessionLocal()
+    try:
+        user_ids = [
+            row.user_id
+            for row in db.query(MailboxBackfill.user_id).filter(MailboxBackfill.status == "running")
+        ]
+        for user_id in user_ids:
+            if _claim_backfill(db, user_id):
+                logger.info("Retomando backfill interrompido para user_id=%d.", user_id)
+                threading.Thread(target=_run_backfill, args=(user_id,), daemon=True).start()
+    finally:
+        db.close()
+
+
+def _load_user_tokens(user_id: int) -> User:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado.")
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _store_sync_result(user_id: int, result: dict) -> tuple[int, int]:
+    """Grava o resultado do sync (e-mails, leituras, historyId) em um commit. Retorna (novos, atualizados)."""
+    db = SessionLocal()
+    try:
+        new_count = len(upsert_emails(db, user_id, result["emails"]))
+        updated_count = apply_read_changes(db, user_id, result["read_changes"])
+        db.query(User).filter(User.id == user_id).update(
+            {"history_id": result["history_id"]}, synchronize_session=False,
+        )
+        db.commit()
+        return new_count, updated_count
+    finally:
+        db.close()
+
+
 @router.post("/sync")
-def sync_emails(
-    db: Session = Depends(get_db),
+async def sync_emails(
     user_id: int = Depends(get_current_user_id),
 ):
-    """Busca os últimos e-mails do Gmail e salva no banco local."""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado.")
+    """
+    Sincroniza o Gmail com o banco local. A primeira chamada busca os últimos e-mails;
+    as seguintes usam o historyId salvo e trazem só mensagens novas ou alteradas.
+    As chamadas ao Gmail são async (gmail_async); só o acesso ao banco usa o pool de threads.
+    """
+    user = await run_in_threadpool(_load_user_tokens, user_id)
 
     try:
-        gmail_emails = fetch_emails(user.access_token, user.refresh_token)
+        result = await sync_mailbox_async(
+            user.access_token,
+            user.refresh_token,
+            user_id=user_id,
+            history_id=user.history_id,
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao buscar e-mails: {str(e)}")
 
-    new_count = 0
-    for email_data in gmail_emails:
-        exists = db.query(Email).filter(Email.gmail_id == email_data["gmail_id"]).first()
-        if not exists:
-            new_email = Email(user_id=user_id, **email_data)
-            db.add(new_email)
-            new_count += 1
+    new_count, updated_count = await run_in_threadpool(_store_sync_result, user_id, result)
+    if new_count:
+        body_hydration.request_prefetch()
+    return {
+        "message": "Sincronização concluída.",
+        "novos_emails": new_count,
+        "atualizados": updated_count,
+        "sincronizacao_completa": result["full_sync"],
+    }
+
+
+@router.post("/backfill")
+def start_backfill(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Importa todo o histórico da INBOX em background, página por página.
+    Se uma importação anterior foi interrompida, continua do último checkpoint.
+    Use GET /emails/backfill/status para acompanhar.
+    """
+    state = db.query(MailboxBackfill).filter(MailboxBackfill.user_id == user_id).first()
+    if state is None:
+        db.add(MailboxBackfill(user_id=user_id, status="pending"))
+        db.commit()
+    elif state.status == "completed":
+        return {"message": "O histórico já foi importado.", "importados": state.inserted}
+
+    if not _claim_backfill(db, user_id):
+        raise HTTPException(
+            status_code=409,
+            detail="Já existe uma importação em andamento para este usuário.",
+        )
+
+    background_tasks.add_task(_run_backfill, user_id)
+    return {
+        "message": "Importação iniciada em background.",
+        "status_url": "/emails/backfill/status",
+    }
 
-    db.commit()
-    return {"message": "Sincronização concluída.", "novos_emails": new_count}
+
+@router.get("/backfill/status")
+def backfill_status(
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Retorna o progresso da importação completa da caixa do usuário autenticado."""
+    state = db.query(MailboxBackfill).filter(MailboxBackfill.user_id == user_id).first()
+    if not state:
+        return {"status": "idle", "message": "Nenhuma importação iniciada ainda."}
+
+    response = {
+        "status": state.status,
+        "total": state.total,
+        "done": state.fetched,
+        "inserted": state.inserted,
+    }
+
+    if state.status == "running":
+        total = state.total or 0
+        response["progress_pct"] = min(100, round((state.fetched / total) * 100)) if total > 0 else 0
+
+    elif state.status == "failed":
+        response["error"] = state.error or "Erro desconhecido."
+
+    return response
 
 
 @router.get("/stats")
 def get_stats(
+    request: Request,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
-    """Retorna contagem de e-mails por categoria e urgência para o dashboard."""
-    by_category = (
-        db.query(EmailAnalysis.category, func.count(EmailAnalysis.id).label("total"))
-        .join(Email, Email.id == EmailAnalysis.email_id)
-        .filter(Email.user_id == user_id)
-        .group_by(EmailAnalysis.category)
-        .all()
-    )
+    """
+    Retorna contagem de e-mails por categoria e urgência para o dashboard.
+    Lê os contadores mantidos incrementalmente (stats_store) e responde 304 quando
+    o If-None-Match bate com o ETag atual.
+    """
+    stats = read_stats(db, user_id)
+    etag = stats_etag(stats)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(stats, headers=headers)
 
-    by_urgency = (
-        db.query(EmailAnalysis.urgency, func.count(EmailAnalysis.id).label("total"))
-        .join(Email, Email.id == EmailAnalysis.email_id)
-        .filter(Email.user_id == user_id)
-        .group_by(EmailAnalysis.urgency)
-        .all()
-    )
 
-    total = db.query(func.count(Email.id)).filter(Email.user_id == user_id).scalar()
-    unread = db.query(func.count(Email.id)).filter(Email.user_id == user_id, Email.is_read == False).scalar()
+_GRANULARITIES = ("day", "week", "month")
 
+
+@router.get("/stats/timeseries")
+def get_stats_timeseries(
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    granularity: str = "day",
+):
+    """
+    Volume de e-mails ao longo do tempo (pela data do e-mail), por categoria e urgência.
+    `from`/`to` no formato AAAA-MM-DD (padrão: últimos 365 dias); `granularity`
+    day, week (semanas começando na segunda) ou month. Lido dos buckets diários
+    mantidos pelo sync e pela análise, sem varrer os e-mails.
+    """
+    if granularity not in _GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity deve ser day, week ou month.")
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=365)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' deve ser anterior a 'to'.")
+
+    return {
+        "from": date_from,
+        "to": date_to,
+        "granularity": granularity,
+        "buckets": read_timeseries(db, user_id, date_from, date_to, granularity),
+    }
+
+
+def _encode_cursor(email: Email) -> str:
+    payload = {"d": email.date.isoformat() if email.date else None, "i": email.id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        date = datetime.fromisoformat(payload["d"]) if payload["d"] else None
+        return date, int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+
+def _keyset_page(query, cursor: str, limit: int) -> list[Email]:
+    """
+    Até `limit` e-mails depois do cursor (vazio = primeira página) na ordem
+    (date DESC, id DESC), com os e-mails sem data no fim em qualquer banco.
+
+    Cada trecho é um range seek em ix_emails_user_date_id: os e-mails com data usam
+    comparação por row value (date, id) < (:date, :id) e, quando eles acabam, a cauda
+    dos sem data é lida numa segunda consulta — um OR entre os dois trechos impediria
+    o uso do índice.
+    """
+    date, email_id = _decode_cursor(cursor) if cursor else (None, None)
+    emails: list[Email] = []
+    if not cursor or date is not None:
+        dated = query.filter(Email.date.isnot(None))
+        if cursor:
+            dated = dated.filter(tuple_(Email.date, Email.id) < tuple_(date, email_id))
+        emails = dated.order_by(Email.date.desc(), Email.id.desc()).limit(limit).all()
+        if len(emails) == limit:
+            return emails
+        email_id = None   # a cauda sem data começa do início
+
+    undated = query.filter(Email.date.is_(None))
+    if email_id is not None:
+        undated = undated.filter(Email.id < email_id)
+    return emails + undated.order_by(Email.id.desc()).limit(limit - len(emails)).all()
+
+
+def _serialize_list_item(e: Email) -> dict:
     return {
-        "total_emails": total,
-        "unread": unread,
-        "by_category": {row.category: row.total for row in by_category},
-        "by_urgency": {row.urgency: row.total for row in by_urgency},
+        "id": e.id,
+        "gmail_id": e.gmail_id,
+        "subject": e.subject,
+        "sender": e.sender,
+        "snippet": e.snippet,
+        "date": e.date,
+        "is_read": e.is_read,
+        "analysis": {
+            "summary": e.analysis.summary,
+            "category": e.analysis.category,
+            "urgency": e.analysis.urgency,
+        } if e.analysis else None,
     }
 
 
@@ -78,35 +361,110 @@ def list_emails(
     user_id: int = Depends(get_current_user_id),
     skip: int = 0,
     limit: int = 20,
+    cursor: str | None = None,
+    category: str | None = None,
+    urgency: str | None = None,
 ):
-    """Retorna lista de e-mails com análise da IA incluída."""
-    emails = (
+    """
+    Retorna lista de e-mails com análise da IA incluída.
+
+    Dois modos de paginação:
+    - offset (padrão): `skip` + `limit`, retorna a lista direto;
+    - keyset: envie `cursor` (vazio na primeira página) e receba
+      {"items": [...], "next_cursor": "..."} — o custo por página é constante,
+      não importa quão fundo se navegue. `next_cursor` é null na última página.
+
+    `category` e `urgency` filtram pela análise da IA.
+    Abrir a inbox marca o usuário como ativo: a fila de análises dá prioridade a ele.
+    """
+    touch_user(user_id)
+
+    # Só colunas de cabeçalho: corpos (deferred) e a resposta sugerida não são lidos
+    query = (
         db.query(Email)
-        .options(joinedload(Email.analysis))
+        .options(
+            joinedload(Email.analysis).load_only(
+                EmailAnalysis.summary, EmailAnalysis.category, EmailAnalysis.urgency,
+            )
+        )
         .filter(Email.user_id == user_id)
-        .order_by(Email.date.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
     )
+    if category:
+        query = query.filter(Email.analysis.has(EmailAnalysis.category == category))
+    if urgency:
+        query = query.filter(Email.analysis.has(EmailAnalysis.urgency == urgency))
 
-    return [
-        {
-            "id": e.id,
-            "gmail_id": e.gmail_id,
-            "subject": e.subject,
-            "sender": e.sender,
-            "snippet": e.snippet,
-            "date": e.date,
-            "is_read": e.is_read,
-            "analysis": {
-                "summary": e.analysis.summary,
-                "category": e.analysis.category,
-                "urgency": e.analysis.urgency,
-            } if e.analysis else None,
-        }
-        for e in emails
-    ]
+    if cursor is None:
+        emails = query.order_by(Email.date.desc()).offset(skip).limit(limit).all()
+        return [_serialize_list_item(e) for e in emails]
+
+    # Busca um a mais para saber se existe próxima página
+    emails = _keyset_page(query, cursor, limit + 1)
+    has_more = len(emails) > limit
+    emails = emails[:limit]
+
+    return {
+        "items": [_serialize_list_item(e) for e in emails],
+        "next_cursor": _encode_cursor(emails[-1]) if has_more else None,
+    }
+
+
+@router.get("/search")
+def search_emails(
+    q: str,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Busca textual em assunto, remetente, corpo e resumo da IA, do resultado mais
+    relevante para o menos. Cada item traz os campos da listagem mais `highlight`
+    (assunto, remetente, trecho do corpo e resumo em HTML escapado, termos em <mark>).
+    `next_offset` é null na última página.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Informe o termo de busca em 'q'.")
+
+    try:
+        hits = search_index.search(db, user_id, q, limit=limit + 1, offset=offset)
+    except SearchUnavailableError:
+        raise HTTPException(status_code=503, detail="Busca textual indisponível neste banco de dados.")
+
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    emails = {
+        e.id: e
+        for e in db.query(Email)
+        .options(
+            joinedload(Email.analysis).load_only(
+                EmailAnalysis.summary, EmailAnalysis.category, EmailAnalysis.urgency,
+            )
+        )
+        .filter(Email.user_id == user_id, Email.id.in_([hit["email_id"] for hit in hits]))
+    }
+
+    items = []
+    for hit in hits:
+        email = emails.get(hit["email_id"])
+        if email is None:
+            continue
+        items.append({
+            **_serialize_list_item(email),
+            "score": hit["score"],
+            "highlight": {
+                "subject": hit["subject"],
+                "sender": hit["sender"],
+                "snippet": hit["snippet"],
+                "summary": hit["summary"],
+            },
+        })
+
+    return {
+        "query": q,
+        "items": items,
+        "next_offset": offset + limit if has_more else None,
+    }
 
 
 @router.get("/{email_id}")
@@ -115,24 +473,38 @@ def get_email(
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
-    """Retorna detalhes completos de um e-mail incluindo corpo e análise da IA."""
+    """
+    Retorna detalhes completos de um e-mail incluindo corpo e análise da IA.
+    Se o e-mail só tiver metadados, o corpo é buscado no Gmail agora; se isso falhar,
+    volta com body nulo e body_loaded false (o frontend mostra o snippet).
+    """
+    touch_user(user_id)
     email = (
         db.query(Email)
-        .options(joinedload(Email.analysis))
+        .options(joinedload(Email.analysis), undefer(Email.body))
         .filter(Email.id == email_id, Email.user_id == user_id)
         .first()
     )
     if not email:
         raise HTTPException(status_code=404, detail="E-mail não encontrado.")
 
+    if email.body_loaded is False:
+        # Sync só de metadados: o corpo é baixado do Gmail na primeira abertura
+        try:
+            body_hydration.hydrate(db, user_id, [email.id])
+        except body_hydration.BodyFetchError as e:
+            logger.warning("Falha ao buscar o corpo do e-mail %d no Gmail: %s", email_id, str(e))
+
     return {
         "id": email.id,
         "gmail_id": email.gmail_id,
+        "thread_id": email.thread_id,
         "subject": email.subject,
         "sender": email.sender,
         "recipient": email.recipient,
         "snippet": email.snippet,
         "body": email.body,
+        "body_loaded": email.body_loaded is not False,
         "date": email.date,
         "is_read": email.is_read,
         "analysis": {
@@ -144,37 +516,89 @@ def get_email(
     }
 
 
-@router.post("/{email_id}/reply")
-def reply_email(
+@router.get("/{email_id}/similar")
+def similar_emails(
     email_id: int,
-    body: dict,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
+    limit: int = Query(10, ge=1, le=50),
+    min_score: float = Query(0.2, ge=0.0, le=1.0),
 ):
     """
-    Envia uma resposta a um e-mail via Gmail API.
-    Body: {"message": "texto da resposta"}
+    E-mails parecidos com este (assunto e corpo), do mais parecido para o menos,
+    pelo índice vetorial local (similarity_index). `min_score` é o cosseno mínimo:
+    valores altos (ex: 0.6) agrupam só mensagens do mesmo assunto.
     """
-    email = db.query(Email).filter(Email.id == email_id, Email.user_id == user_id).first()
+    email = db.query(Email.id).filter(Email.id == email_id, Email.user_id == user_id).first()
     if not email:
         raise HTTPException(status_code=404, detail="E-mail não encontrado.")
 
+    matches = similarity_index.similar(user_id, email_id, limit, min_score)
+    if matches is None:
+        # Ainda fora do índice (ex: preenchimento inicial em andamento): indexa agora
+        row = db.query(Email.subject, Email.clean_body).filter(Email.id == email_id).first()
+        similarity_index.add(user_id, [(email_id, row.subject, row.clean_body)])
+        matches = similarity_index.similar(user_id, email_id, limit, min_score, text=(row.subject, row.clean_body))
+
+    scores = dict(matches)
+    emails = (
+        db.query(Email)
+        .options(
+            joinedload(Email.analysis).load_only(
+                EmailAnalysis.summary, EmailAnalysis.category, EmailAnalysis.urgency,
+            )
+        )
+        .filter(Email.user_id == user_id, Email.id.in_(scores))
+        .all()
+    )
+    emails.sort(key=lambda e: scores[e.id], reverse=True)
+
+    return {
+        "email_id": email_id,
+        "items": [{**_serialize_list_item(e), "score": round(scores[e.id], 4)} for e in emails],
+    }
+
+
+def _load_reply_target(email_id: int, user_id: int) -> tuple[Email, User]:
+    db = SessionLocal()
+    try:
+        email = db.query(Email).filter(Email.id == email_id, Email.user_id == user_id).first()
+        if not email:
+            raise HTTPException(status_code=404, detail="E-mail não encontrado.")
+        user = db.query(User).filter(User.id == user_id).first()
+        db.expunge_all()
+        return email, user
+    finally:
+        db.close()
+
+
+@router.post("/{email_id}/reply")
+async def reply_email(
+    email_id: int,
+    body: dict,
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Envia uma resposta a um e-mail via Gmail API.
+    Body: {"message": "texto da resposta"}
+    """
     message_text = body.get("message")
+    email, user = await run_in_threadpool(_load_reply_target, email_id, user_id)
+
     if not message_text:
         raise HTTPException(status_code=400, detail="Campo 'message' é obrigatório.")
 
-    user = db.query(User).filter(User.id == user_id).first()
-
     try:
-        send_email(
+        await send_email_async(
             access_token=user.access_token,
             refresh_token=user.refresh_token,
             to=email.sender,
             subject=f"Re: {email.subject}",
             body=message_text,
             thread_id=email.thread_id,
+            user_id=user_id,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao enviar e-mail: {str(e)}")
 
-    return {"message": "E-mail enviado com sucesso."}
\ No newline at end of file
+    return {"message": "E-mail enviado com sucesso."}
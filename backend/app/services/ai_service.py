@@ -1,46 +1,102 @@
 import json
-import time
 import logging
+import re
+from typing import Iterator
 
 import google.generativeai as genai
 from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, DeadlineExceeded
 
-from app.core.config import GEMINI_API_KEY
+from app.core.config import (
+    GEMINI_API_KEY,
+    GEMINI_RPM,
+    GEMINI_TPM,
+    GEMINI_RATE_LIMIT_BACKEND,
+    GEMINI_MAX_QUEUE_WAIT,
+    GEMINI_REQUEST_MAX_WAIT,
+    GEMINI_OUTPUT_TOKENS_ESTIMATE,
+    GEMINI_BREAKER_THRESHOLD,
+    GEMINI_BREAKER_COOLDOWN,
+    GEMINI_BREAKER_MODE,
+    AI_BATCH_TOKEN_BUDGET,
+    AI_BATCH_MAX_EMAILS,
+)
+from app.services.rate_limiter import GeminiLimiter, CircuitBreaker, GeminiUnavailableError
 
 logger = logging.getLogger(__name__)
 
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash-lite")
+MODEL_NAME = "gemini-2.5-flash-lite"
+model = genai.GenerativeModel(MODEL_NAME)
+
+# Incrementar sempre que o prompt de análise mudar (invalida o cache de análises)
+PROMPT_VERSION = "1"
+
+# Resultado usado quando a resposta da Gemini não pôde ser interpretada
+FALLBACK_ANALYSIS = {
+    "summary": "Não foi possível analisar este e-mail.",
+    "category": "outro",
+    "urgency": "baixa",
+    "suggested_reply": "",
+}
+
+CATEGORIES = {"trabalho", "financeiro", "pessoal", "marketing", "spam", "suporte", "outro"}
+URGENCIES = {"alta", "média", "baixa"}
 
 # Configurações de retry
 _MAX_RETRIES = 3
 _RETRY_EXCEPTIONS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded)
 _INITIAL_WAIT = 2  # segundos
 
+# Cota e circuit breaker compartilhados por todas as chamadas à Gemini do processo
+limiter = GeminiLimiter(
+    rpm=GEMINI_RPM,
+    tpm=GEMINI_TPM,
+    max_wait=GEMINI_MAX_QUEUE_WAIT,
+    breaker=CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN),
+    request_max_wait=GEMINI_REQUEST_MAX_WAIT,
+    breaker_mode=GEMINI_BREAKER_MODE,
+    backend=GEMINI_RATE_LIMIT_BACKEND,
+)
+
 
-def _call_gemini(prompt: str) -> str:
+def _estimate_tokens(text: str) -> int:
+    """Estimativa grosseira (~4 caracteres por token), suficiente para reservar cota."""
+    return len(text) // 4 + 1
+
+
+def _call_gemini(prompt: str, output_tokens: int = GEMINI_OUTPUT_TOKENS_ESTIMATE) -> str:
     """
-    Chama a Gemini API com retry automático e backoff exponencial.
-    Trata rate limit (429), timeout e indisponibilidade do serviço.
+    Chama a Gemini API respeitando a cota global (RPM/TPM) do limiter, com retry
+    e backoff exponencial. O backoff pausa todas as chamadas do limiter, e não só
+    a thread atual; num rate limit (429) a cota restante também é zerada.
+    Lança GeminiUnavailableError se o circuit breaker estiver aberto ou a fila demorar demais
+    (numa requisição HTTP, mais que GEMINI_REQUEST_MAX_WAIT — inclusive o backoff).
     """
     last_exception = None
+    reserved = _estimate_tokens(prompt) + output_tokens
 
     for attempt in range(1, _MAX_RETRIES + 1):
+        limiter.acquire(reserved)
         try:
             response = model.generate_content(prompt)
+            limiter.breaker.record_success()
+            usage = getattr(response, "usage_metadata", None)
+            limiter.settle(reserved, getattr(usage, "total_token_count", 0) or 0)
             return response.text.strip()
 
         except _RETRY_EXCEPTIONS as e:
             last_exception = e
+            limiter.breaker.record_failure()
             wait = _INITIAL_WAIT * (2 ** (attempt - 1))  # 2s → 4s → 8s
             logger.warning(
                 "Gemini API indisponível (tentativa %d/%d): %s. Aguardando %ds...",
                 attempt, _MAX_RETRIES, type(e).__name__, wait,
             )
-            time.sleep(wait)
+            limiter.penalize(wait, drain=isinstance(e, ResourceExhausted))
 
         except Exception as e:
             # Erros que não devem ser retentados (ex: API key inválida, prompt bloqueado)
+            limiter.breaker.release_probe()
             logger.error("Erro não recuperável na Gemini API: %s", str(e))
             raise
 
@@ -51,14 +107,8 @@ def _call_gemini(prompt: str) -> str:
     raise last_exception
 
 
-def analyze_email(subject: str, body: str) -> dict:
-    """
-    Faz resumo, classificação e sugestão de resposta em uma única chamada à API,
-    reduzindo custo e latência em ~3x comparado a chamadas separadas.
-
-    Retorna: {"summary": "...", "category": "...", "urgency": "...", "suggested_reply": "..."}
-    """
-    prompt = f"""
+def _build_prompt(subject: str, body: str) -> str:
+    return f"""
 Você é um assistente de e-mails profissional. Analise o e-mail abaixo e responda SOMENTE com um JSON válido, sem markdown, sem explicações.
 
 O JSON deve ter exatamente estas chaves:
@@ -71,25 +121,366 @@ ASSUNTO: {subject}
 E-MAIL:
 {body}
 """
-    raw = _call_gemini(prompt)
-    raw = raw.replace("```json", "").replace("```", "").strip()
 
+
+def _build_batch_prompt(emails: list[dict]) -> str:
+    """Um único prompt com vários e-mails; as instruções fixas são pagas uma vez só."""
+    blocks = "\n".join(
+        f"""
+=== E-MAIL id={email["id"]} ===
+ASSUNTO: {email["subject"]}
+{email["body"]}
+"""
+        for email in emails
+    )
+    return f"""
+Você é um assistente de e-mails profissional. Analise CADA um dos e-mails abaixo e responda SOMENTE com um array JSON válido, sem markdown, sem explicações — um objeto por e-mail.
+
+Cada objeto deve ter exatamente estas chaves:
+- "id": o id do e-mail, exatamente como aparece no cabeçalho "=== E-MAIL id=... ==="
+- "summary": resumo em no máximo 3 frases em português, direto e objetivo
+- "category": uma das opções — trabalho, financeiro, pessoal, marketing, spam, suporte, outro
+- "urgency": uma das opções — alta, média, baixa
+- "suggested_reply": rascunho de resposta profissional em português, apenas o corpo (sem assunto)
+{blocks}"""
+
+
+def _build_thread_prompt(subject: str, thread_summary: str, messages: list[dict], summary_words: int) -> str:
+    """Resumo corrente da conversa + só o conteúdo novo de cada mensagem, em ordem cronológica."""
+    blocks = "\n".join(
+        f"""
+=== MENSAGEM id={message["id"]} ===
+DE: {message["sender"]}
+{message["body"] or "(sem conteúdo novo)"}
+"""
+        for message in messages
+    )
+    return f"""
+Você é um assistente de e-mails profissional. Abaixo estão o resumo de uma conversa por e-mail até aqui e as mensagens novas dela, em ordem cronológica — de cada mensagem vem só o conteúdo novo, sem o histórico citado. Responda SOMENTE com um objeto JSON válido, sem markdown, sem explicações.
+
+O objeto deve ter exatamente estas chaves:
+- "thread_summary": resumo atualizado da conversa inteira (resumo anterior + mensagens novas) em português, com no máximo {summary_words} palavras; mantenha decisões, pendências, prazos e de quem é a vez de responder
+- "messages": array com um objeto por mensagem nova, cada um com exatamente estas chaves:
+  - "id": o id da mensagem, exatamente como aparece no cabeçalho "=== MENSAGEM id=... ==="
+  - "summary": resumo da mensagem em no máximo 3 frases em português, no contexto da conversa
+  - "category": uma das opções — trabalho, financeiro, pessoal, marketing, spam, suporte, outro
+  - "urgency": uma das opções — alta, média, baixa
+  - "suggested_reply": rascunho de resposta profissional em português a essa mensagem, considerando a conversa, apenas o corpo (sem assunto)
+
+ASSUNTO DA CONVERSA: {subject}
+
+RESUMO DA CONVERSA ATÉ AQUI:
+{thread_summary or "(início da conversa)"}
+{blocks}"""
+
+
+def _strip_fences(raw: str) -> str:
+    return raw.replace("```json", "").replace("```", "").strip()
+
+
+def _validate_item(item) -> dict | None:
+    """Valida um objeto de análise vindo do modo batch; None se estiver incompleto ou fora do padrão."""
+    if not isinstance(item, dict):
+        return None
+    summary = item.get("summary")
+    reply = item.get("suggested_reply")
+    if not isinstance(summary, str) or not summary.strip() or not isinstance(reply, str):
+        return None
+    if item.get("category") not in CATEGORIES or item.get("urgency") not in URGENCIES:
+        return None
+    return {
+        "summary": summary,
+        "category": item["category"],
+        "urgency": item["urgency"],
+        "suggested_reply": reply,
+    }
+
+
+def _parse_single(raw: str) -> dict:
     try:
-        result = json.loads(raw)
+        result = json.loads(_strip_fences(raw))
         return {
             "summary": result.get("summary", "Não foi possível gerar um resumo."),
             "category": result.get("category", "outro"),
             "urgency": result.get("urgency", "baixa"),
             "suggested_reply": result.get("suggested_reply", ""),
         }
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, AttributeError):
         logger.error("Resposta da Gemini não é JSON válido: %s", raw)
-        return {
-            "summary": "Não foi possível analisar este e-mail.",
-            "category": "outro",
-            "urgency": "baixa",
-            "suggested_reply": "",
-        }
+        return dict(FALLBACK_ANALYSIS)
+
+
+def analyze_email(subject: str, body: str) -> dict:
+    """
+    Faz resumo, classificação e sugestão de resposta em uma única chamada à API,
+    reduzindo custo e latência em ~3x comparado a chamadas separadas.
+
+    Retorna: {"summary": "...", "category": "...", "urgency": "...", "suggested_reply": "..."}
+    """
+    return _parse_single(_call_gemini(_build_prompt(subject, body)))
+
+
+def _stream_gemini(prompt: str, output_tokens: int = GEMINI_OUTPUT_TOKENS_ESTIMATE) -> Iterator[str]:
+    """
+    Versão em streaming de _call_gemini: gera os pedaços de texto conforme chegam.
+    Mesma cota, breaker e backoff; só retenta se a falha vier antes do primeiro pedaço
+    (depois disso o cliente já recebeu parte da resposta).
+    """
+    last_exception = None
+    reserved = _estimate_tokens(prompt) + output_tokens
+
+    for attempt in range(1, _MAX_RETRIES + 1):
+        limiter.acquire(reserved)
+        started = False
+        try:
+            response = model.generate_content(prompt, stream=True)
+            for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    started = True
+                    yield text
+            limiter.breaker.record_success()
+            usage = getattr(response, "usage_metadata", None)
+            limiter.settle(reserved, getattr(usage, "total_token_count", 0) or 0)
+            return
+
+        except _RETRY_EXCEPTIONS as e:
+            last_exception = e
+            limiter.breaker.record_failure()
+            if started:
+                raise
+            wait = _INITIAL_WAIT * (2 ** (attempt - 1))  # 2s → 4s → 8s
+            logger.warning(
+                "Gemini API indisponível (tentativa %d/%d): %s. Aguardando %ds...",
+                attempt, _MAX_RETRIES, type(e).__name__, wait,
+            )
+            limiter.penalize(wait, drain=isinstance(e, ResourceExhausted))
+
+        except Exception as e:
+            limiter.breaker.release_probe()
+            logger.error("Erro não recuperável na Gemini API: %s", str(e))
+            raise
+
+    logger.error(
+        "Gemini API falhou após %d tentativas. Último erro: %s",
+        _MAX_RETRIES, str(last_exception),
+    )
+    raise last_exception
+
+
+def _scan_json_string(text: str, start: int) -> tuple[int | None, int]:
+    """
+    Percorre o conteúdo de uma string JSON a partir de start (logo após a aspa de abertura).
+    Retorna (posição da aspa de fechamento ou None, fim do trecho seguro para decodificar —
+    sem escape cortado pela metade).
+    """
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            size = 6 if text[i + 1:i + 2] == "u" else 2
+            if i + size > len(text):
+                return None, i
+            i += size
+        elif char == '"':
+            return i, i
+        else:
+            i += 1
+    return None, i
+
+
+def _decode(content: str) -> str:
+    # strict=False: o modelo às vezes põe quebras de linha cruas dentro das strings
+    return json.loads(f'"{content}"', strict=False)
+
+
+class _AnalysisStreamParser:
+    """
+    Lê o JSON da análise conforme ele chega: avisa cada campo curto (summary,
+    category, urgency) assim que a string fecha e repassa o suggested_reply em deltas.
+    """
+    _SHORT_FIELDS = ("summary", "category", "urgency")
+
+    def __init__(self):
+        self.text = ""
+        self._sent_fields: set[str] = set()
+        self._reply_sent = 0
+
+    def _value_start(self, field: str) -> int | None:
+        match = re.search(rf'"{field}"\s*:\s*"', self.text)
+        return match.end() if match else None
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.text += chunk
+        events = []
+        for field in self._SHORT_FIELDS:
+            if field in self._sent_fields:
+                continue
+            start = self._value_start(field)
+            if start is None:
+                continue
+            end, _ = _scan_json_string(self.text, start)
+            if end is not None:
+                self._sent_fields.add(field)
+                events.append({"event": "field", "name": field, "value": _decode(self.text[start:end])})
+
+        start = self._value_start("suggested_reply")
+        if start is not None:
+            end, safe = _scan_json_string(self.text, start)
+            decoded = _decode(self.text[start:end if end is not None else safe])
+            if len(decoded) > self._reply_sent:
+                events.append({"event": "reply", "delta": decoded[self._reply_sent:]})
+                self._reply_sent = len(decoded)
+        return events
+
+
+def analyze_email_stream(subject: str, body: str) -> Iterator[dict]:
+    """
+    analyze_email em streaming. Gera, na ordem em que ficam prontos:
+    {"event": "field", "name": "summary"|"category"|"urgency", "value": ...},
+    {"event": "reply", "delta": "..."} (pedaços do suggested_reply) e, no fim,
+    {"event": "done", "result": {...}} com a análise completa validada como em analyze_email.
+    """
+    parser = _AnalysisStreamParser()
+    for chunk in _stream_gemini(_build_prompt(subject, body)):
+        yield from parser.feed(chunk)
+    yield {"event": "done", "result": _parse_single(parser.text)}
+
+
+def pack_batches(
+    emails: list[dict],
+    token_budget: int = AI_BATCH_TOKEN_BUDGET,
+    max_emails: int = AI_BATCH_MAX_EMAILS,
+) -> list[list[dict]]:
+    """
+    Agrupa os e-mails em lotes cujo prompt cabe em token_budget tokens de entrada
+    e com no máximo max_emails e-mails (limita o tamanho da resposta).
+    Um e-mail maior que o orçamento sozinho vai num lote próprio.
+    """
+    batches: list[list[dict]] = []
+    current: list[dict] = []
+    used = 0
+
+    for email in emails:
+        cost = _estimate_tokens(email["subject"] + email["body"]) + 20  # + cabeçalho do bloco
+        if current and (used + cost > token_budget or len(current) >= max_emails):
+            batches.append(current)
+            current, used = [], 0
+        current.append(email)
+        used += cost
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def analyze_emails_batch(emails: list[dict]) -> dict:
+    """
+    Analisa vários e-mails empacotando-os em poucos prompts (ver pack_batches).
+    Recebe [{"id": ..., "subject": "...", "body": "..."}] e retorna {id: análise}.
+
+    No prompt cada e-mail leva só o número de ordem no lote (1..n), mapeado de volta
+    para o id aqui. Cada item da resposta é validado; e-mails que faltarem na resposta
+    (ou vierem inválidos) são reanalisados individualmente com analyze_email.
+    Se a Gemini ficar indisponível no meio (GeminiUnavailableError), retorna o que já
+    foi analisado — os e-mails que faltarem ficam fora do resultado; só relança o erro
+    se nenhum e-mail foi analisado.
+    """
+    results: dict = {}
+    unavailable: GeminiUnavailableError | None = None
+
+    def analyze_alone(email: dict) -> None:
+        nonlocal unavailable
+        try:
+            results[email["id"]] = analyze_email(email["subject"], email["body"])
+        except GeminiUnavailableError as e:
+            unavailable = e
+
+    for batch in pack_batches(emails):
+        if len(batch) == 1:
+            analyze_alone(batch[0])
+            continue
+
+        by_ordinal = {str(ordinal): email for ordinal, email in enumerate(batch, start=1)}
+        try:
+            raw = _strip_fences(_call_gemini(
+                _build_batch_prompt([{**email, "id": ordinal} for ordinal, email in by_ordinal.items()]),
+                output_tokens=GEMINI_OUTPUT_TOKENS_ESTIMATE * len(batch),
+            ))
+        except GeminiUnavailableError as e:
+            unavailable = e
+            continue
+
+        try:
+            items = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.error("Resposta em lote da Gemini não é JSON válido: %s", raw[:500])
+            items = []
+
+        for item in items if isinstance(items, list) else []:
+            ordinal = str(item.get("id")) if isinstance(item, dict) else None
+            analysis = _validate_item(item)
+            if ordinal in by_ordinal and analysis is not None:
+                results[by_ordinal.pop(ordinal)["id"]] = analysis
+
+        if by_ordinal:
+            logger.warning("%d e-mail(s) ausentes na resposta em lote; analisando individualmente.", len(by_ordinal))
+        for email in by_ordinal.values():
+            analyze_alone(email)
+
+    if unavailable is not None:
+        if not results:
+            raise unavailable
+        logger.warning(
+            "Gemini indisponível no meio do lote: %d de %d e-mail(s) analisados.", len(results), len(emails),
+        )
+    return results
+
+
+def analyze_thread_messages(
+    subject: str, thread_summary: str, messages: list[dict], summary_tokens: int,
+) -> tuple[dict, str | None]:
+    """
+    Analisa mensagens novas de uma conversa numa única chamada, com o resumo corrente
+    no lugar do histórico. Recebe [{"id": ..., "sender": "...", "body": conteúdo novo}]
+    e retorna ({id: análise}, resumo atualizado — None se não veio na resposta).
+
+    Como em analyze_emails_batch, mensagens ausentes ou inválidas na resposta são
+    reanalisadas individualmente com analyze_email.
+    """
+    raw = _strip_fences(_call_gemini(
+        _build_thread_prompt(subject, thread_summary, messages, summary_words=max(30, summary_tokens * 2 // 3)),
+        output_tokens=GEMINI_OUTPUT_TOKENS_ESTIMATE * len(messages) + summary_tokens,
+    ))
+
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        logger.error("Resposta da Gemini para a conversa não é JSON válido: %s", raw[:500])
+        parsed = {}
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    by_id = {str(message["id"]): message for message in messages}
+    results: dict = {}
+    items = parsed.get("messages")
+    for item in items if isinstance(items, list) else []:
+        message = by_id.get(str(item.get("id"))) if isinstance(item, dict) else None
+        analysis = _validate_item(item)
+        if message is not None and analysis is not None:
+            results[message["id"]] = analysis
+            del by_id[str(message["id"])]
+
+    if by_id:
+        logger.warning("%d mensagem(ns) ausentes na resposta da conversa; analisando individualmente.", len(by_id))
+    for message in by_id.values():
+        results[message["id"]] = analyze_email(subject, message["body"])
+
+    summary = parsed.get("thread_summary")
+    if not isinstance(summary, str) or not summary.strip():
+        logger.warning("Resposta da Gemini sem resumo da conversa; mantendo o anterior.")
+        summary = None
+    return results, summary
 
 
 # Mantém as funções individuais como wrappers para não quebrar
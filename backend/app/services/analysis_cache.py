@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import ANALYSIS_CACHE_MAX_ENTRIES
+from app.core.database import SessionLocal
+from app.models.analysis_cache_model import AnalysisCacheEntry
+from app.services.ai_service import (
+    analyze_email,
+    analyze_email_stream,
+    analyze_emails_batch,
+    MODEL_NAME,
+    PROMPT_VERSION,
+    FALLBACK_ANALYSIS,
+)
+from app.services.pre_classifier import pre_classifier
+
+logger = logging.getLogger(__name__)
+
+# A evicção conta as linhas da tabela, então só roda a cada N gravações
+_EVICT_EVERY = 50
+# Acertos (hits, last_used_at) ficam em memória e vão para o banco num UPDATE só a cada
+# N segundos, para a leitura do cache não virar uma transação de escrita por e-mail
+_TOUCH_FLUSH_EVERY = 60
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def content_hash(subject: str, body: str) -> str:
+    """Chave do cache: conteúdo normalizado + modelo + versão do prompt."""
+    key = "\x00".join([MODEL_NAME, PROMPT_VERSION, _normalize(subject), _normalize(body)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Cache de análises endereçado por conteúdo, guardado na tabela analysis_cache.
+    Newsletters e notificações idênticas (entre usuários e entre dias) pagam uma só
+    chamada à Gemini. Limitado a ANALYSIS_CACHE_MAX_ENTRIES linhas, com evicção LRU.
+    Usa sessões próprias para poder ser chamado das threads do analyze-all.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._puts = 0
+        self._touched: dict[str, int] = {}
+        self._last_flush = time.monotonic()
+
+    def get(self, key: str) -> dict | None:
+        db = SessionLocal()
+        try:
+            entry = db.get(AnalysisCacheEntry, key)
+            if entry is None:
+                with self._lock:
+                    self._misses += 1
+                return None
+
+            result = {
+                "summary": entry.summary,
+                "category": entry.category,
+                "urgency": entry.urgency,
+                "suggested_reply": entry.suggested_reply,
+            }
+            with self._lock:
+                self._hits += 1
+                self._touched[key] = self._touched.get(key, 0) + 1
+                due = time.monotonic() - self._last_flush >= _TOUCH_FLUSH_EVERY
+            if due:
+                db.rollback()
+                self.flush_touches(db)
+            return result
+        finally:
+            db.close()
+
+    def flush_touches(self, db) -> None:
+        """Grava os acertos acumulados (hits e last_used_at) num único UPDATE em lote. Faz commit."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if not touched:
+            return
+        table = AnalysisCacheEntry.__table__
+        stmt = (
+            table.update()
+            .where(table.c.content_hash == bindparam("b_key"))
+            .values(hits=table.c.hits + bindparam("b_hits"), last_used_at=datetime.utcnow())
+        )
+        try:
+            db.execute(stmt, [{"b_key": key, "b_hits": hits} for key, hits in touched.items()])
+            db.commit()
+        except Exception as e:
+            # Só afeta a ordem da evicção: os acertos voltam para a próxima tentativa
+            db.rollback()
+            with self._lock:
+                for key, hits in touched.items():
+                    self._touched[key] = self._touched.get(key, 0) + hits
+            logger.warning("Cache de análises: falha ao gravar acertos: %s", str(e))
+
+    def put(self, key: str, result: dict) -> None:
+        db = SessionLocal()
+        try:
+            db.add(AnalysisCacheEntry(
+                content_hash=key,
+                summary=result["summary"],
+                category=result["category"],
+                urgency=result["urgency"],
+                suggested_reply=result["suggested_reply"],
+                last_used_at=datetime.utcnow(),
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Outra thread/processo gravou o mesmo conteúdo primeiro
+                db.rollback()
+                return
+
+            with self._lock:
+                self._puts += 1
+                should_evict = self._puts % _EVICT_EVERY == 0
+            if should_evict:
+                self._evict(db)
+        finally:
+            db.close()
+
+    def _evict(self, db) -> None:
+        """Remove as entradas usadas há mais tempo até voltar ao limite."""
+        # last_used_at precisa estar em dia antes de escolher as mais antigas
+        self.flush_touches(db)
+        excess = db.query(AnalysisCacheEntry).count() - self.max_entries
+        if excess <= 0:
+            return
+        oldest = (
+            db.query(AnalysisCacheEntry.content_hash)
+            .order_by(AnalysisCacheEntry.last_used_at.asc())
+            .limit(excess)
+            .subquery()
+        )
+        removed = (
+            db.query(AnalysisCacheEntry)
+            .filter(AnalysisCacheEntry.content_hash.in_(oldest))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        with self._lock:
+            self._evicted += removed
+        logger.info("Cache de análises: %d entradas removidas (LRU).", removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evicted": self._evicted,
+                "max_entries": self.max_entries,
+            }
+
+
+analysis_cache = AnalysisCache()
+
+
+def analyze_email_cached(subject: str, body: str) -> tuple[dict, bool]:
+    """
+    analyze_email com o cache de conteúdo e o pré-classificador local na frente.
+    Retorna (resultado, veio_do_cache). Respostas inválidas da Gemini não são cacheadas,
+    nem as decididas localmente (result["source"] == "local").
+    """
+    key = content_hash(subject, body)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    local = pre_classifier.classify(subject, body)
+    if local is not None:
+        return local, False
+
+    result = analyze_email(subject, body)
+    if result != FALLBACK_ANALYSIS:
+        analysis_cache.put(key, result)
+    return result, False
+
+
+def result_events(result: dict) -> list[dict]:
+    """Uma análise pronta no mesmo formato de eventos de analyze_email_stream."""
+    return [
+        {"event": "field", "name": "summary", "value": result["summary"]},
+        {"event": "field", "name": "category", "value": result["category"]},
+        {"event": "field", "name": "urgency", "value": result["urgency"]},
+        {"event": "reply", "delta": result["suggested_reply"]},
+    ]
+
+
+def analyze_email_stream_cached(subject: str, body: str):
+    """
+    analyze_email_stream com o cache de conteúdo na frente. Num acerto, gera a análise
+    guardada de uma vez. O evento final "done" traz também "cached".
+    """
+    key = content_hash(subject, body)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        yield from result_events(cached)
+        yield {"event": "done", "result": cached, "cached": True}
+        return
+
+    local = pre_classifier.classify(subject, body)
+    if local is not None:
+        yield from result_events(local)
+        yield {"event": "done", "result": local, "cached": False}
+        return
+
+    for event in analyze_email_stream(subject, body):
+        if event["event"] == "done":
+            if event["result"] != FALLBACK_ANALYSIS:
+                analysis_cache.put(key, event["result"])
+            event = {**event, "cached": False}
+        yield event
+
+
+def analyze_emails_batch_cached(emails: list[dict]) -> dict:
+    """
+    analyze_emails_batch com o cache de conteúdo e o pré-classificador na frente: só os
+    e-mails sem análise em cache e que o modelo local não resolve vão para a Gemini.
+    Recebe [{"id", "subject", "body"}], retorna {id: análise} — parcial se a Gemini
+    ficar indisponível no meio (ver analyze_emails_batch).
+    """
+    results: dict = {}
+    misses: list[dict] = []
+    keys: dict = {}
+
+    for email in emails:
+        key = content_hash(email["subject"], email["body"])
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            results[email["id"]] = cached
+            continue
+        local = pre_classifier.classify(email["subject"], email["body"])
+        if local is not None:
+            results[email["id"]] = local
+        else:
+            keys[email["id"]] = key
+            misses.append(email)
+
+    if misses:
+        for email_id, result in analyze_emails_batch(misses).items():
+            results[email_id] = result
+            if result != FALLBACK_ANALYSIS:
+                analysis_cache.put(keys[email_id], result)
+
+    return results
@@ -0,0 +1,615 @@
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, and_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    AI_MAX_CONCURRENCY,
+    AI_COMMIT_BATCH_SIZE,
+    ANALYSIS_JOB_SLICE,
+    ANALYSIS_JOB_LEASE_SECONDS,
+    ANALYSIS_WORKER_POLL_INTERVAL,
+    ANALYSIS_JOB_MAX_ATTEMPTS,
+)
+from app.core.database import SessionLocal
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+from app.models.analysis_job_model import AnalysisJob
+from app.models.analysis_job_item_model import AnalysisJobItem
+from app.models.analysis_event_model import AnalysisEvent
+from app.services.ai_service import limiter, pack_batches
+from app.services.email_preprocessing import clean_email_body
+from app.services.analysis_cache import analyze_emails_batch_cached, content_hash
+from app.services import stats_store, search_index, analysis_scheduler, body_hydration
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobAlreadyActiveError(Exception):
+    """O usuário já tem um job na fila ou rodando."""
+
+
+class _LeaseLost(Exception):
+    """Outro worker assumiu o job (o lease deste expirou)."""
+
+
+class _Interrupted(Exception):
+    """O worker está sendo desligado; o job volta para a fila."""
+
+
+def _pending_filters(user_id: int, max_email_id: int | None) -> list:
+    """
+    E-mails do usuário com corpo (ou só com metadados, cujo corpo o worker baixa)
+    e ainda sem análise (até max_email_id, se informado).
+    """
+    filters = [
+        Email.user_id == user_id,
+        Email.id.notin_(select(EmailAnalysis.email_id)),
+        or_(Email.body.isnot(None), Email.body_loaded.is_(False)),
+    ]
+    if max_email_id is not None:
+        filters.append(Email.id <= max_email_id)
+    return filters
+
+
+# ── API (enfileirar e consultar) ──────────────────────────────────────────────
+
+def get_latest_job(db: Session, user_id: int) -> AnalysisJob | None:
+    return (
+        db.query(AnalysisJob)
+        .filter(AnalysisJob.user_id == user_id)
+        .order_by(AnalysisJob.id.desc())
+        .first()
+    )
+
+
+def enqueue_job(db: Session, user_id: int) -> AnalysisJob | None:
+    """
+    Coloca um analyze-all na fila para os e-mails pendentes do usuário.
+    Retorna None se não há nada pendente; levanta JobAlreadyActiveError se já existe
+    um job ativo (garantido pelo índice único parcial, mesmo entre processos).
+    """
+    active = (
+        db.query(AnalysisJob.id)
+        .filter(AnalysisJob.user_id == user_id, AnalysisJob.status.in_(ACTIVE_STATUSES))
+        .first()
+    )
+    if active:
+        raise JobAlreadyActiveError()
+
+    max_email_id = db.query(func.max(Email.id)).filter(Email.user_id == user_id).scalar()
+    total = db.query(func.count(Email.id)).filter(*_pending_filters(user_id, max_email_id)).scalar()
+    if not total:
+        return None
+
+    job = AnalysisJob(
+        user_id=user_id, status="queued", max_email_id=max_email_id, total=total,
+        vtime=analysis_scheduler.initial_vtime(db),
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise JobAlreadyActiveError()
+    db.refresh(job)
+    return job
+
+
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+def claim_next_job(db: Session, worker_id: str) -> int | None:
+    """
+    Reivindica o job de menor tempo virtual (fair-share, ver analysis_scheduler) entre
+    os da fila, os "running" entre duas fatias (sem dono) e os "running" cujo lease
+    expirou (worker caiu), exceto os em backoff (not_before no futuro). O UPDATE
+    condicional garante que só um worker ganha cada job. Retorna o id ou None.
+    """
+    now = datetime.utcnow()
+    claimable = and_(
+        or_(
+            AnalysisJob.status == "queued",
+            and_(
+                AnalysisJob.status == "running",
+                or_(AnalysisJob.worker_id.is_(None), AnalysisJob.lease_expires_at < now),
+            ),
+        ),
+        or_(AnalysisJob.not_before.is_(None), AnalysisJob.not_before <= now),
+    )
+    candidates = [
+        row.id for row in
+        db.query(AnalysisJob.id)
+        .filter(claimable)
+        .order_by(func.coalesce(AnalysisJob.vtime, 0.0), AnalysisJob.id)
+        .limit(10)
+    ]
+    for job_id in candidates:
+        claimed = (
+            db.query(AnalysisJob)
+            .filter(AnalysisJob.id == job_id, claimable)
+            .update(
+                {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=ANALYSIS_JOB_LEASE_SECONDS),
+                    "heartbeat_at": now,
+                    "started_at": func.coalesce(AnalysisJob.started_at, now),
+                    "attempts": AnalysisJob.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return job_id
+    return None
+
+
+def _fenced(db: Session, job_id: int, worker_id: str):
+    """Query do job restrita ao dono do lease — updates de um worker que perdeu o job não pegam."""
+    return db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.worker_id == worker_id)
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renova o lease do job periodicamente enquanto o worker processa."""
+
+    def __init__(self, job_id: int, worker_id: str):
+        super().__init__(daemon=True, name=f"lease-job-{job_id}")
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lost = threading.Event()
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopping.wait(ANALYSIS_JOB_LEASE_SECONDS / 3):
+            db = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                renewed = _fenced(db, self.job_id, self.worker_id).update(
+                    {
+                        "lease_expires_at": now + timedelta(seconds=ANALYSIS_JOB_LEASE_SECONDS),
+                        "heartbeat_at": now,
+                    },
+                    synchronize_session=False,
+                )
+                db.commit()
+                if not renewed:
+                    self.lost.set()
+                    return
+            except Exception as e:
+                db.rollback()
+                logger.warning("Falha ao renovar o lease do job %d: %s", self.job_id, str(e))
+            finally:
+                db.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+def _record_failures(db: Session, job_id: int, worker_id: str, failed: list[int], email_ids: list[int]) -> None:
+    """
+    Soma e-mails ao contador de erros e à lista dos que não voltam a ser tentados
+    neste job (senão cada fatia escolheria de novo os mesmos). Não faz commit.
+    """
+    failed.extend(email_ids)
+    updated = _fenced(db, job_id, worker_id).update(
+        {"errors": AnalysisJob.errors + len(email_ids), "failed_email_ids": json.dumps(failed)},
+        synchronize_session=False,
+    )
+    if not updated:
+        raise _LeaseLost()
+
+
+def _consume_items(db: Session, job_id: int, positions: list[int]) -> None:
+    """
+    Apaga da ordem do job as posições já contadas em done, na mesma transação que o
+    contador: uma fatia refeita depois de um crash não as conta de novo. Não faz commit.
+    """
+    if positions:
+        db.query(AnalysisJobItem).filter(
+            AnalysisJobItem.job_id == job_id, AnalysisJobItem.position.in_(positions),
+        ).delete(synchronize_session=False)
+
+
+def _save_analyses(
+    db: Session,
+    job: AnalysisJob,
+    worker_id: str,
+    results: list[tuple[int, dict]],
+    failed: list[int],
+    positions: dict[int, int],
+) -> None:
+    """
+    Grava um lote de análises, os eventos para os streams SSE e o progresso do job
+    (done, e as posições consumidas da ordem do job; positions: email_id -> posição) em
+    um único commit, então depois de um crash o contador bate exatamente
+    com o que foi salvo. Se o lote falhar
+    (ex: o e-mail foi analisado por outra requisição nesse meio tempo), regrava um a um
+    para que só as linhas problemáticas contem como erro.
+    """
+    if not results:
+        return
+
+    def to_model(email_id: int, result: dict) -> EmailAnalysis:
+        return EmailAnalysis(
+            email_id=email_id,
+            summary=result["summary"],
+            category=result["category"],
+            urgency=result["urgency"],
+            suggested_reply=result["suggested_reply"],
+            source=result.get("source", "gemini"),
+        )
+
+    def to_event(email_id: int, result: dict) -> AnalysisEvent:
+        return AnalysisEvent(
+            user_id=job.user_id,
+            job_id=job.id,
+            email_id=email_id,
+            category=result["category"],
+            urgency=result["urgency"],
+        )
+
+    def add_progress(done: int) -> None:
+        updated = _fenced(db, job.id, worker_id).update(
+            {"done": AnalysisJob.done + done}, synchronize_session=False,
+        )
+        if not updated:
+            raise _LeaseLost()
+
+    # Datas dos e-mails para os buckets diários do dashboard
+    dates = dict(db.query(Email.id, Email.date).filter(Email.id.in_([email_id for email_id, _ in results])).all())
+
+    try:
+        db.add_all([to_model(email_id, result) for email_id, result in results])
+        db.add_all([to_event(email_id, result) for email_id, result in results])
+        stats_store.record_analyses(db, job.user_id, [(dates.get(email_id), result) for email_id, result in results])
+        search_index.index_summaries(db, [(email_id, result["summary"]) for email_id, result in results])
+        add_progress(done=len(results))
+        _consume_items(db, job.id, [positions[email_id] for email_id, _ in results])
+        db.commit()
+        return
+    except _LeaseLost:
+        db.rollback()
+        raise
+    except Exception:
+        db.rollback()
+
+    for email_id, result in results:
+        try:
+            db.add(to_model(email_id, result))
+            db.flush()
+            db.add(to_event(email_id, result))
+            stats_store.record_analyses(db, job.user_id, [(dates.get(email_id), result)])
+            search_index.index_summaries(db, [(email_id, result["summary"])])
+            add_progress(done=1)
+            _consume_items(db, job.id, [positions[email_id]])
+            db.commit()
+        except _LeaseLost:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            _record_failures(db, job.id, worker_id, failed, [email_id])
+            db.commit()
+            logger.error("Falha ao salvar análise do email_id=%d (user_id=%d): %s", email_id, job.user_id, str(e))
+
+
+# E-mail pendente de análise, só com o que o prompt precisa
+_PendingEmail = namedtuple("_PendingEmail", ["id", "subject", "clean_body"])
+
+
+def _with_clean_bodies(db: Session, rows: list) -> list[_PendingEmail]:
+    """
+    Garante o clean_body de cada linha (id, subject, body, clean_body), calculando e
+    gravando os que faltam — e-mails sincronizados antes do pré-processamento existir.
+    """
+    missing = [
+        {"id": row.id, "clean_body": clean_email_body(row.body)}
+        for row in rows if row.clean_body is None
+    ]
+    if missing:
+        db.bulk_update_mappings(Email, missing)
+        db.commit()
+
+    cleaned = {item["id"]: item["clean_body"] for item in missing}
+    return [_PendingEmail(row.id, row.subject, cleaned.get(row.id, row.clean_body)) for row in rows]
+
+
+# Linhas por INSERT ao gravar a ordem de prioridade do job
+_PLAN_CHUNK = 1000
+
+
+def _plan_job(db: Session, job: AnalysisJob, worker_id: str) -> None:
+    """
+    Calcula uma única vez a ordem de prioridade dos e-mails pendentes do job
+    (analysis_scheduler.next_slice) e grava em analysis_job_items; as fatias seguintes
+    só leem as próximas posições. Faz commit.
+    """
+    candidates = db.query(
+        Email.id, Email.subject, Email.sender, Email.snippet, Email.date, Email.is_read,
+    ).filter(*_pending_filters(job.user_id, job.max_email_id)).all()
+    order = analysis_scheduler.next_slice(candidates, len(candidates))
+    for start in range(0, len(order), _PLAN_CHUNK):
+        db.bulk_insert_mappings(AnalysisJobItem, [
+            {"job_id": job.id, "position": position, "email_id": email_id}
+            for position, email_id in enumerate(order[start:start + _PLAN_CHUNK], start=start)
+        ])
+    if not _fenced(db, job.id, worker_id).update({"next_position": 0}, synchronize_session=False):
+        raise _LeaseLost()
+    db.commit()
+    job.next_position = 0
+
+
+def _finish(db: Session, job_id: int, worker_id: str, values: dict) -> None:
+    """Encerra o job (completed/failed) e apaga a ordem de prioridade dele. Não faz commit."""
+    if not _fenced(db, job_id, worker_id).update(values, synchronize_session=False):
+        raise _LeaseLost()
+    db.query(AnalysisJobItem).filter(AnalysisJobItem.job_id == job_id).delete(synchronize_session=False)
+
+
+# Backoff (s) de um job cujos corpos não puderam ser buscados no Gmail: dobra a cada falha
+# seguida, até _BODY_FETCH_MAX_BACKOFF; na _BODY_FETCH_MAX_FAILURES-ésima o job falha
+_BODY_FETCH_BACKOFF = 60
+_BODY_FETCH_MAX_BACKOFF = 3600
+_BODY_FETCH_MAX_FAILURES = 6
+
+
+def _defer_for_bodies(db: Session, job: AnalysisJob, worker_id: str, error: str) -> None:
+    """
+    Devolve o job à disputa com backoff quando o Gmail não entregou os corpos da fatia
+    (token revogado, Gmail fora do ar): os e-mails não contam como erro de análise e
+    a fatia é refeita depois. Falhas seguidas demais encerram o job com o erro. Faz commit.
+    """
+    failures = (job.fetch_failures or 0) + 1
+    if failures >= _BODY_FETCH_MAX_FAILURES:
+        raise RuntimeError(f"Não foi possível buscar os corpos dos e-mails no Gmail: {error}")
+    delay = min(_BODY_FETCH_BACKOFF * 2 ** (failures - 1), _BODY_FETCH_MAX_BACKOFF)
+    released = _fenced(db, job.id, worker_id).update(
+        {
+            "worker_id": None,
+            "lease_expires_at": None,
+            "attempts": AnalysisJob.attempts - 1,
+            "fetch_failures": failures,
+            "not_before": datetime.utcnow() + timedelta(seconds=delay),
+        },
+        synchronize_session=False,
+    )
+    if not released:
+        raise _LeaseLost()
+    db.commit()
+    logger.warning(
+        "Job %d adiado por %ds: falha ao buscar corpos no Gmail (user_id=%d): %s",
+        job.id, delay, job.user_id, error,
+    )
+
+
+def _analyze_in_background(batch: list[dict]) -> dict:
+    # Fora de uma requisição HTTP: pode esperar a cota da Gemini por até GEMINI_MAX_QUEUE_WAIT
+    with limiter.background():
+        return analyze_emails_batch_cached(batch)
+
+
+def run_job(job_id: int, worker_id: str, stop: threading.Event | None = None) -> None:
+    """
+    Processa uma fatia de um job reivindicado por este worker. Usa sua própria sessão de banco.
+
+    A ordem de prioridade dos pendentes é calculada na primeira fatia (_plan_job) e
+    cada fatia são as próximas ANALYSIS_JOB_SLICE posições dela. Se sobrarem posições,
+    o job fica "running" sem dono, com o vtime somado, e volta à disputa com os jobs
+    dos outros usuários; a próxima fatia pode ser de qualquer worker. Só entram
+    e-mails ainda sem análise, então um job retomado após um crash refaz a mesma fatia
+    a partir do próximo e-mail não gravado.
+    Os e-mails vão para a Gemini empacotados em prompts com vários e-mails cada, com
+    até AI_MAX_CONCURRENCY chamadas em paralelo, e os resultados são gravados em
+    lotes de AI_COMMIT_BATCH_SIZE.
+    """
+    db = SessionLocal()
+    lease = _LeaseKeeper(job_id, worker_id)
+    lease.start()
+    try:
+        job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+        if job.attempts > ANALYSIS_JOB_MAX_ATTEMPTS:
+            raise RuntimeError(f"Job abandonado após {job.attempts - 1} tentativas interrompidas.")
+
+        if job.next_position is None:
+            _plan_job(db, job, worker_id)
+        # As posições já contadas em done foram apagadas, então a fatia pode ter buracos
+        positions = {
+            email_id: position for position, email_id in
+            db.query(AnalysisJobItem.position, AnalysisJobItem.email_id)
+            .filter(AnalysisJobItem.job_id == job_id, AnalysisJobItem.position >= job.next_position)
+            .order_by(AnalysisJobItem.position)
+            .limit(ANALYSIS_JOB_SLICE)
+        }
+        window = list(positions)
+        next_position = max(positions.values(), default=job.next_position - 1) + 1
+        has_more = db.query(AnalysisJobItem.position).filter(
+            AnalysisJobItem.job_id == job_id, AnalysisJobItem.position >= next_position,
+        ).first() is not None
+
+        # E-mails que já falharam neste job ficam para o próximo analyze-all; os que
+        # foram analisados por outra rota desde o cálculo da ordem são pulados, mas
+        # contam como feitos (senão o progresso do job para abaixo de 100%)
+        failed: list[int] = json.loads(job.failed_email_ids or "[]")
+        skip = set(failed)
+        unanalyzed_ids = {
+            email_id for (email_id,) in
+            db.query(Email.id).filter(*_pending_filters(job.user_id, job.max_email_id), Email.id.in_(window))
+        } if window else set()
+        analyzed_elsewhere = [
+            email_id for email_id in window if email_id not in unanalyzed_ids and email_id not in skip
+        ]
+        if analyzed_elsewhere:
+            if not _fenced(db, job_id, worker_id).update(
+                {"done": AnalysisJob.done + len(analyzed_elsewhere)}, synchronize_session=False,
+            ):
+                raise _LeaseLost()
+            _consume_items(db, job_id, [positions[email_id] for email_id in analyzed_elsewhere])
+            db.commit()
+        selected = [email_id for email_id in window if email_id in unanalyzed_ids and email_id not in skip]
+
+        # Sync só de metadados: baixa do Gmail os corpos da fatia que ainda faltam
+        try:
+            body_hydration.hydrate(db, job.user_id, selected)
+        except body_hydration.BodyFetchError as e:
+            db.rollback()
+            _defer_for_bodies(db, job, worker_id, str(e))
+            return
+
+        rows = (
+            db.query(Email.id, Email.subject, Email.body, Email.clean_body, Email.body_loaded)
+            .filter(Email.id.in_(selected))
+            .all()
+        ) if selected else []
+        # O Gmail respondeu mas não devolveu estes (ex: apagados): contam como erro
+        without_body = [row.id for row in rows if row.body_loaded is False]
+        if without_body:
+            _record_failures(db, job_id, worker_id, failed, without_body)
+            db.commit()
+            rows = [row for row in rows if row.body_loaded is not False]
+        emails = _with_clean_bodies(db, rows)
+
+        # E-mails de conteúdo idêntico no mesmo job geram uma única análise
+        groups: dict[str, list] = {}
+        for email in emails:
+            groups.setdefault(content_hash(email.subject or "", email.clean_body), []).append(email)
+
+        # Um representante por grupo, empacotados em prompts com vários e-mails cada
+        batches = pack_batches([
+            {"id": key, "subject": group[0].subject or "", "body": group[0].clean_body}
+            for key, group in groups.items()
+        ])
+
+        to_save: list[tuple[int, dict]] = []
+        with ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENCY) as executor:
+            futures = {executor.submit(_analyze_in_background, batch): batch for batch in batches}
+            try:
+                for future in as_completed(futures):
+                    if lease.lost.is_set():
+                        raise _LeaseLost()
+                    if stop is not None and stop.is_set():
+                        raise _Interrupted()
+
+                    batch = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        failed_ids = [email.id for item in batch for email in groups[item["id"]]]
+                        _record_failures(db, job_id, worker_id, failed, failed_ids)
+                        db.commit()
+                        logger.error(
+                            "Falha ao analisar %d e-mail(s) (user_id=%d, ex: email_id=%d): %s",
+                            len(failed_ids), job.user_id, failed_ids[0], str(e),
+                        )
+                        continue
+
+                    for key, result in results.items():
+                        to_save.extend((email.id, result) for email in groups[key])
+                    # Gemini indisponível no meio do lote: o que não voltou conta como erro
+                    missing = [email.id for item in batch if item["id"] not in results for email in groups[item["id"]]]
+                    if missing:
+                        _record_failures(db, job_id, worker_id, failed, missing)
+                        db.commit()
+
+                    if len(to_save) >= AI_COMMIT_BATCH_SIZE:
+                        _save_analyses(db, job, worker_id, to_save, failed, positions)
+                        to_save = []
+            except (_LeaseLost, _Interrupted):
+                for future in futures:
+                    future.cancel()
+                raise
+
+        _save_analyses(db, job, worker_id, to_save, failed, positions)
+
+        if has_more:
+            # Ainda há pendentes: libera o job para a próxima rodada do fair-share.
+            # A fatia não conta como tentativa (attempts só mede interrupções).
+            weight = analysis_scheduler.user_weight(db, job.user_id)
+            released = _fenced(db, job_id, worker_id).update(
+                {
+                    "worker_id": None,
+                    "lease_expires_at": None,
+                    "attempts": AnalysisJob.attempts - 1,
+                    "next_position": next_position,
+                    "fetch_failures": 0,
+                    "vtime": func.coalesce(AnalysisJob.vtime, 0.0) + max(1, len(selected)) / weight,
+                },
+                synchronize_session=False,
+            )
+            if not released:
+                raise _LeaseLost()
+            db.commit()
+            return
+
+        _finish(db, job_id, worker_id, {"status": "completed", "finished_at": datetime.utcnow(), "lease_expires_at": None})
+        db.commit()
+        db.refresh(job)
+        logger.info(
+            "analyze-all concluído para user_id=%d: %d analisados, %d erros.",
+            job.user_id, job.done, job.errors,
+        )
+
+    except _LeaseLost:
+        db.rollback()
+        logger.warning("Job %d assumido por outro worker; %s abandonou o processamento.", job_id, worker_id)
+    except _Interrupted:
+        db.rollback()
+        # Devolve o job à fila para outro worker continuar sem esperar o lease expirar
+        _fenced(db, job_id, worker_id).update(
+            {"status": "queued", "worker_id": None, "lease_expires_at": None,
+             "attempts": AnalysisJob.attempts - 1},
+            synchronize_session=False,
+        )
+        db.commit()
+        logger.info("Job %d devolvido à fila (worker %s desligando).", job_id, worker_id)
+    except Exception as e:
+        db.rollback()
+        logger.error("Erro fatal no job analyze-all %d: %s", job_id, str(e))
+        try:
+            _finish(db, job_id, worker_id, {"status": "failed", "error": str(e), "finished_at": datetime.utcnow(), "lease_expires_at": None})
+            db.commit()
+        except _LeaseLost:
+            db.rollback()
+    finally:
+        lease.stop()
+        db.close()
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def run_worker(stop: threading.Event, worker_id: str | None = None) -> None:
+    """
+    Laço do worker: reivindica um job por vez e processa até `stop` ser sinalizado.
+    Vários workers (threads ou processos) podem rodar contra o mesmo banco.
+    """
+    worker_id = worker_id or new_worker_id()
+    logger.info("Worker de análise %s iniciado.", worker_id)
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            job_id = claim_next_job(db, worker_id)
+        except Exception as e:
+            db.rollback()
+            logger.error("Falha ao buscar jobs na fila: %s", str(e))
+            job_id = None
+        finally:
+            db.close()
+
+        if job_id is None:
+            stop.wait(ANALYSIS_WORKER_POLL_INTERVAL)
+            continue
+        run_job(job_id, worker_id, stop)
+    logger.info("Worker de análise %s encerrado.", worker_id)
@@ -0,0 +1,134 @@
+"""
+Ordem de atendimento do analyze-all.
+
+Dentro de um job, os e-mails pendentes são analisados por prioridade (recentes,
+não lidos e com cara de urgentes primeiro; newsletters e no-reply por último), em
+fatias de ANALYSIS_JOB_SLICE. Entre jobs, a disputa é por tempo virtual (weighted
+fair queuing): cada fatia soma ao `vtime` do job os e-mails processados divididos
+pelo peso do usuário, e o worker sempre pega o job de menor `vtime`. Uma caixa
+enorme não monopoliza a cota da Gemini, e quem está com a inbox aberta agora
+(User.last_active_at recente) tem peso ANALYSIS_ACTIVE_WEIGHT e é atendido antes.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import ANALYSIS_ACTIVE_WINDOW, ANALYSIS_ACTIVE_WEIGHT
+from app.core.database import SessionLocal
+from app.models.user_model import User
+from app.models.analysis_job_model import AnalysisJob
+
+_URGENT = re.compile(
+    r"\b(urgente|urgent|asap|importante|important|prazo|deadline|vence|vencimento|"
+    r"hoje|today|imediato|action required|ação necessária|reunião|meeting)\b",
+    re.IGNORECASE,
+)
+_BULK = re.compile(
+    r"(unsubscribe|descadastr|newsletter|promo|oferta|desconto|% off|no-?reply|notifica)",
+    re.IGNORECASE,
+)
+# Meia-vida (dias) do bônus de recência
+_RECENCY_HALF_LIFE = 3.0
+# Intervalo (s) entre as gravações de last_active_at (bem menor que ANALYSIS_ACTIVE_WINDOW)
+_FLUSH_EVERY = 30
+
+logger = logging.getLogger(__name__)
+
+# Última atividade de cada usuário ainda não gravada no banco: user_id -> datetime (UTC)
+_activity: dict[int, datetime] = {}
+_activity_lock = threading.Lock()
+
+
+def email_priority(row, now: datetime) -> float:
+    """Pontuação de um e-mail pendente (id, subject, sender, snippet, date, is_read); maior vai primeiro."""
+    score = 0.0
+    if row.date is not None:
+        age_days = max(0.0, (now - row.date).total_seconds() / 86400)
+        score += 4.0 * math.pow(0.5, age_days / _RECENCY_HALF_LIFE)
+    if not row.is_read:
+        score += 2.0
+    text = f"{row.subject or ''} {row.snippet or ''}"
+    if _URGENT.search(text):
+        score += 2.0
+    if _BULK.search(f"{text} {row.sender or ''}"):
+        score -= 1.5
+    return score
+
+
+def next_slice(rows: list, size: int, now: datetime | None = None) -> list[int]:
+    """IDs dos `size` e-mails de maior prioridade (empate: o mais novo primeiro)."""
+    now = now or datetime.now()   # Email.date é hora local (datetime.fromtimestamp no sync)
+    ranked = heapq.nlargest(size, rows, key=lambda row: (email_priority(row, now), row.id))
+    return [row.id for row in ranked]
+
+
+def user_weight(db: Session, user_id: int) -> float:
+    """Peso do usuário no fair-share: maior enquanto ele está usando o app."""
+    last_active = db.query(User.last_active_at).filter(User.id == user_id).scalar()
+    if last_active and datetime.utcnow() - last_active < timedelta(seconds=ANALYSIS_ACTIVE_WINDOW):
+        return ANALYSIS_ACTIVE_WEIGHT
+    return 1.0
+
+
+def initial_vtime(db: Session) -> float:
+    """
+    vtime de um job novo: o menor entre os ativos. Entra na vez junto com os demais,
+    sem "crédito" acumulado que lhe daria a frente por muito tempo.
+    """
+    return (
+        db.query(func.min(AnalysisJob.vtime))
+        .filter(AnalysisJob.status.in_(("queued", "running")))
+        .scalar()
+    ) or 0.0
+
+
+def touch_user(user_id: int) -> None:
+    """
+    Marca o usuário como ativo (chamado ao abrir a inbox ou um e-mail). Só registra em
+    memória, sem tocar na transação da requisição; run_activity_flusher grava em
+    User.last_active_at a cada _FLUSH_EVERY segundos.
+    """
+    with _activity_lock:
+        _activity[user_id] = datetime.utcnow()
+
+
+def flush_activity(db: Session) -> int:
+    """Grava a atividade acumulada desde a última chamada. Faz commit. Retorna quantos usuários."""
+    with _activity_lock:
+        pending = dict(_activity)
+        _activity.clear()
+    try:
+        for user_id, active_at in pending.items():
+            db.query(User).filter(User.id == user_id).update(
+                {"last_active_at": active_at}, synchronize_session=False,
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Devolve o que não foi gravado, sem sobrescrever atividade mais nova
+        with _activity_lock:
+            for user_id, active_at in pending.items():
+                _activity.setdefault(user_id, active_at)
+        raise
+    return len(pending)
+
+
+def run_activity_flusher(stop: threading.Event) -> None:
+    """Loop (thread da API) que grava a atividade dos usuários; a última gravação acontece ao parar."""
+    while True:
+        stopping = stop.wait(_FLUSH_EVERY)
+        db = SessionLocal()
+        try:
+            flush_activity(db)
+        except Exception as e:
+            logger.error("Falha ao gravar a atividade dos usuários: %s", str(e))
+        finally:
+            db.close()
+        if stopping:
+            return
@@ -0,0 +1,164 @@
+"""
+Corpos dos e-mails sob demanda.
+
+O sync e a importação gravam só os metadados de cada mensagem (format="metadata":
+cabeçalhos, snippet e labels), com body_loaded=False. O corpo completo é baixado do
+Gmail quando alguém precisa dele — ao abrir o e-mail (GET /emails/{id}) e antes de
+analisar (rotas de análise, worker do analyze-all, análise por conversa) — e pelo
+prefetcher em background, que adianta os e-mails com mais chance de serem abertos:
+recentes (até BODY_PREFETCH_MAX_AGE_DAYS), não lidos e com cara de urgentes, na mesma
+ordem de prioridade do analyze-all, começando pelos usuários que usaram o app por último.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import BODY_PREFETCH_BATCH, BODY_PREFETCH_INTERVAL, BODY_PREFETCH_MAX_AGE_DAYS
+from app.core.database import SessionLocal
+from app.models.user_model import User
+from app.models.email_model import Email
+from app.services.email_preprocessing import clean_email_body
+from app.services.gmail_service import fetch_bodies
+from app.services.analysis_scheduler import next_slice
+from app.services import search_index
+from app.services.similarity_index import similarity_index
+
+logger = logging.getLogger(__name__)
+
+# Quanto tempo (s) o prefetcher espera para tentar de novo um e-mail que o Gmail não
+# devolveu (apagado, ou erro pontual naquela parte do lote)
+_RETRY_MISSING_AFTER = 3600
+# Candidatos lidos por usuário a cada rodada antes de escolher os de maior prioridade
+_CANDIDATES = 2000
+
+_wake = threading.Event()
+_missing: dict[int, float] = {}
+
+
+class BodyFetchError(Exception):
+    """Não foi possível buscar os corpos no Gmail (token revogado, Gmail fora do ar...)."""
+
+
+def store_bodies(db: Session, user_id: int, rows: list, bodies: dict[str, str]) -> list[int]:
+    """
+    Grava os corpos baixados (corpo, clean_body, body_loaded) de rows (id, gmail_id, subject)
+    e atualiza os índices de busca e de similaridade (este só depois do commit). Não faz
+    commit. Retorna os IDs gravados.
+    """
+    updates = [
+        {"id": row.id, "body": bodies[row.gmail_id], "clean_body": clean_email_body(bodies[row.gmail_id]), "body_loaded": True}
+        for row in rows if row.gmail_id in bodies
+    ]
+    if not updates:
+        return []
+    db.bulk_update_mappings(Email, updates)
+    search_index.index_bodies(db, [(item["id"], item["clean_body"]) for item in updates])
+    subjects = {row.id: row.subject for row in rows}
+    similarity_index.add_on_commit(
+        db, user_id, [(item["id"], subjects[item["id"]], item["clean_body"]) for item in updates],
+    )
+    return [item["id"] for item in updates]
+
+
+def hydrate(db: Session, user_id: int, email_ids: list[int]) -> list[int]:
+    """
+    Baixa do Gmail, em lote, o corpo dos e-mails de email_ids que ainda só têm metadados.
+    Faz commit. Retorna os IDs que ficaram com corpo agora; os que o Gmail não devolveu
+    continuam com body_loaded=False. Lança BodyFetchError se a chamada ao Gmail falhar.
+    """
+    if not email_ids:
+        return []
+    rows = (
+        db.query(Email.id, Email.gmail_id, Email.subject)
+        .filter(Email.user_id == user_id, Email.id.in_(email_ids), Email.body_loaded.is_(False))
+        .all()
+    )
+    if not rows:
+        return []
+
+    user = db.query(User).filter(User.id == user_id).first()
+    try:
+        bodies = fetch_bodies(user.access_token, user.refresh_token, user_id, [row.gmail_id for row in rows])
+    except Exception as e:
+        raise BodyFetchError(getattr(e, "detail", None) or str(e)) from e
+
+    stored = store_bodies(db, user_id, rows, bodies)
+    db.commit()
+    if len(stored) < len(rows):
+        logger.warning(
+            "Gmail não devolveu o corpo de %d de %d e-mail(s) (user_id=%d).",
+            len(rows) - len(stored), len(rows), user_id,
+        )
+    return stored
+
+
+def request_prefetch() -> None:
+    """Acorda o prefetcher (ex: logo depois de um sync trazer e-mails novos)."""
+    _wake.set()
+
+
+def prefetch_once(db: Session) -> int:
+    """Uma rodada do prefetcher: até BODY_PREFETCH_BATCH corpos por usuário. Retorna quantos baixou."""
+    since = datetime.now() - timedelta(days=BODY_PREFETCH_MAX_AGE_DAYS)   # Email.date é hora local
+    users = (
+        db.query(Email.user_id, func.max(User.last_active_at))
+        .join(User, User.id == Email.user_id)
+        .filter(Email.body_loaded.is_(False), Email.date >= since)
+        .group_by(Email.user_id)
+        .all()
+    )
+    # Quem usou o app por último primeiro; quem nunca abriu a inbox, por último
+    user_ids = [user_id for user_id, _ in sorted(users, key=lambda user: user[1] or datetime.min, reverse=True)]
+
+    now = time.monotonic()
+    for email_id, retry_at in list(_missing.items()):
+        if retry_at <= now:
+            del _missing[email_id]
+
+    total = 0
+    for user_id in user_ids:
+        candidates = [
+            row for row in
+            db.query(Email.id, Email.subject, Email.sender, Email.snippet, Email.date, Email.is_read)
+            .filter(Email.user_id == user_id, Email.body_loaded.is_(False), Email.date >= since)
+            .order_by(Email.date.desc())
+            .limit(_CANDIDATES)
+            if row.id not in _missing
+        ]
+        selected = next_slice(candidates, BODY_PREFETCH_BATCH)
+        try:
+            stored = hydrate(db, user_id, selected)
+        except BodyFetchError as e:
+            db.rollback()
+            logger.warning("Prefetch de corpos falhou para user_id=%d: %s", user_id, str(e))
+            continue
+        retry_at = time.monotonic() + _RETRY_MISSING_AFTER
+        _missing.update((email_id, retry_at) for email_id in set(selected) - set(stored))
+        total += len(stored)
+    return total
+
+
+def run_prefetcher(stop: threading.Event) -> None:
+    """
+    Loop do prefetcher (thread da API). Repete na hora enquanto houver o que baixar;
+    senão espera BODY_PREFETCH_INTERVAL segundos ou um request_prefetch().
+    """
+    logger.info("Prefetcher de corpos iniciado.")
+    while not stop.is_set():
+        _wake.clear()
+        db = SessionLocal()
+        try:
+            fetched = prefetch_once(db)
+        except Exception as e:
+            db.rollback()
+            logger.error("Erro no prefetcher de corpos: %s", str(e))
+            fetched = 0
+        finally:
+            db.close()
+        if not fetched:
+            _wake.wait(BODY_PREFETCH_INTERVAL)
+    logger.info("Prefetcher de corpos encerrado.")
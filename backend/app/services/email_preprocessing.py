@@ -0,0 +1,139 @@
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+from app.core.config import AI_BODY_TOKEN_BUDGET
+
+# Tags cujo conteúdo nunca é texto visível
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template", "svg"}
+# Tags que quebram linha no texto renderizado
+_BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "blockquote", "section", "article", "header", "footer", "hr",
+}
+
+_HTML_HINT = re.compile(r"<\s*(html|body|div|p|br|table|span|td|a)\b", re.IGNORECASE)
+
+# Início do histórico citado numa resposta (Gmail, Outlook, Apple Mail — pt e en)
+_QUOTE_HEADERS = [
+    re.compile(r"^\s*(em|on)\s.+(escreveu|wrote)\s*:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*(mensagem original|original message|forwarded message|mensagem encaminhada)\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^\s*(de|from)\s*:\s.*@", re.IGNORECASE),
+]
+
+# Início da assinatura
+_SIGNATURE_MARKERS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^\s*(enviado do meu|sent from my)\s", re.IGNORECASE),
+    re.compile(r"^\s*(atenciosamente|att\.?|abraços|cordialmente|best regards|regards)\s*,?\s*$", re.IGNORECASE),
+]
+
+# Linhas mais curtas que isso ("Olá,", "Obrigado!") se repetem sem serem citação
+_MIN_REPEATED_LINE = 20
+
+_URL = re.compile(r"https?://\S+")
+_SPACES = re.compile(r"[ \t\u00a0\u200b\u200c\u200d\ufeff]+")
+
+
+class _TextExtractor(HTMLParser):
+    """Converte HTML em texto, descartando CSS, scripts, imagens e URLs dos links."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: list[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def _strip_quoted_and_signature(text: str) -> str:
+    """Corta o texto no início do histórico citado ou da assinatura e remove linhas com '>'."""
+    kept: list[str] = []
+    for line in text.split("\n"):
+        if line.lstrip().startswith(">"):
+            continue
+        # Só corta se já houver conteúdo antes — evita apagar e-mails que começam com "De:"
+        if kept and any(p.match(line) for p in _QUOTE_HEADERS + _SIGNATURE_MARKERS):
+            break
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def _collapse_whitespace(text: str) -> str:
+    lines = [_SPACES.sub(" ", line).strip() for line in text.split("\n")]
+    collapsed: list[str] = []
+    for line in lines:
+        if line or (collapsed and collapsed[-1]):
+            collapsed.append(line)
+    return "\n".join(collapsed).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trunca em limite de palavra para caber em ~max_tokens (~4 caracteres por token)."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + " [...]"
+
+
+def clean_email_body(body: str | None, max_tokens: int = AI_BODY_TOKEN_BUDGET) -> str:
+    """
+    Prepara o corpo do e-mail para o prompt da Gemini: HTML vira texto, histórico
+    citado, assinatura e URLs saem, espaços são colapsados e o resultado é truncado
+    em max_tokens. O corpo original (HTML) continua sendo o exibido no frontend.
+    """
+    if not body:
+        return ""
+    text = html_to_text(body) if _HTML_HINT.search(body) else unescape(body)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _URL.sub("", text)
+    text = _strip_quoted_and_signature(text)
+    text = _collapse_whitespace(text)
+    return truncate_to_tokens(text, max_tokens)
+
+
+def strip_seen_lines(text: str, seen: set[str]) -> str:
+    """
+    Conteúdo novo de uma mensagem da conversa: remove do corpo já limpo as linhas que
+    repetem mensagens anteriores (histórico citado sem '>' nem cabeçalho reconhecido,
+    texto encaminhado de novo) e acrescenta as linhas desta mensagem a `seen`.
+    Chame em ordem cronológica, com o mesmo `seen` para a conversa inteira.
+    """
+    kept: list[str] = []
+    for line in text.split("\n"):
+        key = _SPACES.sub(" ", line).strip().lower()
+        if len(key) < _MIN_REPEATED_LINE:
+            kept.append(line)
+        elif key not in seen:
+            seen.add(key)
+            kept.append(line)
+    return _collapse_whitespace("\n".join(kept))
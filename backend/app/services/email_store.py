@@ -0,0 +1,98 @@
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.email_model import Email
+from app.services.email_preprocessing import clean_email_body
+from app.services import stats_store, search_index
+from app.services.similarity_index import similarity_index
+
+# Linhas por INSERT multi-VALUES (~12 parâmetros cada, abaixo do limite de 999 de SQLites antigos)
+_INSERT_CHUNK = 50
+# Tamanho máximo das listas em cláusulas IN
+_IN_CHUNK = 500
+
+
+def _insert_ignoring_duplicates(db: Session, rows: list[dict]):
+    """INSERT ... ON CONFLICT (gmail_id) DO NOTHING no dialeto do banco em uso."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(Email).values(rows).on_conflict_do_nothing(index_elements=["gmail_id"])
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(Email).values(rows).on_conflict_do_nothing(index_elements=["gmail_id"])
+    else:
+        stmt = insert(Email).values(rows)
+    return db.execute(stmt.returning(Email.id, Email.gmail_id, Email.date, Email.is_read))
+
+
+def _set_read_state(db: Session, user_id: int, gmail_ids: list[str], is_read: bool) -> int:
+    """Atualiza is_read com um UPDATE por bloco de IDs; retorna quantas linhas realmente mudaram."""
+    changed = 0
+    for start in range(0, len(gmail_ids), _IN_CHUNK):
+        result = db.execute(
+            update(Email)
+            .where(
+                Email.user_id == user_id,
+                Email.gmail_id.in_(gmail_ids[start:start + _IN_CHUNK]),
+                Email.is_read != is_read,
+            )
+            .values(is_read=is_read)
+            .execution_options(synchronize_session=False)
+        )
+        changed += result.rowcount
+    stats_store.increment(db, user_id, {"unread": -changed if is_read else changed})
+    return changed
+
+
+def upsert_emails(db: Session, user_id: int, emails: list[dict]) -> list[int]:
+    """
+    Grava um lote de e-mails vindos do Gmail com uma consulta de deduplicação e
+    inserts em massa (ON CONFLICT DO NOTHING), em vez de uma consulta por mensagem.
+    Syncs simultâneas não geram duplicatas nem erro de unicidade.
+    E-mails que já existiam têm o estado de leitura atualizado no mesmo passo,
+    e os contadores do dashboard (stats_store) e o índice de busca (search_index)
+    acompanham na mesma transação; os vetores de e-mails parecidos (similarity_index)
+    ficam em disco e só são gravados depois do commit. E-mails só com metadados entram nos índices quando o
+    corpo é baixado (body_hydration).
+    Não faz commit. Retorna os IDs dos e-mails inseridos.
+    """
+    if not emails:
+        return []
+
+    existing = {
+        row.gmail_id
+        for row in db.query(Email.gmail_id).filter(Email.gmail_id.in_([e["gmail_id"] for e in emails]))
+    }
+
+    # E-mails só com metadados (sync padrão) ficam sem clean_body até o corpo ser baixado
+    new_rows = [
+        {
+            "user_id": user_id,
+            "clean_body": clean_email_body(data["body"]) if data.get("body_loaded", True) else None,
+            **data,
+        }
+        for data in emails if data["gmail_id"] not in existing
+    ]
+    inserted_rows = []
+    for start in range(0, len(new_rows), _INSERT_CHUNK):
+        inserted_rows.extend(_insert_ignoring_duplicates(db, new_rows[start:start + _INSERT_CHUNK]))
+    stats_store.record_new_emails(db, user_id, inserted_rows)
+    rows_by_gmail_id = {row["gmail_id"]: row for row in new_rows}
+    inserted = [{**rows_by_gmail_id[row.gmail_id], "id": row.id} for row in inserted_rows]
+    search_index.index_emails(db, user_id, inserted)
+    similarity_index.add_on_commit(
+        db, user_id, [(e["id"], e.get("subject"), e["clean_body"]) for e in inserted if e["clean_body"] is not None],
+    )
+
+    apply_read_changes(
+        db, user_id,
+        {data["gmail_id"]: data["is_read"] for data in emails if data["gmail_id"] in existing},
+    )
+    return [row.id for row in inserted_rows]
+
+
+def apply_read_changes(db: Session, user_id: int, read_changes: dict[str, bool]) -> int:
+    """Aplica {gmail_id: is_read} em massa (lidos e não lidos separados). Não faz commit. Retorna quantas linhas mudaram."""
+    read = [gmail_id for gmail_id, is_read in read_changes.items() if is_read]
+    unread = [gmail_id for gmail_id, is_read in read_changes.items() if not is_read]
+    return _set_read_state(db, user_id, read, True) + _set_read_state(db, user_id, unread, False)
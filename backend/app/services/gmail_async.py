@@ -0,0 +1,323 @@
+"""
+Caminho async da Gmail API (httpx), usado pelas rotas de sync e resposta.
+
+Um único httpx.AsyncClient por processo mantém as conexões vivas entre requisições
+(HTTP/2 quando o pacote h2 está instalado), então muitas sincronizações simultâneas
+rodam no event loop sem ocupar uma thread cada. O sync incremental existe só aqui; o
+caminho síncrono (gmail_service) continua servindo o backfill e o download de corpos,
+que rodam em threads próprias.
+"""
+import asyncio
+import base64
+import json
+import logging
+import uuid
+from email.mime.text import MIMEText
+from email.message import Message
+from email.parser import BytesHeaderParser
+
+import httpx
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import (
+    GMAIL_API_ENDPOINT,
+    GMAIL_BATCH_SIZE,
+    GMAIL_HTTP2,
+    GMAIL_MAX_CONNECTIONS,
+    GMAIL_MAX_KEEPALIVE,
+    GMAIL_HTTP_TIMEOUT,
+    GMAIL_ASYNC_BATCH_CONCURRENCY,
+    GMAIL_FETCH_RETRIES,
+)
+from app.services.gmail_client_manager import client_manager
+from app.services.gmail_service import (
+    HistoryExpiredError,
+    METADATA_HEADERS,
+    SYNC_FORMAT,
+    HISTORY_TYPES,
+    parse_history,
+    parse_message,
+    retry_delay,
+    retryable_status,
+    sync_result,
+)
+
+logger = logging.getLogger(__name__)
+
+_BASE_URL = (GMAIL_API_ENDPOINT or "https://gmail.googleapis.com/").rstrip("/")
+_API_PATH = "/gmail/v1/users/me"
+_BATCH_URL = _BASE_URL + "/batch/gmail/v1"
+
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _http() -> httpx.AsyncClient:
+    """Client HTTP compartilhado do processo, criado no primeiro uso."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=_BASE_URL,
+            http2=GMAIL_HTTP2 and _http2_available(),
+            limits=httpx.Limits(max_connections=GMAIL_MAX_CONNECTIONS, max_keepalive_connections=GMAIL_MAX_KEEPALIVE),
+            timeout=GMAIL_HTTP_TIMEOUT,
+        )
+    return _client
+
+
+async def aclose() -> None:
+    """Fecha as conexões do pool (shutdown da API)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _reason(response: httpx.Response) -> str:
+    try:
+        return response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return response.reason_phrase
+
+
+class _GmailSession:
+    """Chamadas autenticadas de um usuário; renova o token uma vez se o Gmail responder 401."""
+
+    def __init__(self, access_token: str, refresh_token: str, user_id: int | None):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.user_id = user_id
+        self._token: str | None = None
+
+    async def _get_token(self) -> str:
+        if self._token is None:
+            cached = client_manager.cached_token(self.user_id) if self.user_id is not None else None
+            # Renovar o token é I/O bloqueante (google-auth): só nesse caso vai para o pool de threads
+            self._token = cached or await run_in_threadpool(
+                client_manager.get_token, self.access_token, self.refresh_token, self.user_id,
+            )
+        return self._token
+
+    async def request(self, method: str, url: str, error: str, headers: dict | None = None, **kwargs) -> httpx.Response:
+        for attempt in (1, 2):
+            auth = {"Authorization": f"Bearer {await self._get_token()}", **(headers or {})}
+            response = await _http().request(method, url, headers=auth, **kwargs)
+            if response.status_code == 401 and attempt == 1 and self.user_id is not None:
+                client_manager.invalidate(self.user_id)
+                self._token = None
+                continue
+            break
+
+        if response.status_code >= 400:
+            raise HTTPException(status_code=response.status_code, detail=f"{error}: {_reason(response)}")
+        return response
+
+    async def get_json(self, path: str, error: str, **params) -> dict:
+        params = {key: value for key, value in params.items() if value is not None}
+        response = await self.request("GET", _API_PATH + path, error, params=params)
+        return response.json()
+
+
+def _batch_body(message_ids: list[str], fmt: str, boundary: str) -> bytes:
+    query = f"format={fmt}"
+    if fmt == "metadata":
+        query += "".join(f"&metadataHeaders={header}" for header in METADATA_HEADERS)
+    parts = [
+        f"--{boundary}\r\n"
+        "Content-Type: application/http\r\n"
+        f"Content-ID: <{msg_id}>\r\n\r\n"
+        f"GET {_API_PATH}/messages/{msg_id}?{query} HTTP/1.1\r\n\r\n"
+        for msg_id in message_ids
+    ]
+    return ("".join(parts) + f"--{boundary}--\r\n").encode()
+
+
+def _parse_batch_response(response: httpx.Response) -> tuple[dict[str, dict], set[str]]:
+    """
+    ({message_id: mensagem} das partes com status 200, IDs com erro permanente).
+    Partes com erro transitório (429, 5xx) ou JSON inválido não entram em nenhum dos
+    dois: quem chamou compara com os IDs pedidos e tenta de novo.
+
+    O multipart é dividido em bytes e cada corpo JSON vai direto para json.loads: o
+    Gmail responde em UTF-8 sem Content-Transfer-Encoding, e decodificar as partes
+    como texto (email.parser) estraga acentos e emojis.
+    """
+    content_type = Message()
+    content_type["Content-Type"] = response.headers["content-type"]
+    delimiter = b"--" + content_type.get_param("boundary").encode()
+
+    results: dict[str, dict] = {}
+    gone: set[str] = set()
+    for part in response.content.split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break   # delimitador de fechamento
+        part_head, _, http_response = part.replace(b"\r\n", b"\n").lstrip(b"\n").partition(b"\n\n")
+        content_id = (BytesHeaderParser().parsebytes(part_head)["Content-ID"] or "").strip("<>")
+        msg_id = content_id.removeprefix("response-")
+        head, _, body = http_response.partition(b"\n\n")
+        status_line = head.lstrip().split(b"\n", 1)[0].split()
+        status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+        if status != 200:
+            if status and not retryable_status(status):
+                gone.add(msg_id)
+            continue
+        try:
+            results[msg_id] = json.loads(body)
+        except ValueError:
+            continue
+    return results, gone
+
+
+async def _fetch_messages(session: _GmailSession, message_ids: list[str], fmt: str = "full") -> tuple[list[dict], list[str]]:
+    """
+    Versão async de gmail_service._fetch_messages: lotes de até GMAIL_BATCH_SIZE mensagens
+    pela batch HTTP API, com até GMAIL_ASYNC_BATCH_CONCURRENCY lotes em paralelo, e as
+    mesmas novas tentativas para as mensagens que falharem com erro transitório.
+    Retorna (mensagens na mesma ordem dos IDs informados, IDs que continuaram falhando).
+    """
+    semaphore = asyncio.Semaphore(GMAIL_ASYNC_BATCH_CONCURRENCY)
+    results: dict[str, dict] = {}
+
+    async def fetch_chunk(chunk: list[str]) -> list[str]:
+        boundary = f"batch_{uuid.uuid4().hex}"
+        async with semaphore:
+            response = await session.request(
+                "POST", _BATCH_URL, "Erro ao buscar e-mails",
+                content=_batch_body(chunk, fmt, boundary),
+                headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            )
+        fetched, gone = _parse_batch_response(response)
+        results.update(fetched)
+        return [msg_id for msg_id in chunk if msg_id not in fetched and msg_id not in gone]
+
+    pending = list(message_ids)
+    for attempt in range(GMAIL_FETCH_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay(attempt))
+        chunks = [pending[i:i + GMAIL_BATCH_SIZE] for i in range(0, len(pending), GMAIL_BATCH_SIZE)]
+        pending = [
+            msg_id
+            for failed in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+            for msg_id in failed
+        ]
+        if not pending:
+            break
+
+    return [results[msg_id] for msg_id in message_ids if msg_id in results], pending
+
+
+async def _fetch_parsed(session: _GmailSession, message_ids: list[str]) -> tuple[list[dict], list[str]]:
+    """
+    Busca as mensagens no formato do sync (SYNC_FORMAT) e converte para o model Email.
+    Retorna (e-mails, IDs que continuaram falhando).
+    """
+    messages, missing = await _fetch_messages(session, message_ids, SYNC_FORMAT)
+    return [parse_message(msg_data, with_body=SYNC_FORMAT == "full") for msg_data in messages], missing
+
+
+async def _list_and_fetch(session: _GmailSession, max_results: int) -> tuple[list[dict], list[str]]:
+    result = await session.get_json(
+        "/messages", "Erro ao listar e-mails", maxResults=max_results, labelIds="INBOX",
+    )
+    message_ids = [msg["id"] for msg in result.get("messages", [])]
+    return await _fetch_parsed(session, message_ids)
+
+
+async def fetch_emails_async(
+    access_token: str,
+    refresh_token: str,
+    user_id: int | None = None,
+    max_results: int = 20,
+) -> list[dict]:
+    """Busca os últimos e-mails do usuário no Gmail (equivalente async de fetch_emails)."""
+    emails, _ = await _list_and_fetch(_GmailSession(access_token, refresh_token, user_id), max_results)
+    return emails
+
+
+async def _sync_incremental(session: _GmailSession, start_history_id: str) -> dict:
+    """Busca só o que mudou desde start_history_id. Lança HistoryExpiredError se o ID expirou."""
+    records: list[dict] = []
+    history_id = start_history_id
+    page_token = None
+
+    while True:
+        try:
+            result = await session.get_json(
+                "/history", "Erro ao buscar histórico",
+                startHistoryId=start_history_id,
+                labelId="INBOX",
+                historyTypes=HISTORY_TYPES,
+                pageToken=page_token,
+            )
+        except HTTPException as e:
+            if e.status_code == 404:
+                raise HistoryExpiredError(start_history_id)
+            raise
+
+        records.extend(result.get("history", []))
+        history_id = result.get("historyId", history_id)
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            break
+
+    added_ids, read_changes = parse_history(records)
+    emails, missing = await _fetch_parsed(session, added_ids)
+    return sync_result(history_id, False, emails, read_changes, missing, start_history_id)
+
+
+async def sync_mailbox_async(
+    access_token: str,
+    refresh_token: str,
+    user_id: int | None = None,
+    history_id: str | None = None,
+    max_results: int = 20,
+) -> dict:
+    """
+    Sincroniza a caixa do usuário. Com um history_id salvo, usa history.list e busca
+    só as mensagens novas ou alteradas; sem ele (ou se expirou), faz a sincronização completa.
+    Retorna no formato de gmail_service.sync_result.
+    """
+    session = _GmailSession(access_token, refresh_token, user_id)
+
+    if history_id:
+        try:
+            return await _sync_incremental(session, history_id)
+        except HistoryExpiredError:
+            logger.info("historyId %s expirado (user_id=%s); refazendo sincronização completa.", history_id, user_id)
+
+    # O historyId é lido antes da listagem para que nada entre as duas chamadas se perca
+    profile = await session.get_json("/profile", "Erro ao buscar perfil do Gmail")
+
+    emails, missing = await _list_and_fetch(session, max_results)
+    return sync_result(profile.get("historyId"), True, emails, {}, missing, history_id)
+
+
+async def send_email_async(
+    access_token: str,
+    refresh_token: str,
+    to: str,
+    subject: str,
+    body: str,
+    thread_id: str | None = None,
+    user_id: int | None = None,
+) -> None:
+    """Envia um e-mail via Gmail API (equivalente async de send_email)."""
+    mime_message = MIMEText(body, "plain", "utf-8")
+    mime_message["to"] = to
+    mime_message["subject"] = subject
+
+    raw = base64.urlsafe_b64encode(mime_message.as_bytes()).decode("utf-8")
+    message_body = {"raw": raw}
+    if thread_id:
+        message_body["threadId"] = thread_id
+
+    session = _GmailSession(access_token, refresh_token, user_id)
+    await session.request("POST", _API_PATH + "/messages/send", "Erro ao enviar e-mail", json=message_body)
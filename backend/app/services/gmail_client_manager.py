@@ -0,0 +1,247 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from fastapi import HTTPException
+
+from app.core.config import (
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    GMAIL_API_ENDPOINT,
+    GMAIL_CLIENT_CACHE_SIZE,
+    GMAIL_TOKEN_REFRESH_MARGIN,
+)
+from app.core.database import SessionLocal
+from app.models.user_model import User
+
+_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+
+@lru_cache(maxsize=1)
+def _discovery_document() -> str:
+    """Discovery document da Gmail API, lido do pacote uma única vez por processo."""
+    document = get_static_doc("gmail", "v1")
+    if document is None:
+        raise RuntimeError("Discovery document da Gmail API não encontrado no google-api-python-client.")
+    return document
+
+
+# httplib2.Http não é thread-safe: cada thread usa a sua, reaproveitando as conexões entre requisições
+_thread_local = threading.local()
+
+
+def _thread_http() -> httplib2.Http:
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http()
+    return http
+
+
+def _request_builder(credentials: Credentials):
+    """Faz cada requisição de um client compartilhado usar a conexão HTTP da thread atual."""
+    def build_request(http, *args, **kwargs):
+        authorized = google_auth_httplib2.AuthorizedHttp(credentials, http=_thread_http())
+        return HttpRequest(authorized, *args, **kwargs)
+    return build_request
+
+
+class _CachedClient:
+    __slots__ = ("credentials", "_service")
+
+    def __init__(self, credentials: Credentials):
+        self.credentials = credentials
+        self._service = None
+
+    @property
+    def service(self):
+        # Construído só quando alguém usa o googleapiclient (o caminho async só precisa do token)
+        if self._service is None:
+            self._service = _build(self.credentials)
+        return self._service
+
+
+class GmailClientManager:
+    """
+    Cache de clients da Gmail API por usuário.
+
+    - O discovery document é carregado uma vez por processo e cada client é construído
+      uma vez por usuário, enquanto o token continuar válido.
+    - Tokens a menos de GMAIL_TOKEN_REFRESH_MARGIN segundos de expirar são renovados
+      proativamente; a renovação é single-flight (uma por usuário por vez) e o resultado
+      é gravado em User.access_token / User.token_expiry.
+    - Mantém no máximo GMAIL_CLIENT_CACHE_SIZE clients (LRU); o lock de renovação do
+      usuário sai junto com o client.
+    - Token sem expiração conhecida é renovado uma vez, para gravar a expiração.
+    """
+
+    def __init__(self, max_clients: int = GMAIL_CLIENT_CACHE_SIZE, refresh_margin: int = GMAIL_TOKEN_REFRESH_MARGIN):
+        self._max_clients = max_clients
+        self._refresh_margin = timedelta(seconds=refresh_margin)
+        self._clients: OrderedDict[int, _CachedClient] = OrderedDict()
+        self._user_locks: dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, credentials: Credentials) -> bool:
+        """Token presente e longe o bastante da expiração (expiração desconhecida conta como vencida)."""
+        if not credentials.token or credentials.expiry is None:
+            return False
+        return credentials.expiry - self._refresh_margin > datetime.utcnow()
+
+    def _user_lock(self, user_id: int) -> threading.Lock:
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                if len(self._user_locks) >= self._max_clients:
+                    # Renovações que falharam não chegam ao cache: descarta os locks órfãos livres
+                    for stale in [uid for uid in self._user_locks if uid not in self._clients]:
+                        self._drop_lock(stale)
+                lock = self._user_locks[user_id] = threading.Lock()
+            return lock
+
+    def _drop_lock(self, user_id: int) -> None:
+        """Remove o lock do usuário se ninguém estiver renovando o token dele. Chamar com self._lock."""
+        lock = self._user_locks.get(user_id)
+        if lock is not None and not lock.locked():
+            del self._user_locks[user_id]
+
+    def _cached(self, user_id: int):
+        with self._lock:
+            entry = self._clients.get(user_id)
+            if entry is None:
+                return None
+            if not self._is_fresh(entry.credentials):
+                del self._clients[user_id]
+                return None
+            self._clients.move_to_end(user_id)
+            return entry
+
+    def _store(self, user_id: int, entry: _CachedClient) -> None:
+        with self._lock:
+            self._clients[user_id] = entry
+            self._clients.move_to_end(user_id)
+            while len(self._clients) > self._max_clients:
+                evicted, _ = self._clients.popitem(last=False)
+                self._drop_lock(evicted)
+
+    def invalidate(self, user_id: int) -> None:
+        """Descarta o client do usuário (ex: após novo login ou token revogado)."""
+        with self._lock:
+            self._clients.pop(user_id, None)
+            self._drop_lock(user_id)
+
+    def _entry(self, access_token: str, refresh_token: str, user_id: int | None) -> _CachedClient:
+        if user_id is None:
+            # Sem usuário não há onde cachear nem persistir o token renovado
+            credentials = _make_credentials(access_token, refresh_token, None)
+            if not credentials.valid:
+                _refresh(credentials)
+            return _CachedClient(credentials)
+
+        entry = self._cached(user_id)
+        if entry is not None:
+            return entry
+
+        with self._user_lock(user_id):
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            entry = self._cached(user_id)
+            if entry is not None:
+                return entry
+
+            credentials = self._load_credentials(access_token, refresh_token, user_id)
+            if not self._is_fresh(credentials):
+                _refresh(credentials)
+                self._persist(user_id, credentials)
+
+            entry = _CachedClient(credentials)
+            self._store(user_id, entry)
+            return entry
+
+    def get_service(self, access_token: str, refresh_token: str, user_id: int | None = None):
+        """Retorna um client da Gmail API com token válido para o usuário."""
+        return self._entry(access_token, refresh_token, user_id).service
+
+    def get_token(self, access_token: str, refresh_token: str, user_id: int | None = None) -> str:
+        """Access token válido para o usuário (renova se preciso). Pode bloquear: chame fora do event loop."""
+        return self._entry(access_token, refresh_token, user_id).credentials.token
+
+    def cached_token(self, user_id: int) -> str | None:
+        """Token em cache ainda válido, sem I/O — atalho para o caminho async."""
+        entry = self._cached(user_id)
+        return entry.credentials.token if entry is not None else None
+
+    def _load_credentials(self, access_token: str, refresh_token: str, user_id: int) -> Credentials:
+        """
+        Monta as credenciais a partir do banco, que pode ter um token mais novo
+        (renovado por outro processo) do que o recebido pelo chamador.
+        """
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if user and user.access_token:
+                return _make_credentials(
+                    user.access_token,
+                    user.refresh_token or refresh_token,
+                    user.token_expiry,
+                )
+        finally:
+            db.close()
+        return _make_credentials(access_token, refresh_token, None)
+
+    @staticmethod
+    def _persist(user_id: int, credentials: Credentials) -> None:
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if user:
+                user.access_token = credentials.token
+                user.token_expiry = credentials.expiry
+                db.commit()
+        finally:
+            db.close()
+
+
+def _make_credentials(access_token: str, refresh_token: str, expiry: datetime | None) -> Credentials:
+    return Credentials(
+        token=access_token,
+        refresh_token=refresh_token,
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        token_uri=_TOKEN_URI,
+        expiry=expiry,
+    )
+
+
+def _refresh(credentials: Credentials) -> None:
+    if not credentials.refresh_token:
+        raise HTTPException(
+            status_code=401,
+            detail="Token expirado e sem refresh_token disponível. Faça login novamente.",
+        )
+    try:
+        credentials.refresh(Request())
+    except Exception as e:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Não foi possível renovar o token de acesso: {str(e)}. Faça login novamente.",
+        )
+
+
+def _build(credentials: Credentials):
+    client_options = {"api_endpoint": GMAIL_API_ENDPOINT} if GMAIL_API_ENDPOINT else None
+    return build_from_document(
+        _discovery_document(),
+        credentials=credentials,
+        requestBuilder=_request_builder(credentials),
+        client_options=client_options,
+    )
+
+
+client_manager = GmailClientManager()
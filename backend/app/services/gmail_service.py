@@ -1,59 +1,145 @@
 import base64
+import logging
+import time
 from email.mime.text import MIMEText
 from datetime import datetime
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+from googleapiclient.http import BatchHttpRequest
 from fastapi import HTTPException
 
-from app.core.config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET
-from app.core.database import SessionLocal
-from app.models.user_model import User
+from app.core.config import (
+    GMAIL_BATCH_SIZE,
+    GMAIL_API_ENDPOINT,
+    GMAIL_SYNC_FULL_BODIES,
+    GMAIL_FETCH_RETRIES,
+    GMAIL_FETCH_RETRY_BACKOFF,
+)
+from app.services.gmail_client_manager import client_manager
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento do history.list que interessam à sincronização incremental
+HISTORY_TYPES = ["messageAdded", "labelAdded", "labelRemoved"]
+# Formato das mensagens no sync e na importação: "metadata" traz só cabeçalhos, snippet e
+# labels (uma fração do tamanho do "full", que inclui todas as partes MIME em base64)
+SYNC_FORMAT = "full" if GMAIL_SYNC_FULL_BODIES else "metadata"
+# Cabeçalhos pedidos no formato "metadata" (os demais não são usados)
+METADATA_HEADERS = ["Subject", "From", "To"]
+
+
+class HistoryExpiredError(Exception):
+    """O historyId salvo não está mais disponível no Gmail — é preciso refazer a sincronização completa."""
+
+
+class MessagesUnavailableError(Exception):
+    """Mensagens que o Gmail não entregou nem depois das novas tentativas (429, 5xx persistentes)."""
+
+
+def retryable_status(status: int) -> bool:
+    """Erro de uma mensagem do lote que vale tentar de novo; 400/404 (ID inválido, apagada) não."""
+    return status not in (400, 404)
+
+
+def retry_delay(attempt: int) -> float:
+    """Espera (s) antes da tentativa `attempt` (1, 2, ...) de buscar de novo as mensagens que falharam."""
+    return GMAIL_FETCH_RETRY_BACKOFF * 2 ** (attempt - 1)
+
+
+def sync_result(
+    history_id: str | None,
+    full_sync: bool,
+    emails: list[dict],
+    read_changes: dict[str, bool],
+    missing: list[str],
+    start_history_id: str | None,
+) -> dict:
+    """
+    Resultado do sync (gmail_async.sync_mailbox_async) no formato gravado pelas rotas:
+    {"history_id": "...", "full_sync": bool, "emails": [...], "read_changes": {gmail_id: is_read}}.
+    Se alguma mensagem continuou
+    falhando (missing), devolve o historyId de partida: o próximo sync relê o mesmo
+    trecho do histórico (ou refaz a listagem) e busca de novo o que faltou, em vez de
+    o historyId novo pular essas mensagens para sempre.
+    """
+    if missing:
+        logger.warning(
+            "%d mensagem(ns) não puderam ser buscadas no Gmail; historyId mantido em %s.",
+            len(missing), start_history_id,
+        )
+        history_id = start_history_id
+    return {
+        "history_id": history_id,
+        "full_sync": full_sync,
+        "emails": emails,
+        "read_changes": read_changes,
+    }
 
 
 def _build_gmail_service(access_token: str, refresh_token: str, user_id: int | None = None):
     """
-    Constrói o serviço Gmail. Se o access_token estiver expirado,
-    tenta renová-lo automaticamente usando o refresh_token.
-    Se user_id for informado, persiste o novo token no banco.
-    """
-    credentials = Credentials(
-        token=access_token,
-        refresh_token=refresh_token,
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        token_uri="https://oauth2.googleapis.com/token",
-    )
-
-    # Tenta renovar o token se estiver expirado ou prestes a expirar
-    if credentials.expired or not credentials.valid:
-        if not credentials.refresh_token:
-            raise HTTPException(
-                status_code=401,
-                detail="Token expirado e sem refresh_token disponível. Faça login novamente.",
-            )
-        try:
-            credentials.refresh(Request())
-        except Exception as e:
-            raise HTTPException(
-                status_code=401,
-                detail=f"Não foi possível renovar o token de acesso: {str(e)}. Faça login novamente.",
-            )
+    Retorna o serviço Gmail do usuário. Se o access_token estiver expirado (ou perto disso),
+    ele é renovado automaticamente usando o refresh_token.
+    Se user_id for informado, o client fica em cache e o novo token é persistido no banco.
+    """
+    return client_manager.get_service(access_token, refresh_token, user_id)
+
+
+def _new_batch(service, callback) -> BatchHttpRequest:
+    """
+    Cria uma requisição batch. O batch_uri do discovery aponta sempre para o
+    Gmail real, então com GMAIL_API_ENDPOINT definido montamos a URI manualmente.
+    """
+    if GMAIL_API_ENDPOINT:
+        return BatchHttpRequest(
+            callback=callback,
+            batch_uri=GMAIL_API_ENDPOINT.rstrip("/") + "/batch/gmail/v1",
+        )
+    return service.new_batch_http_request(callback=callback)
 
-        # Persiste o novo access_token no banco se user_id foi fornecido
-        if user_id is not None and credentials.token != access_token:
-            db = SessionLocal()
+
+def _fetch_messages(service, message_ids: list[str], fmt: str = "full") -> tuple[list[dict], list[str]]:
+    """
+    Busca várias mensagens pela batch HTTP API do Gmail: cada lote de até
+    GMAIL_BATCH_SIZE mensagens custa uma única requisição HTTP, em vez de uma por mensagem.
+    Mensagens que falharem com erro transitório (ex: 429 rateLimitExceeded dentro do
+    lote) são buscadas de novo até GMAIL_FETCH_RETRIES vezes, com espera crescente.
+
+    Retorna (mensagens na mesma ordem dos IDs informados, IDs que continuaram falhando).
+    As que o Gmail diz não existir (apagadas) ficam fora das duas listas.
+    """
+    results: dict[str, dict] = {}
+    failed: list[str] = []
+
+    def on_response(request_id, response, exception):
+        if exception is None:
+            results[request_id] = response
+        elif not isinstance(exception, HttpError) or retryable_status(exception.status_code):
+            # Falha só desta mensagem: tenta de novo abaixo, sem abortar o lote
+            failed.append(request_id)
+
+    pending = list(message_ids)
+    for attempt in range(GMAIL_FETCH_RETRIES + 1):
+        if attempt:
+            time.sleep(retry_delay(attempt))
+        failed.clear()
+        for start in range(0, len(pending), GMAIL_BATCH_SIZE):
+            batch = _new_batch(service, on_response)
+            for msg_id in pending[start:start + GMAIL_BATCH_SIZE]:
+                params = {"metadataHeaders": METADATA_HEADERS} if fmt == "metadata" else {}
+                batch.add(
+                    service.users().messages().get(userId="me", id=msg_id, format=fmt, **params),
+                    request_id=msg_id,
+                )
             try:
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    user.access_token = credentials.token
-                    db.commit()
-            finally:
-                db.close()
+                batch.execute()
+            except HttpError as e:
+                raise HTTPException(status_code=e.status_code, detail=f"Erro ao buscar e-mails: {e.reason}")
+        pending = list(failed)
+        if not pending:
+            break
 
-    return build("gmail", "v1", credentials=credentials)
+    return [results[msg_id] for msg_id in message_ids if msg_id in results], pending
 
 
 def _decode_body(payload: dict) -> str:
@@ -93,6 +179,59 @@ def _parse_headers(headers: list) -> dict:
     return {h["name"].lower(): h["value"] for h in headers}
 
 
+def parse_message(msg_data: dict, with_body: bool = True) -> dict:
+    """
+    Converte a resposta de messages.get no formato usado pelo model Email. Com
+    with_body=False (mensagem no formato "metadata"), body fica None e body_loaded False.
+    """
+    payload = msg_data.get("payload", {})
+    headers = _parse_headers(payload.get("headers", []))
+    internal_date = msg_data.get("internalDate")
+    date = datetime.fromtimestamp(int(internal_date) / 1000) if internal_date else None
+
+    return {
+        "gmail_id": msg_data["id"],
+        "thread_id": msg_data.get("threadId"),
+        "subject": headers.get("subject", "(sem assunto)"),
+        "sender": headers.get("from", ""),
+        "recipient": headers.get("to", ""),
+        "snippet": msg_data.get("snippet", ""),
+        "body": _decode_body(payload) if with_body else None,
+        "body_loaded": with_body,
+        "date": date,
+        "is_read": "UNREAD" not in msg_data.get("labelIds", []),
+    }
+
+
+def _list_page(service, max_results: int, page_token: str | None = None) -> dict:
+    """Uma página do messages.list da INBOX."""
+    try:
+        return service.users().messages().list(
+            userId="me",
+            maxResults=max_results,
+            labelIds=["INBOX"],
+            pageToken=page_token,
+        ).execute()
+    except HttpError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Erro ao listar e-mails: {e.reason}")
+
+
+def _fetch_parsed(service, message_ids: list[str]) -> tuple[list[dict], list[str]]:
+    """
+    Busca as mensagens no formato do sync (SYNC_FORMAT) e converte para o model Email.
+    Retorna (e-mails, IDs que continuaram falhando).
+    """
+    messages, missing = _fetch_messages(service, message_ids, SYNC_FORMAT)
+    return [parse_message(msg_data, with_body=SYNC_FORMAT == "full") for msg_data in messages], missing
+
+
+def _list_and_fetch(service, max_results: int) -> tuple[list[dict], list[str]]:
+    """Lista os últimos e-mails da INBOX e busca cada um (só metadados, por padrão)."""
+    result = _list_page(service, max_results)
+    message_ids = [msg["id"] for msg in result.get("messages", [])]
+    return _fetch_parsed(service, message_ids)
+
+
 def fetch_emails(
     access_token: str,
     refresh_token: str,
@@ -101,48 +240,98 @@ def fetch_emails(
 ) -> list[dict]:
     """Busca os últimos e-mails do usuário no Gmail."""
     service = _build_gmail_service(access_token, refresh_token, user_id)
+    emails, _ = _list_and_fetch(service, max_results)
+    return emails
+
+
+def fetch_bodies(
+    access_token: str,
+    refresh_token: str,
+    user_id: int | None,
+    message_ids: list[str],
+) -> dict[str, str]:
+    """
+    Corpo completo (HTML ou texto) de cada mensagem, em lotes da batch API:
+    {gmail_id: corpo}. Mensagens que falharem (ex: apagadas no Gmail, ou 429 mesmo depois
+    das novas tentativas) ficam de fora e continuam sem corpo no banco.
+    """
+    service = _build_gmail_service(access_token, refresh_token, user_id)
+    messages, _ = _fetch_messages(service, message_ids)
+    return {msg_data["id"]: _decode_body(msg_data.get("payload", {})) for msg_data in messages}
+
 
+def count_inbox_messages(access_token: str, refresh_token: str, user_id: int | None = None) -> int | None:
+    """Total de mensagens na INBOX segundo o Gmail (usado como estimativa de progresso)."""
+    service = _build_gmail_service(access_token, refresh_token, user_id)
     try:
-        result = service.users().messages().list(
-            userId="me",
-            maxResults=max_results,
-            labelIds=["INBOX"],
-        ).execute()
-    except HttpError as e:
-        raise HTTPException(status_code=e.status_code, detail=f"Erro ao listar e-mails: {e.reason}")
+        label = service.users().labels().get(userId="me", id="INBOX").execute()
+    except HttpError:
+        return None
+    return label.get("messagesTotal")
 
-    messages = result.get("messages", [])
-    emails = []
-
-    for msg in messages:
-        try:
-            msg_data = service.users().messages().get(
-                userId="me",
-                id=msg["id"],
-                format="full",
-            ).execute()
-        except HttpError:
-            # Pula mensagens que falharem individualmente sem abortar tudo
-            continue
-
-        payload = msg_data.get("payload", {})
-        headers = _parse_headers(payload.get("headers", []))
-        internal_date = msg_data.get("internalDate")
-        date = datetime.fromtimestamp(int(internal_date) / 1000) if internal_date else None
-
-        emails.append({
-            "gmail_id": msg_data["id"],
-            "thread_id": msg_data.get("threadId"),
-            "subject": headers.get("subject", "(sem assunto)"),
-            "sender": headers.get("from", ""),
-            "recipient": headers.get("to", ""),
-            "snippet": msg_data.get("snippet", ""),
-            "body": _decode_body(payload),
-            "date": date,
-            "is_read": "UNREAD" not in msg_data.get("labelIds", []),
-        })
 
-    return emails
+def iter_mailbox_pages(
+    access_token: str,
+    refresh_token: str,
+    user_id: int | None = None,
+    page_token: str | None = None,
+    page_size: int = 100,
+):
+    """
+    Percorre todas as páginas do messages.list da INBOX a partir de page_token.
+    Gera (emails da página, token da próxima página) — o token é None na última página.
+    Só uma página fica em memória por vez, independente do tamanho da caixa.
+    Lança MessagesUnavailableError se alguma mensagem da página continuar falhando,
+    antes de entregar a página: o checkpoint não passa dela e a importação retomada a refaz.
+    """
+    service = _build_gmail_service(access_token, refresh_token, user_id)
+
+    while True:
+        result = _list_page(service, page_size, page_token)
+        message_ids = [msg["id"] for msg in result.get("messages", [])]
+        emails, missing = _fetch_parsed(service, message_ids)
+        if missing:
+            raise MessagesUnavailableError(
+                f"{len(missing)} mensagem(ns) da página não puderam ser buscadas no Gmail."
+            )
+        page_token = result.get("nextPageToken")
+        yield emails, page_token
+        if not page_token:
+            return
+
+
+def parse_history(records: list[dict]) -> tuple[list[str], dict[str, bool]]:
+    """
+    Reduz os registros do history.list a (IDs para buscar, mudanças de leitura).
+    Os registros vêm em ordem cronológica, então o último evento de cada mensagem prevalece.
+    Mensagens que entraram na INBOX (novas ou movidas) precisam ser buscadas;
+    para as demais basta refletir a troca do label UNREAD em Email.is_read.
+    """
+    added: dict[str, None] = {}
+    read_changes: dict[str, bool] = {}
+
+    for record in records:
+        for item in record.get("messagesAdded", []):
+            message = item["message"]
+            if "INBOX" in message.get("labelIds", []):
+                added[message["id"]] = None
+
+        for item in record.get("labelsAdded", []):
+            msg_id = item["message"]["id"]
+            if "INBOX" in item.get("labelIds", []):
+                added[msg_id] = None
+            if "UNREAD" in item.get("labelIds", []):
+                read_changes[msg_id] = False
+
+        for item in record.get("labelsRemoved", []):
+            if "UNREAD" in item.get("labelIds", []):
+                read_changes[item["message"]["id"]] = True
+
+    # Mensagens que serão buscadas já trazem o estado de leitura atual
+    for msg_id in added:
+        read_changes.pop(msg_id, None)
+
+    return list(added), read_changes
 
 
 def send_email(
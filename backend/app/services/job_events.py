@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import ANALYSIS_EVENTS_POLL_INTERVAL, ANALYSIS_EVENTS_RETENTION
+from app.core.database import SessionLocal
+from app.models.analysis_event_model import AnalysisEvent
+from app.models.analysis_job_model import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+# Eventos acumulados por conexão antes de descartar (cliente lento demais)
+_QUEUE_SIZE = 1000
+# Intervalo entre limpezas de eventos antigos (s)
+_PRUNE_EVERY = 60
+# Janela (s) em que um evento ainda pode aparecer: ids são reservados no INSERT, mas o
+# commit de outro worker pode chegar depois de eventos de id maior já entregues
+_GRACE = 30
+
+
+def _progress_event(job: AnalysisJob) -> dict:
+    return {
+        "event": "progress",
+        "data": {
+            "job_id": job.id,
+            "status": job.status,
+            "total": job.total,
+            "done": job.done,
+            "errors": job.errors,
+        },
+    }
+
+
+def _result_event(event: AnalysisEvent) -> dict:
+    return {
+        "id": event.id,
+        "event": "result",
+        "data": {
+            "job_id": event.job_id,
+            "email_id": event.email_id,
+            "category": event.category,
+            "urgency": event.urgency,
+        },
+    }
+
+
+class JobEventBroker:
+    """
+    Distribui o progresso do analyze-all para as conexões SSE do processo.
+
+    Os workers gravam eventos no banco (podem estar em outros processos), e uma única
+    task asyncio por processo consulta as novidades a cada ANALYSIS_EVENTS_POLL_INTERVAL
+    e as entrega nas filas das conexões. Conexões ociosas custam só uma asyncio.Queue:
+    nenhuma thread e nenhuma consulta por conexão.
+
+    Não há marca d'água por id: cada consulta olha os eventos criados nos últimos
+    _GRACE segundos e entrega os que ainda não foram entregues, então um evento de id
+    menor commitado depois (outro worker, outra transação) não se perde.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._last_progress: dict[int, tuple] = {}
+        self._delivered: dict[int, datetime] = {}   # id -> created_at, dentro da janela
+        self._last_prune = 0.0
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        # Força o envio do progresso atual na próxima consulta (snapshot para a nova conexão)
+        self._last_progress.pop(user_id, None)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+            self._last_progress.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "connections": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(ANALYSIS_EVENTS_POLL_INTERVAL)
+            if not self._subscribers:
+                continue
+            try:
+                events = await run_in_threadpool(self._poll, list(self._subscribers))
+            except Exception as e:
+                logger.error("Falha ao consultar eventos do analyze-all: %s", str(e))
+                continue
+            for user_id, event in events:
+                for queue in self._subscribers.get(user_id, ()):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        pass  # o próximo "progress" traz os contadores acumulados
+
+    def _poll(self, user_ids: list[int]) -> list[tuple[int, dict]]:
+        """Consulta (numa thread do pool) os eventos novos e o progresso dos usuários conectados."""
+        db = SessionLocal()
+        try:
+            since = datetime.utcnow() - timedelta(seconds=_GRACE)
+            self._delivered = {
+                event_id: created_at for event_id, created_at in self._delivered.items() if created_at >= since
+            }
+            recent = (
+                db.query(AnalysisEvent.id)
+                .filter(AnalysisEvent.created_at >= since, AnalysisEvent.user_id.in_(user_ids))
+                .all()
+            )
+            new_ids = [event_id for (event_id,) in recent if event_id not in self._delivered]
+
+            out: list[tuple[int, dict]] = []
+            if new_ids:
+                rows = db.query(AnalysisEvent).filter(AnalysisEvent.id.in_(new_ids)).order_by(AnalysisEvent.id).all()
+                out.extend((row.user_id, _result_event(row)) for row in rows)
+                self._delivered.update((row.id, row.created_at) for row in rows)
+
+            latest_ids = (
+                db.query(func.max(AnalysisJob.id))
+                .filter(AnalysisJob.user_id.in_(user_ids))
+                .group_by(AnalysisJob.user_id)
+            )
+            for job in db.query(AnalysisJob).filter(AnalysisJob.id.in_(latest_ids)):
+                snapshot = (job.id, job.status, job.done, job.errors)
+                if self._last_progress.get(job.user_id) != snapshot:
+                    self._last_progress[job.user_id] = snapshot
+                    out.append((job.user_id, _progress_event(job)))
+
+            if time.monotonic() - self._last_prune > _PRUNE_EVERY:
+                self._last_prune = time.monotonic()
+                cutoff = datetime.utcnow() - timedelta(seconds=ANALYSIS_EVENTS_RETENTION)
+                db.query(AnalysisEvent).filter(AnalysisEvent.created_at < cutoff).delete(synchronize_session=False)
+                db.commit()
+            return out
+        finally:
+            db.close()
+
+
+def replay_events(user_id: int, after_id: int) -> list[dict]:
+    """Eventos "result" posteriores a after_id (reconexão com Last-Event-ID)."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(AnalysisEvent)
+            .filter(AnalysisEvent.user_id == user_id, AnalysisEvent.id > after_id)
+            .order_by(AnalysisEvent.id)
+            .all()
+        )
+        return [_result_event(row) for row in rows]
+    finally:
+        db.close()
+
+
+job_events = JobEventBroker()
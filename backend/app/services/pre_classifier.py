@@ -0,0 +1,337 @@
+"""
+Pré-classificador local: decide categoria e urgência de e-mails óbvios (marketing, spam)
+sem chamar a Gemini.
+
+Dois naive Bayes multinomiais (categoria e urgência) sobre as mesmas features com hash
+do índice de similaridade (palavras e pares de palavras de assunto e corpo limpo),
+treinados com as análises já feitas pela Gemini. Só análises da Gemini entram no
+treino, então o modelo nunca aprende com as próprias decisões.
+
+Naive Bayes é confiante demais, então a probabilidade sozinha não basta: 20% dos
+exemplos ficam de fora do treino e uma categoria só é liberada se, nesses exemplos,
+as previsões acima do limiar acertarem ao menos PRE_CLASSIFIER_MIN_PRECISION.
+
+Um único modelo para todos os usuários, por decisão: por usuário, quase ninguém teria
+PRE_CLASSIFIER_MIN_SAMPLES análises, e marketing e spam se parecem de uma caixa para
+outra. Os rótulos são da Gemini (nenhum usuário rotula nada), o modelo só guarda
+contagens em buckets de hash, e o que ele decide — categoria e urgência de categorias
+liberadas, resumo montado com o assunto do próprio e-mail — não leva texto da caixa de
+um usuário para outro. O efeito de uma caixa sobre as outras se limita a mexer nessas
+probabilidades, e a validação por precisão continua barrando categorias pouco confiáveis.
+
+O modelo é gravado em PRE_CLASSIFIER_PATH e recarregado pelos processos (API e workers)
+quando o arquivo muda. O treino roda periodicamente em run_retrainer ou com
+`python manage.py train-classifier`.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    PRE_CLASSIFIER_ENABLED,
+    PRE_CLASSIFIER_PATH,
+    PRE_CLASSIFIER_CATEGORIES,
+    PRE_CLASSIFIER_MIN_CONFIDENCE,
+    PRE_CLASSIFIER_MIN_URGENCY_CONFIDENCE,
+    PRE_CLASSIFIER_MIN_PRECISION,
+    PRE_CLASSIFIER_MIN_SAMPLES,
+    PRE_CLASSIFIER_MAX_SAMPLES,
+    PRE_CLASSIFIER_RETRAIN_INTERVAL,
+)
+from app.core.database import SessionLocal
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+from app.services.ai_service import FALLBACK_ANALYSIS, CATEGORIES, URGENCIES
+from app.services.similarity_index import text_features
+
+logger = logging.getLogger(__name__)
+
+_CATEGORY_LABELS = sorted(CATEGORIES)
+_URGENCY_LABELS = sorted(URGENCIES)
+_BUCKETS = 1 << 18
+# Suavização de Laplace (pequena: com 2^18 buckets, 1.0 achataria as probabilidades)
+_ALPHA = 0.1
+_HOLDOUT = 0.2
+# Previsões acima do limiar na validação necessárias para avaliar uma categoria
+_MIN_HOLDOUT_SUPPORT = 20
+# Frequência com que o retrainer confere a idade do modelo (s)
+_RETRAIN_CHECK = 300
+_SUMMARY_MAX = 160
+
+
+def _vectorize(subject: str | None, body: str | None) -> tuple[np.ndarray, np.ndarray]:
+    """(buckets, contagens) das features do e-mail; buckets podem repetir (colisões)."""
+    features = text_features(subject, body)
+    buckets = np.fromiter(
+        (zlib.crc32(feature.encode("utf-8")) % _BUCKETS for feature in features),
+        dtype=np.int64, count=len(features),
+    )
+    counts = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+    return buckets, counts
+
+
+class _NaiveBayes:
+    def __init__(self, log_prior: np.ndarray, log_likelihood: np.ndarray):
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+
+    @classmethod
+    def fit(cls, docs: list[tuple[np.ndarray, np.ndarray]], labels: list[int], classes: int) -> "_NaiveBayes":
+        counts = np.zeros((classes, _BUCKETS), dtype=np.float32)
+        docs_per_class = np.zeros(classes, dtype=np.float64)
+        for (buckets, values), label in zip(docs, labels):
+            np.add.at(counts[label], buckets, values)
+            docs_per_class[label] += 1
+        totals = counts.sum(axis=1, keepdims=True) + _ALPHA * _BUCKETS
+        log_likelihood = np.log((counts + _ALPHA) / totals).astype(np.float32)
+        log_prior = np.log((docs_per_class + 1) / (docs_per_class.sum() + classes))
+        return cls(log_prior, log_likelihood)
+
+    def predict(self, buckets: np.ndarray, values: np.ndarray) -> tuple[int, float]:
+        """(classe, probabilidade) mais provável."""
+        scores = self.log_prior + self.log_likelihood[:, buckets] @ values
+        scores = np.exp(scores - scores.max())
+        probabilities = scores / scores.sum()
+        best = int(probabilities.argmax())
+        return best, float(probabilities[best])
+
+
+class PreClassifier:
+    """Modelo carregado do disco sob demanda, com contadores de uso do processo."""
+
+    def __init__(self, path: str = PRE_CLASSIFIER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: float | None = None
+        self._model: tuple[_NaiveBayes, _NaiveBayes, dict] | None = None
+        self._predictions = 0
+        self._accepted = 0
+
+    def _current(self) -> tuple[_NaiveBayes, _NaiveBayes, dict] | None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with np.load(self.path, allow_pickle=False) as data:
+                        self._model = (
+                            _NaiveBayes(data["category_prior"], data["category_likelihood"]),
+                            _NaiveBayes(data["urgency_prior"], data["urgency_likelihood"]),
+                            json.loads(str(data["meta"])),
+                        )
+                except (OSError, KeyError, ValueError) as e:
+                    logger.error("Falha ao carregar o pré-classificador de %s: %s", self.path, str(e))
+                    self._model = None
+                self._mtime = mtime
+            return self._model
+
+    def classify(self, subject: str, body: str) -> dict | None:
+        """
+        Análise local quando o modelo está confiante numa categoria liberada; None caso
+        contrário (o e-mail segue para a Gemini). Sem resposta sugerida: são e-mails que
+        não pedem resposta.
+        """
+        if not PRE_CLASSIFIER_ENABLED:
+            return None
+        model = self._current()
+        if model is None or not model[2]["enabled"]:
+            return None
+        category_model, urgency_model, meta = model
+
+        buckets, values = _vectorize(subject, body)
+        if not len(buckets):
+            return None
+        category, category_confidence = category_model.predict(buckets, values)
+        urgency, urgency_confidence = urgency_model.predict(buckets, values)
+        accepted = (
+            _CATEGORY_LABELS[category] in meta["enabled"]
+            and category_confidence >= PRE_CLASSIFIER_MIN_CONFIDENCE
+            and urgency_confidence >= PRE_CLASSIFIER_MIN_URGENCY_CONFIDENCE
+        )
+        with self._lock:
+            self._predictions += 1
+            self._accepted += accepted
+        if not accepted:
+            return None
+
+        label = _CATEGORY_LABELS[category]
+        summary = f"{label.capitalize()}: {subject.strip()}" if subject and subject.strip() else label.capitalize()
+        return {
+            "summary": summary[:_SUMMARY_MAX],
+            "category": label,
+            "urgency": _URGENCY_LABELS[urgency],
+            "suggested_reply": "",
+            "source": "local",
+        }
+
+    def stats(self) -> dict:
+        model = self._current()
+        with self._lock:
+            return {
+                "enabled": PRE_CLASSIFIER_ENABLED,
+                "model": model[2] if model else None,
+                "predictions": self._predictions,
+                "gemini_calls_avoided": self._accepted,
+                "acceptance_rate": round(self._accepted / self._predictions, 3) if self._predictions else 0.0,
+            }
+
+
+pre_classifier = PreClassifier()
+
+
+def _training_rows(db: Session) -> list:
+    """Análises da Gemini mais recentes (as locais e as de fallback ficam de fora)."""
+    return (
+        db.query(Email.subject, Email.clean_body, EmailAnalysis.category, EmailAnalysis.urgency)
+        .join(EmailAnalysis, EmailAnalysis.email_id == Email.id)
+        .filter(
+            or_(EmailAnalysis.source.is_(None), EmailAnalysis.source == "gemini"),
+            EmailAnalysis.category.in_(_CATEGORY_LABELS),
+            EmailAnalysis.urgency.in_(_URGENCY_LABELS),
+            EmailAnalysis.summary != FALLBACK_ANALYSIS["summary"],
+        )
+        .order_by(EmailAnalysis.id.desc())
+        .limit(PRE_CLASSIFIER_MAX_SAMPLES)
+        .all()
+    )
+
+
+def _holdout_precision(
+    category_model: _NaiveBayes,
+    urgency_model: _NaiveBayes,
+    docs: list[tuple[np.ndarray, np.ndarray]],
+    categories: list[int],
+) -> dict[str, dict]:
+    """Por categoria: quantas previsões passariam dos limiares e quantas estariam certas."""
+    result = {label: {"predicted": 0, "correct": 0} for label in _CATEGORY_LABELS}
+    for (buckets, values), truth in zip(docs, categories):
+        if not len(buckets):
+            continue
+        category, confidence = category_model.predict(buckets, values)
+        _, urgency_confidence = urgency_model.predict(buckets, values)
+        if confidence >= PRE_CLASSIFIER_MIN_CONFIDENCE and urgency_confidence >= PRE_CLASSIFIER_MIN_URGENCY_CONFIDENCE:
+            result[_CATEGORY_LABELS[category]]["predicted"] += 1
+            result[_CATEGORY_LABELS[category]]["correct"] += category == truth
+    return result
+
+
+def train(db: Session, path: str = PRE_CLASSIFIER_PATH) -> dict | None:
+    """
+    Treina os dois modelos com as análises da Gemini e grava em `path` (troca atômica).
+    Retorna os metadados do modelo, ou None se ainda não há exemplos suficientes.
+    """
+    rows = _training_rows(db)
+    if len(rows) < PRE_CLASSIFIER_MIN_SAMPLES:
+        logger.info("Pré-classificador: %d análises, mínimo de %d para treinar.", len(rows), PRE_CLASSIFIER_MIN_SAMPLES)
+        return None
+
+    docs = [_vectorize(row.subject, row.clean_body) for row in rows]
+    categories = [_CATEGORY_LABELS.index(row.category) for row in rows]
+    urgencies = [_URGENCY_LABELS.index(row.urgency) for row in rows]
+
+    order = list(range(len(rows)))
+    random.Random(0).shuffle(order)
+    cut = int(len(order) * (1 - _HOLDOUT))
+    train_idx, holdout_idx = order[:cut], order[cut:]
+
+    category_model = _NaiveBayes.fit([docs[i] for i in train_idx], [categories[i] for i in train_idx], len(_CATEGORY_LABELS))
+    urgency_model = _NaiveBayes.fit([docs[i] for i in train_idx], [urgencies[i] for i in train_idx], len(_URGENCY_LABELS))
+
+    evaluation = _holdout_precision(
+        category_model, urgency_model, [docs[i] for i in holdout_idx], [categories[i] for i in holdout_idx],
+    )
+    precision = {
+        label: round(item["correct"] / item["predicted"], 3)
+        for label, item in evaluation.items() if item["predicted"]
+    }
+    enabled = [
+        label for label in PRE_CLASSIFIER_CATEGORIES
+        if evaluation.get(label, {}).get("predicted", 0) >= _MIN_HOLDOUT_SUPPORT
+        and precision[label] >= PRE_CLASSIFIER_MIN_PRECISION
+    ]
+
+    meta = {
+        "trained_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "samples": len(rows),
+        "holdout": len(holdout_idx),
+        "holdout_precision": precision,
+        "holdout_coverage": round(sum(item["predicted"] for item in evaluation.values()) / max(1, len(holdout_idx)), 3),
+        "enabled": enabled,
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            category_prior=category_model.log_prior,
+            category_likelihood=category_model.log_likelihood,
+            urgency_prior=urgency_model.log_prior,
+            urgency_likelihood=urgency_model.log_likelihood,
+            meta=np.array(json.dumps(meta)),
+        )
+    os.replace(tmp_path, path)
+    logger.info("Pré-classificador treinado com %d análises; categorias liberadas: %s", len(rows), enabled or "nenhuma")
+    return meta
+
+
+def _file_age(path: str) -> float:
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+def _attempt_path(path: str = PRE_CLASSIFIER_PATH) -> str:
+    """Marcador da última tentativa de treino, com ou sem modelo gravado."""
+    return f"{path}.attempt"
+
+
+def _mark_attempt(path: str = PRE_CLASSIFIER_PATH) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(_attempt_path(path), "a"):
+        pass
+    os.utime(_attempt_path(path))
+
+
+def run_retrainer(stop: threading.Event) -> None:
+    """
+    Retreina quando o modelo em disco fica mais velho que PRE_CLASSIFIER_RETRAIN_INTERVAL.
+    A idade é a do arquivo, então vários processos com retrainer não treinam em dobro.
+    Cada tentativa marca um arquivo ao lado do modelo: sem análises suficientes para
+    gravar um modelo, a próxima tentativa também espera o intervalo inteiro, em vez de
+    ler a tabela de análises a cada _RETRAIN_CHECK.
+    """
+    if not PRE_CLASSIFIER_ENABLED:
+        return
+    while True:
+        due = min(_file_age(PRE_CLASSIFIER_PATH), _file_age(_attempt_path()))
+        if due >= PRE_CLASSIFIER_RETRAIN_INTERVAL:
+            try:
+                _mark_attempt()
+            except OSError as e:
+                logger.error("Falha ao marcar a tentativa de treino do pré-classificador: %s", str(e))
+            db = SessionLocal()
+            try:
+                train(db)
+            except Exception as e:
+                logger.error("Falha ao treinar o pré-classificador: %s", str(e))
+            finally:
+                db.close()
+        if stop.wait(_RETRAIN_CHECK):
+            return
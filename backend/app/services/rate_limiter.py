@@ -0,0 +1,375 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import case, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.core.database import SessionLocal
+from app.models.rate_limit_model import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiUnavailableError(Exception):
+    """A Gemini não pode ser chamada agora (fila cheia ou circuit breaker aberto)."""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitTimeout(GeminiUnavailableError):
+    """A espera na fila do rate limiter passou do limite configurado."""
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    """O circuit breaker está aberto: a Gemini falhou seguidamente e está em cooldown."""
+
+
+class MemoryTokenBucket:
+    """Token bucket em memória, compartilhado por todas as threads do processo."""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self._rate = per_minute / 60.0
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def try_acquire(self, amount: float) -> float:
+        """Consome `amount` se houver saldo e retorna 0; senão retorna quantos segundos esperar."""
+        with self._lock:
+            paused = self._paused_until - time.monotonic()
+            if paused > 0:
+                return paused
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self._rate
+
+    def refund(self, amount: float) -> None:
+        """Devolve (ou, com valor negativo, cobra a mais) tokens ao bucket."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def drain(self) -> None:
+        with self._lock:
+            self._tokens = 0.0
+            self._updated_at = time.monotonic()
+
+    def pause(self, seconds: float) -> None:
+        """Nenhuma aquisição passa pelos próximos `seconds` segundos."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+
+class DatabaseTokenBucket:
+    """
+    Token bucket guardado na tabela rate_limit_buckets, compartilhado entre processos.
+    Usa controle de concorrência otimista: a atualização só vale se ninguém
+    tiver mexido na linha desde a leitura. A pausa de backoff (paused_until) também
+    fica na linha, para valer em todos os processos.
+    """
+
+    def __init__(self, name: str, capacity: float, per_minute: float):
+        self.name = name
+        self.capacity = capacity
+        self._rate = per_minute / 60.0
+
+    def try_acquire(self, amount: float) -> float:
+        for _ in range(5):
+            db = SessionLocal()
+            try:
+                row = db.get(RateLimitBucket, self.name)
+                now = time.time()
+                if row is None:
+                    db.add(RateLimitBucket(name=self.name, tokens=self.capacity - amount, updated_at=now))
+                    try:
+                        db.commit()
+                        return 0.0
+                    except IntegrityError:
+                        db.rollback()
+                        continue
+
+                if row.paused_until and row.paused_until > now:
+                    return row.paused_until - now
+                tokens = min(self.capacity, row.tokens + (now - row.updated_at) * self._rate)
+                if tokens < amount:
+                    return (amount - tokens) / self._rate
+
+                updated = (
+                    db.query(RateLimitBucket)
+                    .filter(RateLimitBucket.name == self.name, RateLimitBucket.updated_at == row.updated_at)
+                    .update({"tokens": tokens - amount, "updated_at": now}, synchronize_session=False)
+                )
+                db.commit()
+                if updated:
+                    return 0.0
+            finally:
+                db.close()
+
+        # Muita disputa pela linha: tenta de novo em instantes
+        return 0.05
+
+    def refund(self, amount: float) -> None:
+        db = SessionLocal()
+        try:
+            # Limitado à capacidade, como no MemoryTokenBucket (CASE em vez de min/LEAST,
+            # que mudam de nome entre SQLite e Postgres)
+            refunded = RateLimitBucket.tokens + amount
+            db.query(RateLimitBucket).filter(RateLimitBucket.name == self.name).update(
+                {"tokens": case((refunded > self.capacity, self.capacity), else_=refunded)},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def drain(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(RateLimitBucket).filter(RateLimitBucket.name == self.name).update(
+                {"tokens": 0.0, "updated_at": time.time()}, synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def pause(self, seconds: float) -> None:
+        until = time.time() + seconds
+        db = SessionLocal()
+        try:
+            # Só estende: uma pausa mais longa gravada por outro processo continua valendo
+            db.query(RateLimitBucket).filter(
+                RateLimitBucket.name == self.name,
+                or_(RateLimitBucket.paused_until.is_(None), RateLimitBucket.paused_until < until),
+            ).update({"paused_until": until}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def paused_for(self) -> float:
+        db = SessionLocal()
+        try:
+            row = db.get(RateLimitBucket, self.name)
+            return max(0.0, (row.paused_until or 0.0) - time.time()) if row is not None else 0.0
+        finally:
+            db.close()
+
+
+class CircuitBreaker:
+    """
+    Abre depois de `failure_threshold` falhas seguidas e fica aberto por `cooldown` segundos.
+    Em seguida deixa passar uma única chamada de teste (half-open): sucesso fecha o circuito,
+    falha reabre.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> float:
+        """Retorna 0 se a chamada pode seguir; senão, quantos segundos faltam para o próximo teste."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return 0.0
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return 0.0
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            return max(remaining, 1.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    logger.warning("Circuit breaker da Gemini aberto por %ds.", self.cooldown)
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Libera o teste half-open quando a chamada terminou sem indicar nada sobre a Gemini."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class GeminiLimiter:
+    """
+    Limita as chamadas à Gemini a `rpm` requisições e `tpm` tokens por minuto somando
+    todas as threads (backend "memory") ou todos os processos (backend "database").
+
+    Quem chama acquire() entra numa fila e espera sua vez por até `request_max_wait`
+    segundos — chamadas feitas dentro de requisições HTTP falham logo com Retry-After em
+    vez de segurar a thread do pool. Threads de background (worker do analyze-all), dentro
+    de `with limiter.background():`, esperam até `max_wait`. Com o circuit breaker aberto,
+    falha na hora (`breaker_mode="fail"`) ou espera na fila até o próximo teste
+    (`breaker_mode="queue"`, só em background).
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        max_wait: float,
+        breaker: CircuitBreaker,
+        request_max_wait: float | None = None,
+        breaker_mode: str = "fail",
+        backend: str = "memory",
+    ):
+        if backend == "database":
+            self._requests = DatabaseTokenBucket("gemini:requests", rpm, rpm)
+            self._tokens = DatabaseTokenBucket("gemini:tokens", tpm, tpm)
+        else:
+            self._requests = MemoryTokenBucket(rpm, rpm)
+            self._tokens = MemoryTokenBucket(tpm, tpm)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.backend = backend
+        self.max_wait = max_wait
+        self.request_max_wait = max_wait if request_max_wait is None else min(request_max_wait, max_wait)
+        self.breaker = breaker
+        self.breaker_mode = breaker_mode
+
+        self._background = threading.local()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._max_waiting = 0
+        self._acquired = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    @contextmanager
+    def background(self):
+        """Marca a thread atual como de background: pode esperar a cota por até max_wait."""
+        previous = getattr(self._background, "active", False)
+        self._background.active = True
+        try:
+            yield
+        finally:
+            self._background.active = previous
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Bloqueia até haver cota para uma requisição de `tokens` tokens.
+        Retorna quanto tempo (s) a chamada esperou na fila.
+        Lança CircuitOpenError ou RateLimitTimeout se não puder seguir.
+        """
+        tokens = min(tokens, self._tokens.capacity)
+        background = getattr(self._background, "active", False)
+        start = time.monotonic()
+        deadline = start + (self.max_wait if background else self.request_max_wait)
+
+        with self._lock:
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+        admitted = False  # já passou pelo circuit breaker nesta chamada
+        try:
+            while True:
+                wait = 0.0
+                if not admitted:
+                    wait = self.breaker.allow()
+                    if wait and (self.breaker_mode == "fail" or not background):
+                        self._reject()
+                        raise CircuitOpenError("Gemini temporariamente indisponível.", retry_after=wait)
+                    admitted = not wait
+
+                if not wait:
+                    wait = self._requests.try_acquire(1)
+                    if not wait:
+                        wait = self._tokens.try_acquire(tokens)
+                        if not wait:
+                            break
+                        self._requests.refund(1)
+
+                if time.monotonic() + wait > deadline:
+                    if admitted:
+                        self.breaker.release_probe()
+                    self._reject()
+                    raise RateLimitTimeout("Fila da Gemini cheia, tente novamente em instantes.", retry_after=wait)
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._acquired += 1
+            self._total_wait += waited
+            self._max_wait_seen = max(self._max_wait_seen, waited)
+        return waited
+
+    def _reject(self) -> None:
+        with self._lock:
+            self._rejected += 1
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Acerta o bucket de tokens com o consumo real informado pela API."""
+        if used and used != reserved:
+            self._tokens.refund(reserved - used)
+
+    def penalize(self, seconds: float, drain: bool = False) -> None:
+        """
+        Após uma falha, segura todas as chamadas por `seconds` em vez de cada uma tentar
+        sozinha (no backend "database", as de todos os processos). Com drain=True (429)
+        também zera a cota de tokens restante.
+        """
+        self._requests.pause(seconds)
+        if drain:
+            self._tokens.drain()
+
+    def stats(self) -> dict:
+        paused_for = self._requests.paused_for()
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "rpm_limit": self.rpm,
+                "tpm_limit": self.tpm,
+                "request_max_wait_s": self.request_max_wait,
+                "queue_depth": self._waiting,
+                "max_queue_depth": self._max_waiting,
+                "acquired": self._acquired,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / self._acquired * 1000) if self._acquired else 0,
+                "max_wait_ms": round(self._max_wait_seen * 1000),
+                "paused_for_s": round(paused_for, 1),
+                "circuit": self.breaker.state,
+            }
@@ -0,0 +1,312 @@
+"""
+Índice de busca textual (GET /emails/search) sobre assunto, remetente, corpo limpo e resumo da IA.
+
+- SQLite: tabela virtual FTS5 `email_search` (rowid = emails.id), ranking bm25 com pesos
+  por coluna e trechos com snippet()/highlight().
+- Postgres: tabela `email_search` com coluna tsvector gerada (dicionário portuguese),
+  índice GIN, ranking ts_rank_cd e trechos com ts_headline.
+
+O corpo fica comprimido em `emails` (CompressedText), então triggers no banco não
+conseguem indexá-lo: o índice é mantido pelo código na mesma transação que grava
+os e-mails (email_store.upsert_emails) e as análises (resumo).
+"""
+import html
+import logging
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Pesos do ranking: owner (filtro por usuário, não pontua), subject, sender, body, summary
+_SQLITE_RANK = "bm25(0.0, 10.0, 4.0, 1.0, 3.0)"
+# Marcadores internos dos trechos; viram <mark> depois do escape do HTML
+_OPEN, _CLOSE = "\x02", "\x03"
+# Termos considerados por consulta
+_MAX_TERMS = 16
+# Tamanho mínimo da última palavra para virar busca por prefixo
+_MIN_PREFIX = 3
+# E-mails por lote na reconstrução do índice
+_REBUILD_BATCH = 500
+
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS email_search USING fts5("
+    "owner, subject, sender, body, summary, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '3')"
+)
+
+_POSTGRES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS email_search (
+        email_id INTEGER PRIMARY KEY REFERENCES emails(id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL,
+        subject TEXT,
+        sender TEXT,
+        body TEXT,
+        summary TEXT,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('portuguese', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(sender, '')), 'B') ||
+            setweight(to_tsvector('portuguese', coalesce(summary, '')), 'B') ||
+            setweight(to_tsvector('portuguese', coalesce(body, '')), 'C')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_email_search_document ON email_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_email_search_user ON email_search (user_id)",
+]
+
+# None: ensure_schema ainda não rodou neste processo (ex: comandos do manage.py)
+_available: bool | None = None
+
+
+class SearchUnavailableError(Exception):
+    """O banco não suporta o índice de busca (ex: SQLite compilado sem FTS5)."""
+
+
+def _is_available(db: Session) -> bool:
+    """
+    Se o índice pode ser usado. Fora da API (que chama ensure_schema na inicialização),
+    descobre no primeiro uso se a tabela já existe, pela conexão da própria sessão:
+    criar a tabela aqui esbarraria no lock da transação de escrita em andamento.
+    """
+    global _available
+    if _available is None:
+        dialect = db.get_bind().dialect.name
+        _available = dialect in ("sqlite", "postgresql") and inspect(db.connection()).has_table("email_search")
+    return _available
+
+
+def ensure_schema(bind) -> bool:
+    """Cria o índice se ainda não existir. Retorna se a busca está disponível neste banco."""
+    global _available
+    dialect = bind.dialect.name
+    try:
+        with bind.begin() as conn:
+            if dialect == "sqlite":
+                created = not inspect(conn).has_table("email_search")
+                conn.execute(text(_SQLITE_DDL))
+                if created:
+                    # Configuração persistente: ORDER BY rank usa esses pesos
+                    conn.execute(
+                        text("INSERT INTO email_search(email_search, rank) VALUES ('rank', :rank)"),
+                        {"rank": _SQLITE_RANK},
+                    )
+            elif dialect == "postgresql":
+                for ddl in _POSTGRES_DDL:
+                    conn.execute(text(ddl))
+            else:
+                logger.warning("Busca textual não suportada no banco %s.", dialect)
+                _available = False
+                return False
+    except OperationalError as e:
+        logger.warning("Índice de busca indisponível: %s", str(e))
+        _available = False
+        return False
+
+    _available = True
+    return True
+
+
+def _document(user_id: int, email_id: int, subject, sender, body, summary) -> dict:
+    return {
+        "id": email_id,
+        "user_id": user_id,
+        "owner": f"u{user_id}",
+        "subject": subject or "",
+        "sender": sender or "",
+        "body": body or "",
+        "summary": summary or "",
+    }
+
+
+def _write_documents(db: Session, documents: list[dict]) -> None:
+    if not documents:
+        return
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = text(
+            "INSERT OR REPLACE INTO email_search (rowid, owner, subject, sender, body, summary) "
+            "VALUES (:id, :owner, :subject, :sender, :body, :summary)"
+        )
+    else:
+        stmt = text(
+            "INSERT INTO email_search (email_id, user_id, subject, sender, body, summary) "
+            "VALUES (:id, :user_id, :subject, :sender, :body, :summary) "
+            "ON CONFLICT (email_id) DO UPDATE SET subject = excluded.subject, sender = excluded.sender, "
+            "body = excluded.body, summary = excluded.summary"
+        )
+    db.execute(stmt, documents)
+
+
+def index_emails(db: Session, user_id: int, emails: list[dict]) -> None:
+    """
+    Indexa e-mails recém-inseridos. Cada item: {"id", "subject", "sender", "clean_body", "snippet"};
+    sem corpo ainda (só metadados), o snippet fica no lugar até index_bodies.
+    Não faz commit (roda na transação do upsert).
+    """
+    if not _is_available(db):
+        return
+    _write_documents(db, [
+        _document(user_id, e["id"], e.get("subject"), e.get("sender"), e.get("clean_body") or e.get("snippet"), None)
+        for e in emails
+    ])
+
+
+def index_bodies(db: Session, bodies: list[tuple[int, str | None]]) -> None:
+    """Troca o texto de e-mails já indexados pelo corpo baixado sob demanda: [(email_id, clean_body)]. Não faz commit."""
+    if not bodies or not _is_available(db):
+        return
+    key = "rowid" if db.get_bind().dialect.name == "sqlite" else "email_id"
+    db.execute(
+        text(f"UPDATE email_search SET body = :body WHERE {key} = :id"),
+        [{"id": email_id, "body": body or ""} for email_id, body in bodies],
+    )
+
+
+def index_summaries(db: Session, summaries: list[tuple[int, str | None]]) -> None:
+    """Atualiza o resumo da IA de e-mails já indexados: [(email_id, summary)]. Não faz commit."""
+    if not summaries or not _is_available(db):
+        return
+    key = "rowid" if db.get_bind().dialect.name == "sqlite" else "email_id"
+    db.execute(
+        text(f"UPDATE email_search SET summary = :summary WHERE {key} = :id"),
+        [{"id": email_id, "summary": summary or ""} for email_id, summary in summaries],
+    )
+
+
+def index_missing(db: Session, rebuild: bool = False) -> int:
+    """
+    Indexa os e-mails que ainda não estão no índice (bancos anteriores à busca, ou
+    todos com rebuild=True). Faz commit a cada lote. Retorna quantos foram indexados.
+    """
+    if not _is_available(db):
+        return 0
+
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    if rebuild:
+        db.execute(text("DELETE FROM email_search"))
+        db.commit()
+
+    not_indexed = text(f"emails.id NOT IN (SELECT {'rowid' if sqlite else 'email_id'} FROM email_search)")
+    total = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(
+                Email.id, Email.user_id, Email.subject, Email.sender, Email.snippet, Email.clean_body,
+                EmailAnalysis.summary,
+            )
+            .outerjoin(EmailAnalysis, EmailAnalysis.email_id == Email.id)
+            .filter(Email.id > last_id, not_indexed)
+            .order_by(Email.id)
+            .limit(_REBUILD_BATCH)
+            .all()
+        )
+        if not rows:
+            return total
+        _write_documents(db, [
+            _document(row.user_id, row.id, row.subject, row.sender, row.clean_body or row.snippet, row.summary)
+            for row in rows
+        ])
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+
+
+def _marked(value: str | None) -> str | None:
+    """Escapa o HTML do trecho e troca os marcadores internos por <mark>."""
+    if value is None:
+        return None
+    return html.escape(value).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _fts5_query(user_id: int, query: str) -> str | None:
+    """
+    Monta a expressão MATCH a partir do texto livre do usuário: cada palavra vira uma
+    frase entre aspas (nada da sintaxe FTS5 passa adiante), a última com prefixo
+    (busca enquanto digita), e tudo restrito aos documentos do usuário.
+    """
+    terms = re.findall(r"\w+", query)[:_MAX_TERMS]
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    # Prefixos curtos expandem para milhares de termos fora do índice de prefixos (prefix = '3')
+    if len(terms[-1]) >= _MIN_PREFIX:
+        phrases[-1] += "*"
+    return f"owner : u{user_id} AND {{subject sender body summary}} : ({' '.join(phrases)})"
+
+
+def _search_sqlite(db: Session, user_id: int, query: str, limit: int, offset: int) -> list[dict]:
+    match = _fts5_query(user_id, query)
+    if match is None:
+        return []
+    # ORDER BY rank (e não bm25(...)): o FTS5 ordena internamente e só calcula
+    # snippet()/highlight() das linhas devolvidas, não de todos os resultados
+    rows = db.execute(
+        text(
+            "SELECT rowid AS email_id, -rank AS score, "
+            "highlight(email_search, 1, :open, :close) AS subject, "
+            "highlight(email_search, 2, :open, :close) AS sender, "
+            "snippet(email_search, 3, :open, :close, '…', 24) AS snippet, "
+            "highlight(email_search, 4, :open, :close) AS summary "
+            "FROM email_search WHERE email_search MATCH :match "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "open": _OPEN, "close": _CLOSE, "limit": limit, "offset": offset},
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def _search_postgres(db: Session, user_id: int, query: str, limit: int, offset: int) -> list[dict]:
+    options = f"StartSel={_OPEN}, StopSel={_CLOSE}"
+    rows = db.execute(
+        text(
+            "WITH q AS (SELECT websearch_to_tsquery('portuguese', :query) AS query), "
+            "top AS ("
+            "  SELECT s.email_id, ts_rank_cd(s.document, q.query) AS score "
+            "  FROM email_search s, q WHERE s.user_id = :user_id AND s.document @@ q.query "
+            "  ORDER BY score DESC LIMIT :limit OFFSET :offset"
+            ") "
+            "SELECT top.email_id, top.score, "
+            "ts_headline('portuguese', s.subject, q.query, :hl_all) AS subject, "
+            "ts_headline('simple', s.sender, q.query, :hl_all) AS sender, "
+            "ts_headline('portuguese', s.body, q.query, :hl_snippet) AS snippet, "
+            "ts_headline('portuguese', s.summary, q.query, :hl_all) AS summary "
+            "FROM top JOIN email_search s ON s.email_id = top.email_id, q "
+            "ORDER BY top.score DESC"
+        ),
+        {
+            "query": query,
+            "user_id": user_id,
+            "limit": limit,
+            "offset": offset,
+            "hl_all": f"{options}, HighlightAll=true",
+            "hl_snippet": f"{options}, MaxFragments=2, MaxWords=24, MinWords=8, FragmentDelimiter=\" … \"",
+        },
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def search(db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0) -> list[dict]:
+    """
+    Busca nos e-mails do usuário, do mais relevante para o menos.
+    Retorna [{"email_id", "score", "subject", "sender", "snippet", "summary"}], com os
+    campos de texto em HTML escapado e os termos encontrados dentro de <mark>.
+    """
+    if not _is_available(db):
+        raise SearchUnavailableError()
+
+    if db.get_bind().dialect.name == "sqlite":
+        hits = _search_sqlite(db, user_id, query, limit, offset)
+    else:
+        hits = _search_postgres(db, user_id, query, limit, offset)
+
+    for hit in hits:
+        for field in ("subject", "sender", "snippet", "summary"):
+            hit[field] = _marked(hit[field]) or None
+    return hits
@@ -0,0 +1,255 @@
+"""
+Índice vetorial local para "e-mails parecidos" (GET /emails/{id}/similar).
+
+Cada e-mail vira um vetor float32 de SIMILARITY_DIM posições por feature hashing de
+assunto e corpo limpo (palavras e pares de palavras, tf sublinear, sinal por hash
+para compensar colisões, norma L2 = 1). Nada sai da máquina: não há modelo nem rede.
+
+Os vetores de cada usuário ficam em SIMILARITY_INDEX_DIR, em dois arquivos só de
+acréscimo: `user_<id>.<dim>.vec` (matriz N x dim) e `user_<id>.<dim>.ids` (email_id de
+cada linha). A matriz é lida com np.memmap, então só as páginas usadas ocupam memória
+e vários processos compartilham o cache do sistema de arquivos. A busca é um produto
+matriz-vetor (cosseno, já que os vetores são normalizados) seguido de argpartition.
+
+Os arquivos não participam da transação do banco: quem grava e-mails usa
+add_on_commit, que só escreve no índice depois do commit (e descarta num rollback),
+para o índice nunca apontar para linhas que não existem.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import SIMILARITY_INDEX_DIR, SIMILARITY_DIM
+from app.models.email_model import Email
+
+try:
+    import fcntl
+except ImportError:   # Windows: só o lock entre threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[^\W\d_]{3,}")
+# Palavras frequentes demais para diferenciar e-mails (pt e en)
+_STOPWORDS = frozenset(
+    "que com para por uma mais como mas foi sao ser tem seu sua nos das dos nas aos "
+    "esta este essa esse isso aqui voce voces ele ela eles elas pelo pela sobre entre "
+    "ate quando muito tambem ja nao sim ou the and for you your with this that are "
+    "from have has was will our not can all but any".split()
+)
+# O assunto resume o e-mail: pesa mais que cada palavra do corpo
+_SUBJECT_WEIGHT = 2.0
+_BIGRAM_WEIGHT = 0.5
+# E-mails por lote ao indexar a caixa existente
+_INDEX_BATCH = 500
+
+
+def _tokens(text: str | None) -> list[str]:
+    if not text:
+        return []
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return [token for token in _TOKEN.findall(stripped) if token not in _STOPWORDS]
+
+
+def text_features(subject: str | None, body: str | None) -> Counter:
+    """Palavras e pares de palavras de assunto (com peso maior) e corpo, com suas contagens."""
+    features: Counter = Counter()
+    for text, weight in ((subject, _SUBJECT_WEIGHT), (body, 1.0)):
+        tokens = _tokens(text)
+        for token in tokens:
+            features[token] += weight
+        for first, second in zip(tokens, tokens[1:]):
+            features[f"{first} {second}"] += weight * _BIGRAM_WEIGHT
+    return features
+
+
+def embed(subject: str | None, body: str | None, dim: int = SIMILARITY_DIM) -> np.ndarray:
+    """Vetor float32 normalizado (ou zerado, se não houver texto) de assunto + corpo limpo."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in text_features(subject, body).items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vector[h % dim] += sign * (1.0 + math.log(count))
+    norm = float(np.linalg.norm(vector))
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SimilarityIndex:
+    """Índices por usuário em disco, com a matriz de cada um mapeada em memória sob demanda."""
+
+    def __init__(self, directory: str = SIMILARITY_INDEX_DIR, dim: int = SIMILARITY_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._locks: dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # user_id -> (tamanho dos arquivos quando carregados, ids, matriz)
+        self._loaded: dict[int, tuple[tuple[int, int], np.ndarray, np.ndarray]] = {}
+
+    def _paths(self, user_id: int) -> tuple[str, str]:
+        base = os.path.join(self.directory, f"user_{user_id}.{self.dim}")
+        return base + ".ids", base + ".vec"
+
+    def _lock(self, user_id: int) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def add(self, user_id: int, emails: list[tuple[int, str | None, str | None]]) -> None:
+        """
+        Acrescenta [(email_id, assunto, corpo_limpo)] ao índice do usuário. Erros de disco
+        só são registrados: o índice é derivado e se refaz com manage.py rebuild-similar.
+        """
+        if not emails:
+            return
+        ids = np.array([email_id for email_id, _, _ in emails], dtype=np.int64)
+        vectors = np.stack([embed(subject, body, self.dim) for _, subject, body in emails])
+        ids_path, vec_path = self._paths(user_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock(user_id), open(ids_path, "ab") as ids_file:
+                if fcntl is not None:
+                    fcntl.flock(ids_file, fcntl.LOCK_EX)   # outros processos da API
+                # Vetores antes dos ids: quem lê no meio do caminho só vê linhas completas
+                with open(vec_path, "ab") as vec_file:
+                    vec_file.write(vectors.tobytes())
+                ids_file.write(ids.tobytes())
+        except OSError as e:
+            logger.error("Falha ao gravar o índice de similaridade (user_id=%d): %s", user_id, str(e))
+
+    def add_on_commit(self, db: Session, user_id: int, emails: list[tuple[int, str | None, str | None]]) -> None:
+        """Como add, mas só depois do próximo commit de db; um rollback descarta os e-mails."""
+        if emails:
+            db.info.setdefault(_PENDING_KEY, []).append((self, user_id, emails))
+
+    def _load(self, user_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """(ids, matriz mapeada) do usuário; recarrega só se os arquivos cresceram."""
+        ids_path, vec_path = self._paths(user_id)
+        try:
+            sizes = (os.path.getsize(ids_path), os.path.getsize(vec_path))
+        except OSError:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+
+        cached = self._loaded.get(user_id)
+        if cached and cached[0] == sizes:
+            return cached[1], cached[2]
+
+        rows = min(sizes[0] // 8, sizes[1] // (4 * self.dim))
+        if rows == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        ids = np.fromfile(ids_path, dtype=np.int64, count=rows)
+        vectors = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self._loaded[user_id] = (sizes, ids, vectors)
+        return ids, vectors
+
+    def indexed_ids(self, user_id: int) -> set[int]:
+        return set(self._load(user_id)[0].tolist())
+
+    def similar(
+        self,
+        user_id: int,
+        email_id: int,
+        limit: int = 10,
+        min_score: float = 0.0,
+        text: tuple[str | None, str | None] | None = None,
+    ) -> list[tuple[int, float]] | None:
+        """
+        Os `limit` e-mails mais parecidos com email_id, [(email_id, cosseno)] do maior
+        para o menor. Se o e-mail ainda não estiver no índice, usa `text` (assunto, corpo)
+        para montar o vetor; sem ele, retorna None.
+        """
+        ids, vectors = self._load(user_id)
+        rows = np.flatnonzero(ids == email_id)
+        if rows.size:
+            query = np.asarray(vectors[rows[-1]])
+        elif text is not None:
+            query = embed(*text, dim=self.dim)
+        else:
+            return None
+        if not ids.size or not query.any():
+            return []
+
+        scores = np.asarray(vectors @ query)
+        scores[ids == email_id] = -np.inf
+
+        # Folga para ids repetidos (e-mail indexado duas vezes por syncs concorrentes)
+        candidates = min(len(scores), 2 * limit + 1)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+
+        results: list[tuple[int, float]] = []
+        seen: set[int] = set()
+        for row in top:
+            score = float(scores[row])
+            other = int(ids[row])
+            if score <= min_score or other in seen:
+                continue
+            seen.add(other)
+            results.append((other, score))
+            if len(results) == limit:
+                break
+        return results
+
+    def drop(self, user_id: int) -> None:
+        """Apaga o índice do usuário (antes de reconstruir)."""
+        with self._lock(user_id):
+            self._loaded.pop(user_id, None)
+            for path in self._paths(user_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+similarity_index = SimilarityIndex()
+
+# Chave em Session.info com os acréscimos de add_on_commit ainda não commitados
+_PENDING_KEY = "similarity_index_pending"
+
+
+@event.listens_for(Session, "after_commit")
+def _add_committed(session: Session) -> None:
+    for index, user_id, emails in session.info.pop(_PENDING_KEY, []):
+        index.add(user_id, emails)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def index_missing(db: Session, user_id: int | None = None) -> int:
+    """
+    Acrescenta ao índice os e-mails que ainda não estão nele (caixas anteriores ao
+    recurso, ou depois de um drop). E-mails só com metadados esperam o corpo ser
+    baixado (body_hydration). Retorna quantos foram indexados.
+    """
+    user_ids = [user_id] if user_id else [row[0] for row in db.query(Email.user_id).distinct()]
+    total = 0
+    for uid in user_ids:
+        indexed = similarity_index.indexed_ids(uid)
+        missing = [
+            email_id for (email_id,) in
+            db.query(Email.id).filter(Email.user_id == uid, Email.body_loaded.isnot(False)).order_by(Email.id)
+            if email_id not in indexed
+        ]
+        for start in range(0, len(missing), _INDEX_BATCH):
+            rows = (
+                db.query(Email.id, Email.subject, Email.clean_body)
+                .filter(Email.id.in_(missing[start:start + _INDEX_BATCH]))
+                .order_by(Email.id)
+                .all()
+            )
+            similarity_index.add(uid, [(row.id, row.subject, row.clean_body) for row in rows])
+            total += len(rows)
+    return total
@@ -0,0 +1,236 @@
+import hashlib
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+from app.models.user_model import User
+from app.models.user_stats_model import UserStatCounter
+from app.models.email_rollup_model import DailyEmailRollup
+
+logger = logging.getLogger(__name__)
+
+
+def _add(db: Session, model, keys: dict, column: str, delta: int) -> None:
+    """
+    Upsert atômico "column = column + delta" na linha identificada por keys (a PK),
+    seguro com syncs e análises simultâneas.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(model).values(**keys, **{column: delta})
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + getattr(stmt.excluded, column)},
+        ))
+        return
+
+    result = db.execute(
+        update(model)
+        .where(*(getattr(model, name) == value for name, value in keys.items()))
+        .values({column: getattr(model, column) + delta})
+    )
+    if not result.rowcount:
+        db.add(model(**keys, **{column: delta}))
+        db.flush()
+
+
+def increment(db: Session, user_id: int, deltas: dict[str, int]) -> None:
+    """Soma os deltas aos contadores do usuário, um upsert atômico por chave. Não faz commit."""
+    for key, delta in deltas.items():
+        if delta:
+            _add(db, UserStatCounter, {"user_id": user_id, "key": key}, "value", delta)
+
+
+def increment_daily(db: Session, user_id: int, deltas: dict[tuple[date, str, str], int]) -> None:
+    """Soma os deltas aos buckets diários {(dia, categoria, urgência): delta}. Não faz commit."""
+    for (day, category, urgency), delta in deltas.items():
+        if delta:
+            _add(
+                db, DailyEmailRollup,
+                {"user_id": user_id, "day": day, "category": category, "urgency": urgency},
+                "count", delta,
+            )
+
+
+def record_new_emails(db: Session, user_id: int, rows: list) -> None:
+    """
+    Contabiliza e-mails recém-inseridos (linhas com date e is_read): total, não lidos
+    e o bucket diário ainda sem análise. Não faz commit.
+    """
+    daily = Counter((row.date.date(), "", "") for row in rows if row.date)
+    increment(db, user_id, {"total": len(rows), "unread": sum(not row.is_read for row in rows)})
+    increment_daily(db, user_id, daily)
+
+
+def record_analyses(db: Session, user_id: int, items: list[tuple[datetime | None, dict]]) -> None:
+    """
+    Contabiliza análises recém-gravadas [(data do e-mail, resultado)]: contadores de
+    categoria/urgência e a mudança do e-mail do bucket "sem análise" para o analisado.
+    Não faz commit.
+    """
+    counters = Counter()
+    daily = Counter()
+    for email_date, result in items:
+        counters[f"category:{result['category']}"] += 1
+        counters[f"urgency:{result['urgency']}"] += 1
+        if email_date:
+            daily[(email_date.date(), "", "")] -= 1
+            daily[(email_date.date(), result["category"], result["urgency"])] += 1
+    increment(db, user_id, counters)
+    increment_daily(db, user_id, daily)
+
+
+def read_stats(db: Session, user_id: int) -> dict:
+    """Monta a resposta do dashboard a partir dos contadores (uma consulta por PK)."""
+    counters = {
+        row.key: row.value
+        for row in db.query(UserStatCounter.key, UserStatCounter.value).filter(UserStatCounter.user_id == user_id)
+    }
+    by_category = {key.split(":", 1)[1]: value for key, value in counters.items() if key.startswith("category:") and value}
+    by_urgency = {key.split(":", 1)[1]: value for key, value in counters.items() if key.startswith("urgency:") and value}
+    return {
+        "total_emails": counters.get("total", 0),
+        "unread": counters.get("unread", 0),
+        "by_category": by_category,
+        "by_urgency": by_urgency,
+    }
+
+
+def stats_etag(stats: dict) -> str:
+    """ETag forte derivado dos valores dos contadores: muda sempre que algum contador muda."""
+    canonical = repr(sorted(
+        [("total", stats["total_emails"]), ("unread", stats["unread"])]
+        + [(f"category:{k}", v) for k, v in stats["by_category"].items()]
+        + [(f"urgency:{k}", v) for k, v in stats["by_urgency"].items()]
+    ))
+    return '"' + hashlib.sha1(canonical.encode()).hexdigest()[:20] + '"'
+
+
+def _compute_counters(db: Session, user_id: int) -> dict[str, int]:
+    """Recalcula os contadores do zero com as consultas agregadas (caminho lento)."""
+    counters = {
+        "total": db.query(func.count(Email.id)).filter(Email.user_id == user_id).scalar(),
+        "unread": db.query(func.count(Email.id)).filter(Email.user_id == user_id, Email.is_read == False).scalar(),
+    }
+    for column, prefix in ((EmailAnalysis.category, "category"), (EmailAnalysis.urgency, "urgency")):
+        rows = (
+            db.query(column, func.count(EmailAnalysis.id))
+            .join(Email, Email.id == EmailAnalysis.email_id)
+            .filter(Email.user_id == user_id)
+            .group_by(column)
+        )
+        counters.update({f"{prefix}:{value}": total for value, total in rows})
+    return counters
+
+
+def _compute_daily(db: Session, user_id: int) -> dict[tuple[date, str, str], int]:
+    """Recalcula os buckets diários agrupando os e-mails por dia, categoria e urgência."""
+    day = func.date(Email.date)
+    category = func.coalesce(EmailAnalysis.category, "")
+    urgency = func.coalesce(EmailAnalysis.urgency, "")
+    rows = (
+        db.query(day, category, urgency, func.count(Email.id))
+        .outerjoin(EmailAnalysis, EmailAnalysis.email_id == Email.id)
+        .filter(Email.user_id == user_id, Email.date.isnot(None))
+        .group_by(day, category, urgency)
+    )
+    # func.date devolve texto no SQLite e date no Postgres
+    return {
+        (date.fromisoformat(d) if isinstance(d, str) else d, c, u): total
+        for d, c, u, total in rows
+    }
+
+
+def rebuild_stats(db: Session, user_id: int) -> dict[str, int]:
+    """
+    Substitui os contadores e os buckets diários do usuário pelos valores recalculados
+    (corrige drift). Incrementos concorrentes durante a reconstrução podem se perder —
+    rode de novo se preciso. Não faz commit. Retorna os contadores.
+    """
+    counters = _compute_counters(db, user_id)
+    daily = _compute_daily(db, user_id)
+    db.query(UserStatCounter).filter(UserStatCounter.user_id == user_id).delete(synchronize_session=False)
+    db.query(DailyEmailRollup).filter(DailyEmailRollup.user_id == user_id).delete(synchronize_session=False)
+    db.add_all([UserStatCounter(user_id=user_id, key=key, value=value) for key, value in counters.items()])
+    db.add_all([
+        DailyEmailRollup(user_id=user_id, day=d, category=c, urgency=u, count=total)
+        for (d, c, u), total in daily.items()
+    ])
+    db.flush()
+    return counters
+
+
+def initialize_missing_stats(db: Session) -> int:
+    """
+    Cria os contadores e buckets diários de usuários que já tinham e-mails antes deles
+    existirem. Roda no startup; retorna quantos usuários foram inicializados.
+    """
+    with_counters = db.query(UserStatCounter.user_id).filter(UserStatCounter.key == "total")
+    with_rollups = db.query(DailyEmailRollup.user_id)
+    with_dated_emails = db.query(Email.user_id).filter(Email.date.isnot(None))
+    user_ids = [
+        row.id for row in
+        db.query(User.id).filter(or_(
+            User.id.notin_(with_counters),
+            and_(User.id.in_(with_dated_emails), User.id.notin_(with_rollups)),
+        )).all()
+    ]
+    for user_id in user_ids:
+        rebuild_stats(db, user_id)
+        db.commit()
+    if user_ids:
+        logger.info("Contadores do dashboard inicializados para %d usuário(s)", len(user_ids))
+    return len(user_ids)
+
+
+def _bucket_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())   # semana começa na segunda
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def read_timeseries(db: Session, user_id: int, start: date, end: date, granularity: str) -> list[dict]:
+    """
+    Série temporal [start, end] a partir dos buckets diários, somados em semanas ou
+    meses quando pedido. Custo proporcional a dias × combinações, não ao tamanho da caixa.
+    """
+    rows = (
+        db.query(DailyEmailRollup.day, DailyEmailRollup.category, DailyEmailRollup.urgency, DailyEmailRollup.count)
+        .filter(
+            DailyEmailRollup.user_id == user_id,
+            DailyEmailRollup.day >= start,
+            DailyEmailRollup.day <= end,
+            DailyEmailRollup.count != 0,
+        )
+        .all()
+    )
+
+    buckets: dict[date, dict] = {}
+    for day, category, urgency, count in rows:
+        bucket = buckets.setdefault(_bucket_start(day, granularity), {
+            "total": 0, "by_category": Counter(), "by_urgency": Counter(),
+        })
+        bucket["total"] += count
+        if category:
+            bucket["by_category"][category] += count
+        if urgency:
+            bucket["by_urgency"][urgency] += count
+
+    return [
+        {
+            "period": period.isoformat(),
+            "total": bucket["total"],
+            "by_category": dict(bucket["by_category"]),
+            "by_urgency": dict(bucket["by_urgency"]),
+        }
+        for period, bucket in sorted(buckets.items())
+    ]
@@ -0,0 +1,150 @@
+"""
+Análise por conversa (thread do Gmail).
+
+Numa cadeia de respostas, cada mensagem repete o histórico citado das anteriores;
+analisadas uma a uma, o texto enviado à Gemini cresce de forma quadrática com a
+conversa. Aqui cada chamada leva só o resumo corrente da conversa (ThreadSummary,
+no máximo THREAD_SUMMARY_MAX_TOKENS) e o conteúdo novo das mensagens ainda não
+incorporadas a ele (corpo limpo menos as linhas já vistas em mensagens anteriores),
+em lotes que cabem em AI_BATCH_TOKEN_BUDGET. A resposta traz a análise de cada
+mensagem e o resumo atualizado, gravado para a próxima vez — o prompt fica limitado
+a resumo + um lote, por maior que a conversa fique.
+"""
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+
+from app.core.config import AI_BATCH_TOKEN_BUDGET, THREAD_SUMMARY_MAX_TOKENS
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+from app.models.thread_summary_model import ThreadSummary
+from app.services.ai_service import analyze_thread_messages, pack_batches
+from app.services.email_preprocessing import clean_email_body, strip_seen_lines, truncate_to_tokens
+from app.services import stats_store, search_index, body_hydration
+
+
+def thread_messages(db: Session, user_id: int, thread_id: str, bodies: bool = False) -> list[Email]:
+    """Mensagens da conversa em ordem cronológica (sem data primeiro, empate pelo id)."""
+    query = db.query(Email).filter(Email.user_id == user_id, Email.thread_id == thread_id)
+    if bodies:
+        query = query.options(undefer(Email.clean_body))
+    emails = query.all()
+    return sorted(emails, key=lambda email: (email.date or datetime.min, email.id))
+
+
+def _set_summary(db: Session, user_id: int, thread_id: str, summary: str, last_email_id: int, folded: int) -> ThreadSummary:
+    state = db.get(ThreadSummary, (user_id, thread_id))
+    if state is None:
+        state = ThreadSummary(user_id=user_id, thread_id=thread_id, message_count=0)
+        db.add(state)
+    state.summary = summary
+    state.last_email_id = last_email_id
+    state.message_count = folded
+    return state
+
+
+def _store_chunk(
+    db: Session,
+    user_id: int,
+    thread_id: str,
+    analyses: list[tuple[Email, dict]],
+    summary: str,
+    last_email_id: int,
+    folded: int,
+) -> bool:
+    """
+    Grava as análises novas de um lote e o resumo atualizado em um único commit.
+    Retorna False se as análises não foram gravadas (só o resumo).
+    """
+    try:
+        db.add_all([
+            EmailAnalysis(
+                email_id=email.id,
+                summary=result["summary"],
+                category=result["category"],
+                urgency=result["urgency"],
+                suggested_reply=result["suggested_reply"],
+                source=result.get("source", "gemini"),
+            )
+            for email, result in analyses
+        ])
+        db.flush()
+        stats_store.record_analyses(db, user_id, [(email.date, result) for email, result in analyses])
+        search_index.index_summaries(db, [(email.id, result["summary"]) for email, result in analyses])
+        _set_summary(db, user_id, thread_id, summary, last_email_id, folded)
+        db.commit()
+        return True
+    except IntegrityError:
+        # Conversa analisada por outra requisição nesse meio tempo: ficam as análises
+        # dela; as que faltarem entram na próxima chamada (não têm análise)
+        db.rollback()
+        _set_summary(db, user_id, thread_id, summary, last_email_id, folded)
+        db.commit()
+        return False
+
+
+def analyze_thread(db: Session, user_id: int, thread_id: str) -> tuple[ThreadSummary | None, list[Email], set[int]]:
+    """
+    Incorpora ao resumo da conversa as mensagens que ainda não estão nele e analisa as
+    que ainda não têm análise. Cada lote é gravado ao terminar, então uma falha da
+    Gemini (GeminiUnavailableError) no meio preserva o que já foi feito. Corpos ainda
+    não baixados são buscados no Gmail antes (BodyFetchError se falhar).
+
+    Retorna (resumo, mensagens da conversa, ids analisados agora); resumo None e lista
+    vazia se a conversa não existir para o usuário.
+    """
+    emails = thread_messages(db, user_id, thread_id, bodies=True)
+    if not emails:
+        return None, [], set()
+    # Sync só de metadados: baixa de uma vez os corpos que faltam na conversa
+    if any(email.body_loaded is False for email in emails):
+        body_hydration.hydrate(db, user_id, [email.id for email in emails if email.body_loaded is False])
+        emails = thread_messages(db, user_id, thread_id, bodies=True)
+
+    analyzed = {
+        email_id for (email_id,) in
+        db.query(EmailAnalysis.email_id).filter(EmailAnalysis.email_id.in_([email.id for email in emails]))
+    }
+    state = db.get(ThreadSummary, (user_id, thread_id))
+    summary, folded, cursor = "", 0, 0
+    positions = {email.id: position for position, email in enumerate(emails)}
+    if state is not None and state.last_email_id in positions:
+        summary, folded = state.summary or "", state.message_count
+        cursor = positions[state.last_email_id] + 1
+
+    # Conteúdo novo de cada mensagem: as linhas já vistas nas anteriores saem
+    seen: set[str] = set()
+    pending: list[dict] = []
+    for position, email in enumerate(emails):
+        if email.body_loaded is False:
+            continue   # o Gmail não devolveu o corpo; entra numa próxima chamada
+        if email.clean_body is None:
+            email.clean_body = clean_email_body(email.body)
+        new_content = strip_seen_lines(email.clean_body, seen)
+        # Mensagem que chegou fora de ordem (antes do cursor) e nunca foi analisada também entra
+        if position >= cursor or email.id not in analyzed:
+            pending.append({"id": email.id, "subject": "", "sender": email.sender or "", "body": new_content})
+
+    subject = emails[0].subject or ""
+    by_id = {email.id: email for email in emails}
+    done: set[int] = set()
+    for chunk in pack_batches(pending, token_budget=max(1, AI_BATCH_TOKEN_BUDGET - THREAD_SUMMARY_MAX_TOKENS)):
+        results, new_summary = analyze_thread_messages(subject, summary, chunk, THREAD_SUMMARY_MAX_TOKENS)
+        if new_summary is not None:
+            summary = truncate_to_tokens(new_summary.strip(), THREAD_SUMMARY_MAX_TOKENS)
+        # Mensagens antes do cursor, reenviadas só por não terem análise, não contam de novo
+        folded += sum(1 for message in chunk if positions[message["id"]] >= cursor)
+        # O cursor só avança: mensagens fora de ordem não o fazem voltar
+        last_id = max((message["id"] for message in chunk), key=positions.get)
+        if cursor and positions[last_id] < cursor:
+            last_id = emails[cursor - 1].id
+        fresh = [(by_id[email_id], result) for email_id, result in results.items() if email_id not in analyzed]
+        if _store_chunk(db, user_id, thread_id, fresh, summary, last_id, folded):
+            analyzed.update(email.id for email, _ in fresh)
+            done.update(email.id for email, _ in fresh)
+        cursor = max(cursor, positions[last_id] + 1)
+
+    if not pending:
+        return state, emails, done
+    return db.get(ThreadSummary, (user_id, thread_id)), emails, done
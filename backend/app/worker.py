@@ -0,0 +1,48 @@
+"""
+Worker dedicado da fila de análises (analyze-all).
+
+Uso (a partir de backend/):
+    python -m app.worker              # um worker
+    python -m app.worker --threads 4  # quatro workers no mesmo processo
+
+Rode quantos processos quiser contra o mesmo banco; cada job é reivindicado por um
+único worker via lease. Com workers dedicados, desligue o embutido na API com
+ANALYSIS_WORKER_EMBEDDED=false.
+"""
+import argparse
+import logging
+import signal
+import threading
+
+# Importar a aplicação registra todos os models e cria/atualiza as tabelas
+from app import main  # noqa: F401
+from app.services.analysis_jobs import new_worker_id, run_worker
+from app.services.pre_classifier import run_retrainer
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=1, help="workers neste processo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # SIGTERM/SIGINT: o job em andamento volta para a fila e o processo sai
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=run_worker, args=(stop, new_worker_id()), name=f"analysis-worker-{i}")
+        for i in range(max(1, args.threads))
+    ]
+    # Retreino periódico do pré-classificador (o arquivo do modelo é compartilhado com a API)
+    threads.append(threading.Thread(target=run_retrainer, args=(stop,), name="pre-classifier"))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,88 @@
+"""
+Benchmark: chamadas e tokens de entrada da Gemini com um prompt por e-mail vs. prompts em lote.
+
+Não chama a Gemini: monta os prompts que seriam enviados e estima os tokens
+(~4 caracteres por token, a mesma estimativa usada pelo rate limiter).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_ai_batch                 # corpus sintético
+    python -m benchmarks.bench_ai_batch --from-db 500   # e-mails reais do banco local
+"""
+import argparse
+import random
+
+from app.core.config import AI_BATCH_TOKEN_BUDGET, AI_BATCH_MAX_EMAILS
+from app.services.ai_service import (
+    _build_prompt,
+    _build_batch_prompt,
+    _estimate_tokens,
+    pack_batches,
+)
+
+_SENTENCES = [
+    "Segue em anexo o relatório do mês.",
+    "Sua fatura está disponível para pagamento.",
+    "Aproveite 30% de desconto em toda a loja até domingo!",
+    "Podemos marcar uma reunião amanhã às 10h?",
+    "Seu pedido foi enviado e chega em 3 dias úteis.",
+    "Obrigado pelo contato, retornaremos em breve.",
+]
+
+
+def _synthetic_corpus(count: int) -> list[dict]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": i,
+            "subject": f"Assunto {i}",
+            "body": " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(2, 30))),
+        }
+        for i in range(count)
+    ]
+
+
+def _db_corpus(limit: int) -> list[dict]:
+    from app.core.database import SessionLocal
+    from app.models.email_model import Email
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Email.id, Email.subject, Email.body).filter(Email.body.isnot(None)).limit(limit).all()
+        return [{"id": r.id, "subject": r.subject or "", "body": r.body} for r in rows]
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500, help="tamanho do corpus sintético")
+    parser.add_argument("--from-db", type=int, metavar="N", help="usa até N e-mails do banco local")
+    args = parser.parse_args()
+
+    emails = _db_corpus(args.from_db) if args.from_db else _synthetic_corpus(args.count)
+    if not emails:
+        print("Nenhum e-mail encontrado.")
+        return
+
+    single_calls = len(emails)
+    single_tokens = sum(_estimate_tokens(_build_prompt(e["subject"], e["body"])) for e in emails)
+
+    batches = pack_batches(emails)
+    batch_calls = len(batches)
+    batch_tokens = sum(
+        _estimate_tokens(_build_prompt(b[0]["subject"], b[0]["body"]) if len(b) == 1 else _build_batch_prompt(b))
+        for b in batches
+    )
+
+    print(f"e-mails: {len(emails)}  orçamento={AI_BATCH_TOKEN_BUDGET} tokens  máx/lote={AI_BATCH_MAX_EMAILS}\n")
+    print(f"{'modo':>8} | {'chamadas':>8} | {'tokens entrada':>14}")
+    print("-" * 37)
+    print(f"{'single':>8} | {single_calls:>8} | {single_tokens:>14}")
+    print(f"{'batch':>8} | {batch_calls:>8} | {batch_tokens:>14}")
+    print()
+    print(f"chamadas economizadas: {single_calls - batch_calls} ({1 - batch_calls / single_calls:.0%})")
+    print(f"tokens economizados:   {single_tokens - batch_tokens} ({1 - batch_tokens / single_tokens:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: tamanho do banco e latência da listagem com corpos comprimidos e adiados.
+
+Compara o esquema antigo (corpo em texto puro, listagem carregando a linha inteira)
+com o atual (corpo comprimido com zlib e fora da consulta da listagem).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_body_storage
+    python -m benchmarks.bench_body_storage --emails 20000 --queries 500
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, create_engine
+from sqlalchemy.orm import declarative_base, load_only, sessionmaker
+
+from app.core.database import Base
+from app.models.user_model import User
+from app.models.email_model import Email
+import app.models.email_analysis_model  # noqa: F401 — registra o relacionamento Email.analysis
+
+from benchmarks.report_preprocessing import _NEWSLETTER, _REPLY_CHAIN, _PLAIN
+
+_LIST_COLUMNS = ("id", "gmail_id", "subject", "sender", "snippet", "date", "is_read")
+
+LegacyBase = declarative_base()
+
+
+class LegacyEmail(LegacyBase):
+    """Tabela emails como era antes: corpo em Text e sem adiamento."""
+    __tablename__ = "emails"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, index=True)
+    gmail_id = Column(String, unique=True)
+    subject = Column(String)
+    sender = Column(String)
+    snippet = Column(Text)
+    body = Column(Text)
+    clean_body = Column(Text)
+    date = Column(DateTime, index=True)
+    is_read = Column(Integer, default=0)
+
+
+def _rows(emails: int) -> list[dict]:
+    bodies = [_NEWSLETTER, _REPLY_CHAIN, _PLAIN]
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "user_id": 1,
+            "gmail_id": f"bench{i}",
+            "subject": f"Assunto {i}",
+            "sender": "remetente@example.com",
+            "snippet": "Lorem ipsum dolor sit amet",
+            "body": bodies[i % 3],
+            "clean_body": "Aproveite até 40% de desconto em eletrônicos selecionados.",
+            "date": start + timedelta(minutes=i),
+            "is_read": False,
+        }
+        for i in range(emails)
+    ]
+
+
+def _measure(path: str, model, metadata, list_options, emails: int, queries: int) -> dict:
+    engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    if model is Email:
+        db.add(User(id=1, email="bench@example.com", google_id="bench", access_token="x"))
+    rows = _rows(emails)
+    for start in range(0, len(rows), 1000):
+        db.bulk_insert_mappings(model, rows[start:start + 1000])
+    db.commit()
+    db.close()
+
+    timings = []
+    for _ in range(queries):
+        db = Session()
+        started = time.perf_counter()
+        items = (
+            db.query(model)
+            .options(*list_options)
+            .filter(model.user_id == 1)
+            .order_by(model.date.desc())
+            .limit(50)
+            .all()
+        )
+        for item in items:
+            item.subject  # serialização só usa colunas do cabeçalho
+        timings.append((time.perf_counter() - started) * 1000)
+        db.close()
+
+    engine.dispose()
+    timings.sort()
+    return {
+        "size_mb": os.path.getsize(path) / 1_000_000,
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200, help="listagens de 50 e-mails medidas")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    legacy = _measure(
+        os.path.join(tmpdir, "antigo.db"), LegacyEmail, LegacyBase.metadata, [],
+        args.emails, args.queries,
+    )
+    current = _measure(
+        os.path.join(tmpdir, "atual.db"), Email, Base.metadata,
+        [load_only(*(getattr(Email, name) for name in _LIST_COLUMNS))],
+        args.emails, args.queries,
+    )
+
+    print(f"{args.emails} e-mails, {args.queries} listagens de 50\n")
+    print(f"{'esquema':>10} | {'banco (MB)':>10} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    print("-" * 48)
+    for name, result in (("antigo", legacy), ("atual", current)):
+        print(f"{name:>10} | {result['size_mb']:>10.1f} | {result['p50']:>9.2f} | {result['p95']:>9.2f}")
+    print(f"\nbanco {1 - current['size_mb'] / legacy['size_mb']:.0%} menor")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark: vazão de leituras e escritas concorrentes no banco.
+
+Threads escritoras gravam análises em transações curtas (como o analyze-all)
+enquanto threads leitoras executam a listagem da inbox (como GET /emails/).
+Para SQLite, compara o engine padrão do SQLAlchemy com o engine ajustado
+(WAL, synchronous=NORMAL, busy_timeout, mmap).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_database                                   # SQLite temporário
+    python -m benchmarks.bench_database --url postgresql+psycopg2://u:s@localhost/bench
+
+O benchmark apaga e recria todas as tabelas do banco, então --url só aceita um banco
+descartável: o nome do banco (ou do arquivo SQLite) precisa conter "bench" e não pode
+ser o DATABASE_URL da aplicação.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, joinedload
+
+from app.core.config import DATABASE_URL
+from app.core.database import Base, create_db_engine
+from app.models.user_model import User
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+
+
+def _seed(Session, emails: int) -> int:
+    db = Session()
+    try:
+        user = User(email="bench@example.com", google_id="bench", access_token="x")
+        db.add(user)
+        db.flush()
+        start = datetime(2024, 1, 1)
+        db.add_all([
+            Email(
+                user_id=user.id,
+                gmail_id=f"bench{i}",
+                subject=f"Assunto {i}",
+                sender="remetente@example.com",
+                snippet="Lorem ipsum dolor sit amet",
+                body="<p>Lorem ipsum dolor sit amet</p>" * 50,
+                date=start + timedelta(minutes=i),
+            )
+            for i in range(emails)
+        ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def _scratch_url(url: str) -> str:
+    """Recusa URLs que não sejam de um banco de benchmark (o _run apaga todas as tabelas)."""
+    parsed = make_url(url)
+    name = os.path.basename(parsed.database or "")
+    if make_url(DATABASE_URL) == parsed or "bench" not in name.lower():
+        raise SystemExit(
+            f"Recusando --url {parsed.render_as_string(hide_password=True)}: o benchmark apaga todas as "
+            "tabelas, use um banco descartável com \"bench\" no nome (ex: .../bench)."
+        )
+    return url
+
+
+def _run(engine, emails: int, writers: int, readers: int, duration: float) -> dict:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    user_id = _seed(Session, emails)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+    next_email = iter(range(1, emails + 1))
+
+    def writer():
+        db = Session()
+        try:
+            while time.monotonic() < stop:
+                with lock:
+                    email_id = next(next_email, None)
+                if email_id is None:
+                    return
+                try:
+                    db.add(EmailAnalysis(email_id=email_id, summary="Resumo", category="outro", urgency="baixa"))
+                    db.commit()
+                    with lock:
+                        counts["writes"] += 1
+                except Exception:
+                    db.rollback()
+                    with lock:
+                        counts["errors"] += 1
+        finally:
+            db.close()
+
+    def reader():
+        db = Session()
+        try:
+            while time.monotonic() < stop:
+                try:
+                    (
+                        db.query(Email)
+                        .options(joinedload(Email.analysis))
+                        .filter(Email.user_id == user_id)
+                        .order_by(Email.date.desc())
+                        .limit(20)
+                        .all()
+                    )
+                    db.rollback()  # encerra a transação de leitura
+                    with lock:
+                        counts["reads"] += 1
+                except Exception:
+                    db.rollback()
+                    with lock:
+                        counts["errors"] += 1
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    engine.dispose()
+    return {k: v / elapsed if k != "errors" else v for k, v in counts.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL do banco (padrão: SQLite temporário)")
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="segundos por cenário")
+    args = parser.parse_args()
+
+    scenarios = []
+    if args.url:
+        scenarios.append(("ajustado", create_db_engine(_scratch_url(args.url))))
+    else:
+        tmpdir = tempfile.mkdtemp()
+        default_url = f"sqlite:///{os.path.join(tmpdir, 'padrao.db')}"
+        tuned_url = f"sqlite:///{os.path.join(tmpdir, 'ajustado.db')}"
+        scenarios.append(("sqlite padrão", create_engine(default_url, connect_args={"check_same_thread": False})))
+        scenarios.append(("sqlite ajustado", create_db_engine(tuned_url)))
+
+    print(f"{args.writers} escritoras, {args.readers} leitoras, {args.duration:.0f}s por cenário\n")
+    print(f"{'cenário':>16} | {'leituras/s':>10} | {'escritas/s':>10} | {'erros':>5}")
+    print("-" * 52)
+    for name, engine in scenarios:
+        result = _run(engine, args.emails, args.writers, args.readers, args.duration)
+        print(f"{name:>16} | {result['reads']:>10.0f} | {result['writes']:>10.0f} | {result['errors']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: N sincronizações simultâneas em threads (gmail_service) vs. asyncio (gmail_async).
+
+Sobe um servidor fake da Gmail API com latência artificial e dispara `--users`
+buscas dos últimos e-mails ao mesmo tempo (listagem + lote, o trabalho de uma
+sincronização completa): o caminho síncrono usa um pool de threads (como o threadpool
+do FastAPI, 40 workers por padrão) e o async usa asyncio.gather sobre o
+httpx.AsyncClient compartilhado.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_gmail_async --users 10 100 500 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_gmail_server import FakeGmail, start_server
+
+
+def _run_threads(gmail, gmail_service, users: int, workers: int, max_results: int) -> tuple[float, int]:
+    peak = threading.active_count()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(gmail_service.fetch_emails, "fake-token", None, max_results=max_results)
+            for _ in range(users)
+        ]
+        peak = max(peak, threading.active_count())
+        for future in futures:
+            emails = future.result()
+            assert len(emails) == max_results
+            gmail.assert_intact(emails)
+    return time.perf_counter() - start, peak
+
+
+async def _run_async(gmail, gmail_async, users: int, max_results: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        gmail_async.fetch_emails_async("fake-token", None, max_results=max_results)
+        for _ in range(users)
+    ))
+    elapsed = time.perf_counter() - start
+    for emails in results:
+        assert len(emails) == max_results
+        gmail.assert_intact(emails)
+    peak = threading.active_count()
+    await gmail_async.aclose()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="latência por requisição HTTP")
+    parser.add_argument("--max-results", type=int, default=20, help="e-mails por sincronização")
+    parser.add_argument("--threads", type=int, default=40, help="tamanho do pool de threads do caminho síncrono")
+    args = parser.parse_args()
+
+    gmail = FakeGmail(args.max_results, latency=args.latency_ms / 1000)
+    server = start_server(gmail)
+
+    # As variáveis precisam estar definidas antes de importar os serviços
+    os.environ["GMAIL_API_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}/"
+    from app.services import gmail_service, gmail_async
+
+    print(f"latência={args.latency_ms:.0f}ms  e-mails/sync={args.max_results}  pool={args.threads} threads\n")
+    print(f"{'usuários':>9} | {'threads (s)':>11} | {'threads vivas':>13} | {'async (s)':>9} | {'threads vivas':>13} | {'ganho':>6}")
+    print("-" * 78)
+
+    for users in args.users:
+        threaded, threaded_peak = _run_threads(gmail, gmail_service, users, args.threads, args.max_results)
+        async_elapsed, async_peak = asyncio.run(_run_async(gmail, gmail_async, users, args.max_results))
+        print(
+            f"{users:>9} | {threaded:>11.3f} | {threaded_peak:>13} | "
+            f"{async_elapsed:>9.3f} | {async_peak:>13} | {threaded / async_elapsed:>5.1f}x"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: busca sequencial (um messages.get por e-mail) vs. batch HTTP API.
+
+Sobe um servidor fake da Gmail API com latência artificial e mede o tempo de
+parede de fetch_emails para diferentes quantidades de mensagens.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_gmail_fetch --counts 20 100 500 --latency-ms 30
+"""
+import argparse
+import os
+import time
+
+from benchmarks.fake_gmail_server import FakeGmail, start_server
+
+
+def _sequential_fetch(gmail_service, access_token: str, max_results: int) -> int:
+    """Reproduz o caminho antigo: messages.list + um messages.get por mensagem."""
+    service = gmail_service._build_gmail_service(access_token, None)
+    result = service.users().messages().list(
+        userId="me", maxResults=max_results, labelIds=["INBOX"],
+    ).execute()
+    emails = []
+    for msg in result.get("messages", []):
+        params = {"metadataHeaders": gmail_service.METADATA_HEADERS} if gmail_service.SYNC_FORMAT == "metadata" else {}
+        msg_data = service.users().messages().get(
+            userId="me", id=msg["id"], format=gmail_service.SYNC_FORMAT, **params,
+        ).execute()
+        emails.append(gmail_service.parse_message(msg_data, with_body=gmail_service.SYNC_FORMAT == "full"))
+    return len(emails)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="latência por requisição HTTP")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    gmail = FakeGmail(max(args.counts), latency=args.latency_ms / 1000)
+    server = start_server(gmail)
+
+    # As variáveis precisam estar definidas antes de importar o serviço
+    os.environ["GMAIL_API_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}/"
+    os.environ["GMAIL_BATCH_SIZE"] = str(args.batch_size)
+    from app.services import gmail_service
+
+    print(f"latência={args.latency_ms:.0f}ms  batch_size={args.batch_size}\n")
+    print(f"{'mensagens':>10} | {'sequencial (s)':>14} | {'req':>5} | {'batch (s)':>10} | {'req':>5} | {'ganho':>6}")
+    print("-" * 66)
+
+    for count in args.counts:
+        gmail.http_requests = 0
+        start = time.perf_counter()
+        fetched = _sequential_fetch(gmail_service, "fake-token", count)
+        sequential = time.perf_counter() - start
+        sequential_requests = gmail.http_requests
+        assert fetched == count
+
+        gmail.http_requests = 0
+        start = time.perf_counter()
+        emails = gmail_service.fetch_emails("fake-token", None, max_results=count)
+        batched = time.perf_counter() - start
+        batched_requests = gmail.http_requests
+        assert len(emails) == count
+        gmail.assert_intact(emails)
+
+        print(
+            f"{count:>10} | {sequential:>14.3f} | {sequential_requests:>5} | "
+            f"{batched:>10.3f} | {batched_requests:>5} | {sequential / batched:>5.1f}x"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: sync com corpo completo (format="full") vs. só metadados (format="metadata").
+
+Sobe o servidor fake da Gmail API com mensagens HTML de `--paragraphs` parágrafos e
+mede, para cada quantidade de mensagens, o tempo de parede e os bytes recebidos da
+listagem + busca em lote (o que o sync e cada página da importação fazem), incluindo
+a decodificação das partes MIME. Também mede o custo de abrir um e-mail depois
+(hydrate de uma mensagem) e do prefetcher (um lote de BODY_PREFETCH_BATCH).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_metadata_sync
+    python -m benchmarks.bench_metadata_sync --counts 100 500 --paragraphs 200 --latency-ms 30
+"""
+import argparse
+import os
+import time
+
+from benchmarks.fake_gmail_server import FakeGmail, start_server
+
+
+def _sync(gmail_service, service, count: int, fmt: str) -> int:
+    """Listagem + busca em lote no formato fmt, como gmail_service._list_and_fetch."""
+    result = gmail_service._list_page(service, count)
+    message_ids = [msg["id"] for msg in result.get("messages", [])]
+    messages, _ = gmail_service._fetch_messages(service, message_ids, fmt)
+    emails = [gmail_service.parse_message(msg_data, with_body=fmt == "full") for msg_data in messages]
+    return len(emails)
+
+
+def _measure(gmail: FakeGmail, fn) -> tuple[float, int]:
+    gmail.bytes_sent = 0
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start, gmail.bytes_sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--paragraphs", type=int, default=200, help="tamanho do corpo HTML (~60 bytes por parágrafo)")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="latência por requisição HTTP")
+    args = parser.parse_args()
+
+    gmail = FakeGmail(max(args.counts), latency=args.latency_ms / 1000, paragraphs=args.paragraphs)
+    server = start_server(gmail)
+
+    # As variáveis precisam estar definidas antes de importar o serviço
+    os.environ["GMAIL_API_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}/"
+    from app.core.config import BODY_PREFETCH_BATCH
+    from app.services import gmail_service
+    service = gmail_service._build_gmail_service("fake-token", None)
+
+    print(f"latência={args.latency_ms:.0f}ms  corpo≈{args.paragraphs * 60 / 1000:.0f} KB de HTML\n")
+    print(f"{'mensagens':>10} | {'full (s)':>9} | {'full (KB)':>10} | {'metadata (s)':>12} | "
+          f"{'metadata (KB)':>13} | {'tempo':>6} | {'banda':>6}")
+    print("-" * 86)
+    for count in args.counts:
+        full_time, full_bytes = _measure(gmail, lambda: _sync(gmail_service, service, count, "full"))
+        meta_time, meta_bytes = _measure(gmail, lambda: _sync(gmail_service, service, count, "metadata"))
+        print(
+            f"{count:>10} | {full_time:>9.3f} | {full_bytes / 1000:>10.0f} | {meta_time:>12.3f} | "
+            f"{meta_bytes / 1000:>13.0f} | {full_time / meta_time:>5.1f}x | {full_bytes / max(1, meta_bytes):>5.1f}x"
+        )
+
+    ids = [m["id"] for m in gmail.messages]
+    open_time, open_bytes = _measure(gmail, lambda: gmail_service.fetch_bodies("fake-token", None, None, ids[:1]))
+    batch_time, batch_bytes = _measure(
+        gmail, lambda: gmail_service.fetch_bodies("fake-token", None, None, ids[:BODY_PREFETCH_BATCH]),
+    )
+    print(f"\nabrir um e-mail sem corpo: {open_time * 1000:.0f} ms, {open_bytes / 1000:.0f} KB")
+    print(f"uma rodada do prefetcher ({BODY_PREFETCH_BATCH} corpos): {batch_time * 1000:.0f} ms, "
+          f"{batch_bytes / 1000:.0f} KB")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
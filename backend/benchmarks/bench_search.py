@@ -0,0 +1,128 @@
+"""
+Benchmark: latência do GET /emails/search (search_index.search) em uma caixa grande.
+
+Cria um banco SQLite temporário com `--emails` e-mails para o usuário medido (mais
+e-mails de outros usuários no mesmo índice), preenche o índice com index_missing
+e mede p50/p95 de buscas típicas: palavra comum, palavra rara, várias palavras e
+prefixo (busca enquanto digita). Vocabulário com distribuição de Zipf, como texto real.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --emails 100000 --other-users 3 --queries 50
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, create_db_engine
+from app.models.user_model import User
+from app.models.email_model import Email
+from app.models.email_analysis_model import EmailAnalysis
+from app.services import search_index
+
+_COMMON = (
+    "reunião orçamento projeto cliente fatura entrega prazo contrato relatório viagem "
+    "pagamento nota fiscal equipe proposta pedido compra venda agenda semana amanhã "
+    "segunda sexta atualização aprovação documento anexo revisão suporte acesso conta"
+).split()
+
+_QUERIES = {
+    "comum": "reunião",
+    "rara": "xk4821",
+    "várias palavras": "fatura pagamento atrasado",
+    "prefixo": "orçam",
+}
+
+
+def _vocabulary(size: int) -> tuple[list[str], list[float]]:
+    words = _COMMON + [f"xk{i}" for i in range(size - len(_COMMON))]
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def _populate(Session, emails: int, other_users: int, rng: random.Random) -> None:
+    words, weights = _vocabulary(20000)
+
+    def text(k: int) -> str:
+        return " ".join(rng.choices(words, weights, k=k))
+
+    db = Session()
+    users = [1] + [2 + i for i in range(other_users)]
+    for user_id in users:
+        db.add(User(id=user_id, email=f"bench{user_id}@example.com", google_id=f"bench{user_id}", access_token="x"))
+    db.commit()
+
+    start = datetime(2024, 1, 1)
+    email_id = 0
+    for user_id in users:
+        count = emails if user_id == 1 else emails // 5
+        for offset in range(0, count, 1000):
+            rows, analyses = [], []
+            for i in range(offset, min(offset + 1000, count)):
+                email_id += 1
+                rows.append({
+                    "id": email_id,
+                    "user_id": user_id,
+                    "gmail_id": f"bench{email_id}",
+                    "subject": text(6),
+                    "sender": f"Contato {i % 500} <contato{i % 500}@example.com>",
+                    "snippet": "",
+                    "clean_body": text(200),
+                    "date": start + timedelta(minutes=i),
+                    "is_read": True,
+                })
+                if i % 2:
+                    analyses.append({"email_id": email_id, "summary": text(25), "category": "trabalho", "urgency": "baixa"})
+            db.bulk_insert_mappings(Email, rows)
+            db.bulk_insert_mappings(EmailAnalysis, analyses)
+            db.commit()
+    db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=100000, help="e-mails do usuário medido")
+    parser.add_argument("--other-users", type=int, default=2, help="outros usuários (emails/5 cada) no mesmo índice")
+    parser.add_argument("--queries", type=int, default=50, help="repetições por busca")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "busca.db")
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    if not search_index.ensure_schema(engine):
+        raise SystemExit("SQLite sem FTS5: busca indisponível.")
+    Session = sessionmaker(bind=engine)
+
+    started = time.perf_counter()
+    _populate(Session, args.emails, args.other_users, random.Random(42))
+    db = Session()
+    indexed = search_index.index_missing(db)
+    db.close()
+    print(f"{indexed} e-mails indexados em {time.perf_counter() - started:.1f}s "
+          f"(banco: {os.path.getsize(path) / 1_000_000:.0f} MB)\n")
+
+    print(f"{'busca':>16} | {'consulta':>26} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    print("-" * 70)
+    for name, query in _QUERIES.items():
+        timings = []
+        for _ in range(args.queries):
+            db = Session()
+            t0 = time.perf_counter()
+            hits = search_index.search(db, 1, query, limit=21)
+            timings.append((time.perf_counter() - t0) * 1000)
+            db.close()
+        timings.sort()
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        print(f"{name:>16} | {query:>26} | {statistics.median(timings):>9.2f} | {p95:>9.2f}   ({len(hits)} resultados)")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: latência do top-k de e-mails parecidos (similarity_index) numa caixa grande.
+
+Gera `--emails` e-mails sintéticos de `--topics` assuntos (cada assunto com seu
+vocabulário, mais palavras comuns a todos), grava o índice numa pasta temporária e
+mede p50/p95 de SimilarityIndex.similar com o arquivo já no cache do sistema. Também
+reporta a precisão do top-k: fração dos vizinhos que são do mesmo assunto.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_similar
+    python -m benchmarks.bench_similar --emails 100000 --dim 512 --k 10
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.services.similarity_index import SimilarityIndex
+
+_SHARED = (
+    "olá bom dia segue informação obrigado equipe favor verificar abaixo mensagem "
+    "assunto retorno possível hoje amanhã semana dúvidas qualquer coisa"
+).split()
+
+
+def _synthetic(emails: int, topics: int, rng: random.Random) -> tuple[list[tuple[int, str, str]], list[int]]:
+    vocabularies = [[f"t{topic}p{i}" for i in range(40)] for topic in range(topics)]
+    items, labels = [], []
+    for email_id in range(1, emails + 1):
+        topic = rng.randrange(topics)
+        words = vocabularies[topic]
+        subject = " ".join(rng.choices(words, k=4))
+        body = " ".join(rng.choice(words) if rng.random() < 0.4 else rng.choice(_SHARED) for _ in range(120))
+        items.append((email_id, subject, body))
+        labels.append(topic)
+    return items, labels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=100000)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    items, labels = _synthetic(args.emails, args.topics, rng)
+    index = SimilarityIndex(tempfile.mkdtemp(), dim=args.dim)
+
+    started = time.perf_counter()
+    for start in range(0, len(items), 1000):
+        index.add(1, items[start:start + 1000])
+    build = time.perf_counter() - started
+    size_mb = sum(os.path.getsize(path) for path in index._paths(1)) / 1_000_000
+    print(f"{args.emails} vetores de {args.dim} dimensões: {size_mb:.0f} MB, indexados em {build:.1f}s "
+          f"({build / args.emails * 1000:.2f} ms/e-mail)\n")
+
+    index.similar(1, 1, args.k)   # mapeia o arquivo e aquece o cache
+    timings, precision = [], []
+    for _ in range(args.queries):
+        email_id = rng.randrange(1, args.emails + 1)
+        t0 = time.perf_counter()
+        matches = index.similar(1, email_id, args.k)
+        timings.append((time.perf_counter() - t0) * 1000)
+        same = sum(labels[other - 1] == labels[email_id - 1] for other, _ in matches)
+        precision.append(same / max(1, len(matches)))
+
+    timings.sort()
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"top-{args.k}: p50 {statistics.median(timings):.2f} ms | p95 {p95:.2f} ms | "
+          f"precisão (mesmo assunto) {statistics.mean(precision):.0%}")
+
+
+if __name__ == "__main__":
+    main()
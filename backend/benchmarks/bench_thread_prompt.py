@@ -0,0 +1,81 @@
+"""
+Benchmark: tokens enviados à Gemini para analisar uma conversa longa, mensagem a
+mensagem (modo atual) e por conversa (thread_analysis), sem chamar a API.
+
+Gera uma thread sintética de `--messages` respostas em que cada uma cita o histórico
+inteiro. Parte das citações vem no formato do Gmail ("Em ... escreveu:", que o
+pré-processamento já corta) e parte sem cabeçalho reconhecível (encaminhamentos e
+clientes que só colam o texto), que só a remoção de linhas repetidas pega. O resumo
+corrente é simulado com o tamanho máximo (THREAD_SUMMARY_MAX_TOKENS).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_thread_prompt
+    python -m benchmarks.bench_thread_prompt --messages 100 --unrecognized 0.5
+"""
+import argparse
+import random
+
+from app.core.config import AI_BATCH_TOKEN_BUDGET, AI_BODY_TOKEN_BUDGET, THREAD_SUMMARY_MAX_TOKENS
+from app.services.ai_service import _build_prompt, _build_thread_prompt, _estimate_tokens, pack_batches
+from app.services.email_preprocessing import clean_email_body, strip_seen_lines
+
+_WORDS = (
+    "reunião orçamento projeto cliente fatura entrega prazo contrato relatório proposta "
+    "pedido agenda semana amanhã revisão aprovação documento anexo equipe pagamento"
+).split()
+
+
+def _thread(messages: int, unrecognized: float, rng: random.Random) -> list[str]:
+    bodies, history = [], ""
+    for i in range(messages):
+        new = "\n".join(" ".join(rng.choices(_WORDS, k=12)) + f" ({i}.{line})" for line in range(4))
+        if not history:
+            body = new
+        elif rng.random() < unrecognized:
+            body = f"{new}\n\n________________________________\n{history}"
+        else:
+            body = f"{new}\n\nEm seg., 3 de jun. de 2024 às 10:{i % 60:02d}, Fulano <fulano@example.com> escreveu:\n{history}"
+        bodies.append(body)
+        history = body
+    return bodies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--unrecognized", type=float, default=0.3, help="fração de citações sem cabeçalho reconhecível")
+    args = parser.parse_args()
+
+    subject = "Re: orçamento do projeto"
+    bodies = _thread(args.messages, args.unrecognized, random.Random(42))
+    cleaned = [clean_email_body(body) for body in bodies]
+
+    per_message = sum(_estimate_tokens(_build_prompt(subject, body)) for body in cleaned)
+    largest = max(_estimate_tokens(_build_prompt(subject, body)) for body in cleaned)
+
+    seen: set[str] = set()
+    pending = [
+        {"id": i, "subject": "", "sender": "Fulano <fulano@example.com>", "body": strip_seen_lines(body, seen)}
+        for i, body in enumerate(cleaned)
+    ]
+    summary = " ".join(["palavra"] * (THREAD_SUMMARY_MAX_TOKENS * 2 // 3))
+    chunks = pack_batches(pending, token_budget=max(1, AI_BATCH_TOKEN_BUDGET - THREAD_SUMMARY_MAX_TOKENS))
+    prompts = [_estimate_tokens(_build_thread_prompt(subject, summary, chunk, len(summary.split()))) for chunk in chunks]
+
+    # Uma chamada por mensagem, cada uma depois da anterior já ter sido incorporada ao resumo
+    incremental = [
+        _estimate_tokens(_build_thread_prompt(subject, summary, [message], len(summary.split())))
+        for message in pending
+    ]
+
+    print(f"Conversa de {args.messages} mensagens ({args.unrecognized:.0%} das citações sem cabeçalho reconhecível); "
+          f"corpo limitado a {AI_BODY_TOKEN_BUDGET} tokens\n")
+    print(f"{'modo':>28} | {'chamadas':>8} | {'tokens (total)':>14} | {'maior prompt':>12}")
+    print("-" * 72)
+    print(f"{'mensagem a mensagem':>28} | {len(cleaned):>8} | {per_message:>14} | {largest:>12}")
+    print(f"{'por conversa (de uma vez)':>28} | {len(prompts):>8} | {sum(prompts):>14} | {max(prompts):>12}")
+    print(f"{'por conversa (incremental)':>28} | {len(incremental):>8} | {sum(incremental):>14} | {max(incremental):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Servidor fake da Gmail API para benchmarks locais.
+
+Implementa apenas o subconjunto usado pelo gmail_service e pelo gmail_async
+(messages.list, messages.get, messages.send, getProfile, history.list e a batch
+HTTP API), com latência artificial por requisição HTTP para simular o round trip
+até os servidores do Google. messages.get respeita format=metadata (e metadataHeaders),
+e os bytes enviados nas respostas são contados para medir banda. Assunto e snippet
+têm acentos e emoji, enviados em UTF-8 cru (como o Gmail), para que um parser que
+decodifique as respostas errado apareça no assert_intact dos benchmarks.
+"""
+import base64
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+_MESSAGE_PATH = re.compile(r"^/gmail/v1/users/me/messages/([^/?]+)$")
+_LIST_PATH = "/gmail/v1/users/me/messages"
+_SEND_PATH = "/gmail/v1/users/me/messages/send"
+_PROFILE_PATH = "/gmail/v1/users/me/profile"
+_HISTORY_PATH = "/gmail/v1/users/me/history"
+_HISTORY_ID = "1000"
+_BATCH_PATH = "/batch/gmail/v1"
+
+
+def _make_message(index: int, paragraphs: int = 20) -> dict:
+    html = (
+        f"<html><body><p>Olá! Esta é a mensagem de teste número {index}.</p>"
+        + "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>" * paragraphs
+        + "</body></html>"
+    )
+    return {
+        "id": f"msg{index:06d}",
+        "threadId": f"thread{index // 3:06d}",
+        "labelIds": ["INBOX", "UNREAD"] if index % 2 else ["INBOX"],
+        "snippet": f"Esta é a mensagem de teste número {index} — orçamento aprovado ✅",
+        "internalDate": str(1_700_000_000_000 + index * 60_000),
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "Subject", "value": f"Reunião de revisão nº {index} 📅"},
+                {"name": "From", "value": "remetente@example.com"},
+                {"name": "To", "value": "eu@example.com"},
+            ],
+            "parts": [
+                {
+                    "mimeType": "text/html",
+                    "body": {"data": base64.urlsafe_b64encode(html.encode()).decode()},
+                },
+            ],
+        },
+    }
+
+
+class FakeGmail:
+    """Caixa de entrada em memória com `message_count` mensagens (mais nova primeiro)."""
+
+    def __init__(
+        self,
+        message_count: int,
+        latency: float = 0.03,
+        per_item_latency: float = 0.001,
+        paragraphs: int = 20,
+    ):
+        self.messages = [_make_message(i, paragraphs) for i in range(message_count - 1, -1, -1)]
+        self.by_id = {m["id"]: m for m in self.messages}
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.http_requests = 0
+        self.bytes_sent = 0
+        self.sent: list[dict] = []
+        self._lock = threading.Lock()
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.http_requests += 1
+
+    def count_bytes(self, size: int) -> None:
+        with self._lock:
+            self.bytes_sent += size
+
+    def assert_intact(self, emails: list[dict]) -> None:
+        """Confere se assunto e snippet dos e-mails sincronizados chegaram sem corromper o UTF-8."""
+        for email in emails:
+            original = self.by_id[email["gmail_id"]]
+            subject = next(h["value"] for h in original["payload"]["headers"] if h["name"] == "Subject")
+            assert email["subject"] == subject, f"assunto corrompido: {email['subject']!r}"
+            assert email["snippet"] == original["snippet"], f"snippet corrompido: {email['snippet']!r}"
+
+    def handle(self, method: str, path: str, query: dict, body: dict | None = None) -> tuple[int, dict]:
+        """Resolve uma chamada da API e retorna (status, corpo JSON)."""
+        if method == "GET" and path == _PROFILE_PATH:
+            return 200, {"emailAddress": "eu@example.com", "historyId": _HISTORY_ID}
+
+        if method == "GET" and path == _HISTORY_PATH:
+            # Caixa estática: nada mudou desde qualquer historyId
+            return 200, {"history": [], "historyId": _HISTORY_ID}
+
+        if method == "POST" and path == _SEND_PATH:
+            with self._lock:
+                self.sent.append(body or {})
+                return 200, {"id": f"sent{len(self.sent):06d}", "labelIds": ["SENT"]}
+
+        if method == "GET" and path == _LIST_PATH:
+            max_results = int(query.get("maxResults", ["100"])[0])
+            page = self.messages[:max_results]
+            return 200, {
+                "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                "resultSizeEstimate": len(page),
+            }
+
+        match = _MESSAGE_PATH.match(path)
+        if method == "GET" and match:
+            message = self.by_id.get(match.group(1))
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            if query.get("format", ["full"])[0] == "metadata":
+                wanted = {name.lower() for name in query.get("metadataHeaders", [])}
+                headers = [h for h in message["payload"]["headers"] if not wanted or h["name"].lower() in wanted]
+                payload = {"mimeType": message["payload"]["mimeType"], "headers": headers}
+                return 200, {**message, "payload": payload}
+            return 200, message
+
+        return 404, {"error": {"code": 404, "message": f"Rota não suportada: {method} {path}"}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    gmail: FakeGmail
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.gmail.count_bytes(len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str) -> None:
+        self.gmail.count_request()
+        time.sleep(self.gmail.latency)
+
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length) if length else b""
+
+        if method == "POST" and url.path == _BATCH_PATH:
+            self._handle_batch(raw_body)
+            return
+
+        time.sleep(self.gmail.per_item_latency)
+        body = json.loads(raw_body) if raw_body else None
+        status, payload = self.gmail.handle(method, url.path, parse_qs(url.query), body)
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode(), "application/json; charset=UTF-8")
+
+    def _handle_batch(self, raw_body: bytes) -> None:
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        multipart = BytesParser().parsebytes(header + raw_body)
+
+        boundary = "batch_fake_gmail"
+        chunks = []
+        for part in multipart.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            request_line = part.get_payload().lstrip().split("\n", 1)[0].strip()
+            method, target, _ = request_line.split(" ", 2)
+            url = urlparse(target)
+
+            time.sleep(self.gmail.per_item_latency)
+            status, payload = self.gmail.handle(method, url.path, parse_qs(url.query))
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload, ensure_ascii=False)}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(chunks).encode(), f"multipart/mixed; boundary={boundary}")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+def start_server(gmail: FakeGmail, port: int = 0) -> ThreadingHTTPServer:
+    """Sobe o servidor fake numa thread daemon e retorna a instância (use server.server_port)."""
+    handler = type("FakeGmailHandler", (_Handler,), {"gmail": gmail})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
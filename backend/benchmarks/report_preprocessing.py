@@ -0,0 +1,94 @@
+"""
+Relatório: redução de tokens do corpo do e-mail com o pré-processamento (clean_email_body).
+
+Compara os tokens estimados (~4 caracteres por token) do corpo bruto — como ia
+para o prompt antes — com os do corpo limpo.
+
+Uso (a partir de backend/):
+    python -m benchmarks.report_preprocessing                # corpus de exemplo embutido
+    python -m benchmarks.report_preprocessing --from-db 1000 # e-mails reais do banco local
+"""
+import argparse
+import statistics
+
+from app.core.config import AI_BODY_TOKEN_BUDGET
+from app.services.email_preprocessing import clean_email_body
+
+_NEWSLETTER = """<html><head><style>
+body{font-family:Arial,sans-serif;margin:0;padding:0} .btn{background:#1a73e8;color:#fff;padding:12px 24px}
+td{padding:8px} .footer{font-size:11px;color:#999}</style></head><body>
+<table width="100%" cellpadding="0" cellspacing="0"><tr><td align="center">
+<img src="https://img.loja.example.com/logo.png" width="120">
+<h1 style="font-size:24px;color:#333">Ofertas da semana</h1>
+<p style="color:#555;line-height:1.5">Aproveite até 40% de desconto em eletrônicos selecionados.</p>
+<a class="btn" href="https://click.loja.example.com/track?u=8f7a6b5c4d3e2f1a&c=ofertas&utm_source=email">Ver ofertas</a>
+</td></tr>""" + "".join(
+    f"""<tr><td style="border-bottom:1px solid #eee"><a href="https://click.loja.example.com/track?u=8f7a6b5c&p={i}">
+<img src="https://img.loja.example.com/p/{i}.jpg" width="80"></a> Produto {i} — R$ {i * 37},90</td></tr>"""
+    for i in range(12)
+) + """<tr><td class="footer">Você recebeu este e-mail porque se cadastrou na Loja.
+<a href="https://click.loja.example.com/unsubscribe?u=8f7a6b5c">Descadastrar</a></td></tr></table></body></html>"""
+
+_REPLY_CHAIN = """Oi Ana, combinado — mando a versão final até sexta.
+
+Abraços,
+Pedro
+Enviado do meu iPhone
+
+Em qua., 3 de abr. de 2024 às 09:12, Ana <ana@example.com> escreveu:
+> Pedro, conseguimos fechar o relatório esta semana?
+> Preciso apresentar na reunião de segunda.
+>
+> Em ter., 2 de abr. de 2024 às 18:40, Pedro <pedro@example.com> escreveu:
+>> Segue o rascunho em anexo, falta revisar a seção 3.
+>> """ + "\n>> ".join(["Detalhes do rascunho anterior, com tabelas e números."] * 15)
+
+_PLAIN = "Olá, sua fatura de abril no valor de R$ 189,90 vence dia 10. Acesse o app para pagar."
+
+
+def _sample_corpus() -> list[str]:
+    return [_NEWSLETTER] * 5 + [_REPLY_CHAIN] * 3 + [_PLAIN] * 2
+
+
+def _db_corpus(limit: int) -> list[str]:
+    from app.core.database import SessionLocal
+    from app.models.email_model import Email
+
+    db = SessionLocal()
+    try:
+        return [row.body for row in db.query(Email.body).filter(Email.body.isnot(None)).limit(limit)]
+    finally:
+        db.close()
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-db", type=int, metavar="N", help="usa até N e-mails do banco local")
+    args = parser.parse_args()
+
+    bodies = _db_corpus(args.from_db) if args.from_db else _sample_corpus()
+    if not bodies:
+        print("Nenhum e-mail encontrado.")
+        return
+
+    raw = [_tokens(body) for body in bodies]
+    clean = [_tokens(clean_email_body(body)) for body in bodies]
+    reductions = [1 - c / r for r, c in zip(raw, clean)]
+
+    print(f"e-mails: {len(bodies)}  orçamento do corpo limpo: {AI_BODY_TOKEN_BUDGET} tokens\n")
+    print(f"{'':>22} | {'bruto':>10} | {'limpo':>10}")
+    print("-" * 48)
+    print(f"{'tokens (total)':>22} | {sum(raw):>10} | {sum(clean):>10}")
+    print(f"{'tokens (mediana)':>22} | {statistics.median(raw):>10.0f} | {statistics.median(clean):>10.0f}")
+    print(f"{'tokens (máximo)':>22} | {max(raw):>10} | {max(clean):>10}")
+    print()
+    print(f"redução total:            {1 - sum(clean) / sum(raw):.0%}")
+    print(f"redução mediana por e-mail: {statistics.median(reductions):.0%}")
+
+
+if __name__ == "__main__":
+    main()
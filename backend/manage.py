@@ -0,0 +1,191 @@
+"""
+Comandos de manutenção do backend.
+
+Uso (a partir de backend/):
+    python manage.py compress-bodies    # comprime corpos gravados antes da compressão e roda VACUUM
+    python manage.py rebuild-stats      # recalcula os contadores do dashboard (todos os usuários)
+    python manage.py rebuild-stats --user-id 3
+    python manage.py rebuild-search     # recria do zero o índice da busca textual
+    python manage.py rebuild-similar    # recria os vetores de e-mails parecidos (todos os usuários)
+    python manage.py rebuild-similar --user-id 3
+    python manage.py train-classifier   # treina agora o pré-classificador local
+    python manage.py fetch-bodies       # baixa do Gmail os corpos ainda não baixados (todos os usuários)
+    python manage.py fetch-bodies --user-id 3
+"""
+import argparse
+
+from sqlalchemy import select, text, update
+from sqlalchemy.orm import undefer
+
+from app.core.config import PRE_CLASSIFIER_MIN_SAMPLES
+from app.core.database import SessionLocal, engine
+from app.models.user_model import User
+from app.models.email_model import Email
+from app.services.stats_store import rebuild_stats
+from app.services import search_index, similarity_index, pre_classifier, body_hydration
+
+
+def compress_bodies(batch_size: int = 500) -> None:
+    """
+    Regrava comprimidos os corpos ainda em texto puro (bancos SQLite anteriores à
+    compressão) e roda VACUUM para devolver o espaço ao sistema de arquivos.
+    """
+    if engine.dialect.name != "sqlite":
+        print("Nada a fazer: só bancos SQLite antigos guardam corpos em texto puro.")
+        return
+
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            ids = [
+                row.id for row in db.execute(text(
+                    "SELECT id FROM emails "
+                    "WHERE typeof(body) = 'text' OR typeof(clean_body) = 'text' "
+                    "LIMIT :limit"
+                ), {"limit": batch_size})
+            ]
+            if not ids:
+                break
+
+            rows = db.execute(
+                select(Email.id, Email.body, Email.clean_body)
+                .options(undefer(Email.body), undefer(Email.clean_body))
+                .where(Email.id.in_(ids))
+            ).all()
+            for row in rows:
+                db.execute(
+                    update(Email)
+                    .where(Email.id == row.id)
+                    .values(body=row.body, clean_body=row.clean_body)
+                )
+            db.commit()
+            total += len(rows)
+            print(f"  {total} e-mails comprimidos...")
+    finally:
+        db.close()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print(f"Concluído: {total} e-mails comprimidos.")
+
+
+def rebuild_dashboard_stats(user_id: int | None = None) -> None:
+    """Recalcula do zero os contadores do dashboard, corrigindo qualquer drift."""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id] if user_id else [row.id for row in db.query(User.id).all()]
+        for uid in user_ids:
+            counters = rebuild_stats(db, uid)
+            db.commit()
+            print(f"  user_id={uid}: {counters.get('total', 0)} e-mails, {counters.get('unread', 0)} não lidos")
+    finally:
+        db.close()
+    print(f"Concluído: contadores de {len(user_ids)} usuário(s) recalculados.")
+
+
+def rebuild_search_index() -> None:
+    """Apaga e recria o índice da busca (GET /emails/search) a partir dos e-mails e análises."""
+    if not search_index.ensure_schema(engine):
+        print("Busca textual indisponível neste banco (SQLite sem FTS5 ou dialeto não suportado).")
+        return
+
+    db = SessionLocal()
+    try:
+        total = search_index.index_missing(db, rebuild=True)
+    finally:
+        db.close()
+    print(f"Concluído: {total} e-mails indexados.")
+
+
+def rebuild_similarity_index(user_id: int | None = None) -> None:
+    """Apaga e recria os vetores de e-mails parecidos (ex: depois de mudar SIMILARITY_DIM)."""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id] if user_id else [row.id for row in db.query(User.id).all()]
+        total = 0
+        for uid in user_ids:
+            similarity_index.similarity_index.drop(uid)
+            total += similarity_index.index_missing(db, uid)
+    finally:
+        db.close()
+    print(f"Concluído: {total} e-mails de {len(user_ids)} usuário(s) indexados.")
+
+
+def train_pre_classifier() -> None:
+    """Treina o pré-classificador com as análises da Gemini e mostra a validação."""
+    db = SessionLocal()
+    try:
+        meta = pre_classifier.train(db)
+    finally:
+        db.close()
+    if meta is None:
+        print(f"Análises insuficientes: são necessárias ao menos {PRE_CLASSIFIER_MIN_SAMPLES} da Gemini.")
+        return
+    print(f"Treinado com {meta['samples']} análises ({meta['holdout']} para validação).")
+    for label, precision in sorted(meta["holdout_precision"].items()):
+        print(f"  {label:>10}: precisão {precision:.1%}{'  (liberada)' if label in meta['enabled'] else ''}")
+    print(f"Cobertura na validação: {meta['holdout_coverage']:.1%} dos e-mails dispensariam a Gemini.")
+
+
+def fetch_missing_bodies(user_id: int | None = None, batch_size: int = 100) -> None:
+    """
+    Baixa do Gmail o corpo de todos os e-mails que só têm metadados — para quem quer a
+    busca textual e os e-mails parecidos cobrindo a caixa inteira, não só o que já foi aberto.
+    """
+    search_index.ensure_schema(engine)
+    db = SessionLocal()
+    try:
+        query = db.query(Email.user_id).filter(Email.body_loaded.is_(False))
+        user_ids = [user_id] if user_id else [row.user_id for row in query.distinct()]
+        total = 0
+        for uid in user_ids:
+            last_id = 0
+            while True:
+                ids = [
+                    row.id for row in
+                    db.query(Email.id)
+                    .filter(Email.user_id == uid, Email.body_loaded.is_(False), Email.id > last_id)
+                    .order_by(Email.id)
+                    .limit(batch_size)
+                ]
+                if not ids:
+                    break
+                total += len(body_hydration.hydrate(db, uid, ids))
+                last_id = ids[-1]
+                print(f"  user_id={uid}: {total} corpos baixados...", end="\r")
+    finally:
+        db.close()
+    print(f"Concluído: {total} corpos baixados de {len(user_ids)} usuário(s).")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("compress-bodies", help="comprime corpos de e-mail ainda em texto puro")
+    rebuild = commands.add_parser("rebuild-stats", help="recalcula os contadores do dashboard")
+    rebuild.add_argument("--user-id", type=int, help="só este usuário (padrão: todos)")
+    commands.add_parser("rebuild-search", help="recria o índice da busca textual")
+    similar = commands.add_parser("rebuild-similar", help="recria os vetores de e-mails parecidos")
+    similar.add_argument("--user-id", type=int, help="só este usuário (padrão: todos)")
+    commands.add_parser("train-classifier", help="treina o pré-classificador local")
+    bodies = commands.add_parser("fetch-bodies", help="baixa do Gmail os corpos de e-mails só com metadados")
+    bodies.add_argument("--user-id", type=int, help="só este usuário (padrão: todos)")
+    args = parser.parse_args()
+
+    if args.command == "compress-bodies":
+        compress_bodies()
+    elif args.command == "rebuild-stats":
+        rebuild_dashboard_stats(args.user_id)
+    elif args.command == "rebuild-search":
+        rebuild_search_index()
+    elif args.command == "rebuild-similar":
+        rebuild_similarity_index(args.user_id)
+    elif args.command == "train-classifier":
+        train_pre_classifier()
+    elif args.command == "fetch-bodies":
+        fetch_missing_bodies(args.user_id)
+
+
+if __name__ == "__main__":
+    main()
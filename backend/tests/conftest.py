@@ -0,0 +1,53 @@
+"""
+Configuração comum dos testes. Rode a partir de backend/:
+    python -m pytest -q
+
+app.core.config lê o ambiente na importação, então as variáveis (banco SQLite
+temporário, chaves falsas, sem espera entre novas tentativas) são definidas aqui,
+antes de qualquer import do app.
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="email-assistant-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP}/test.db",
+    "JWT_SECRET_KEY": "chave-de-teste",
+    "GEMINI_API_KEY": "chave-de-teste",
+    "GMAIL_FETCH_RETRY_BACKOFF": "0",
+    "PRE_CLASSIFIER_ENABLED": "false",
+    "PRE_CLASSIFIER_PATH": f"{_TMP}/pre_classifier.npz",
+    "SIMILARITY_INDEX_DIR": f"{_TMP}/similarity",
+})
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import app.main  # noqa: E402,F401 — registra os models e cria as tabelas, como a API
+from app.core.database import Base, SessionLocal, engine  # noqa: E402
+from app.services import search_index  # noqa: E402
+from app.models.user_model import User  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Sessão num banco vazio; as tabelas são limpas no fim de cada teste."""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+            if search_index._available:
+                conn.execute(text("DELETE FROM email_search"))
+
+
+@pytest.fixture
+def user(db) -> User:
+    user = User(email="fulano@example.com", google_id="g-1", access_token="token")
+    db.add(user)
+    db.commit()
+    return user
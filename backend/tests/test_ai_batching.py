@@ -0,0 +1,107 @@
+import json
+import re
+
+import pytest
+
+from app.services import ai_service
+from app.services.ai_service import analyze_emails_batch, pack_batches
+from app.services.rate_limiter import GeminiUnavailableError
+
+
+def _email(email_id, words: int = 10) -> dict:
+    return {"id": email_id, "subject": f"Assunto {email_id}", "body": "palavra " * words}
+
+
+def _analysis(category: str = "trabalho") -> dict:
+    return {"summary": "Resumo.", "category": category, "urgency": "baixa", "suggested_reply": "Ok."}
+
+
+# ── pack_batches ──────────────────────────────────────────────────────────────
+
+def test_pack_batches_respects_budget_and_order():
+    emails = [_email(i, words=200) for i in range(6)]
+    batches = pack_batches(emails, token_budget=1000, max_emails=10)
+
+    assert [email for batch in batches for email in batch] == emails
+    assert len(batches) > 1
+    for batch in batches:
+        cost = sum(ai_service._estimate_tokens(e["subject"] + e["body"]) + 20 for e in batch)
+        assert len(batch) == 1 or cost <= 1000
+
+
+def test_pack_batches_limits_emails_per_batch():
+    batches = pack_batches([_email(i) for i in range(7)], token_budget=100_000, max_emails=3)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_pack_batches_gives_oversized_email_its_own_batch():
+    batches = pack_batches([_email("a"), _email("grande", words=5000), _email("b")], token_budget=500)
+    assert [[email["id"] for email in batch] for batch in batches] == [["a"], ["grande"], ["b"]]
+
+
+# ── analyze_emails_batch ──────────────────────────────────────────────────────
+
+def _ordinals(prompt: str) -> list[str]:
+    return re.findall(r"=== E-MAIL id=(\d+) ===", prompt)
+
+
+def test_batch_maps_ordinals_back_to_email_ids(monkeypatch):
+    prompts = []
+
+    def fake_gemini(prompt, output_tokens=0):
+        prompts.append(prompt)
+        # Resposta fora de ordem: o mapeamento é pelo número de ordem, não pela posição
+        ordinals = _ordinals(prompt)
+        return json.dumps([
+            {"id": ordinal, **_analysis("financeiro" if ordinal == "1" else "spam")}
+            for ordinal in reversed(ordinals)
+        ])
+
+    monkeypatch.setattr(ai_service, "_call_gemini", fake_gemini)
+    results = analyze_emails_batch([_email(901), _email(42)])
+
+    assert len(prompts) == 1
+    assert _ordinals(prompts[0]) == ["1", "2"]
+    assert "id=901" not in prompts[0]
+    assert results[901]["category"] == "financeiro"
+    assert results[42]["category"] == "spam"
+
+
+def test_batch_reanalyzes_missing_and_invalid_items_alone(monkeypatch):
+    def fake_gemini(prompt, output_tokens=0):
+        ordinals = _ordinals(prompt)
+        if ordinals:
+            return json.dumps([
+                {"id": "1", **_analysis()},
+                {"id": "2", **_analysis(), "category": "inventada"},
+                {"id": "99", **_analysis()},   # id que não existe no lote
+            ])
+        return json.dumps(_analysis("pessoal"))
+
+    monkeypatch.setattr(ai_service, "_call_gemini", fake_gemini)
+    results = analyze_emails_batch([_email("a"), _email("b"), _email("c")])
+
+    assert results["a"]["category"] == "trabalho"
+    assert results["b"]["category"] == "pessoal"
+    assert results["c"]["category"] == "pessoal"
+
+
+def test_batch_returns_partial_results_when_gemini_becomes_unavailable(monkeypatch):
+    def fake_gemini(prompt, output_tokens=0):
+        if _ordinals(prompt):
+            return json.dumps([{"id": "1", **_analysis()}])
+        raise GeminiUnavailableError("cota esgotada")
+
+    monkeypatch.setattr(ai_service, "_call_gemini", fake_gemini)
+    results = analyze_emails_batch([_email("a"), _email("b")])
+
+    assert list(results) == ["a"]
+
+
+def test_batch_raises_when_nothing_was_analyzed(monkeypatch):
+    def fake_gemini(prompt, output_tokens=0):
+        raise GeminiUnavailableError("cota esgotada")
+
+    monkeypatch.setattr(ai_service, "_call_gemini", fake_gemini)
+    with pytest.raises(GeminiUnavailableError):
+        analyze_emails_batch([_email("a"), _email("b")])
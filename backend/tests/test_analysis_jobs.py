@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.database import SessionLocal
+from app.models.analysis_job_item_model import AnalysisJobItem
+from app.models.analysis_job_model import AnalysisJob
+from app.models.email_analysis_model import EmailAnalysis
+from app.models.email_model import Email
+from app.services import analysis_jobs, body_hydration
+from app.services.analysis_jobs import claim_next_job, enqueue_job, run_job
+
+
+def _analysis() -> dict:
+    return {"summary": "Resumo.", "category": "trabalho", "urgency": "baixa", "suggested_reply": "Ok."}
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Troca a Gemini por uma análise fixa; guarda o assunto dos e-mails enviados."""
+    sent = []
+
+    def fake_batch(batch):
+        sent.extend(item["subject"] for item in batch)
+        return {item["id"]: _analysis() for item in batch}
+
+    monkeypatch.setattr(analysis_jobs, "analyze_emails_batch_cached", fake_batch)
+    return sent
+
+
+def _inbox(db, user, count: int, **fields) -> list[int]:
+    base = datetime(2024, 6, 3, 10, 0)
+    emails = [
+        Email(
+            user_id=user.id, gmail_id=f"m{i}", subject=f"Assunto {i}", date=base - timedelta(hours=i),
+            **{"body": f"Corpo do e-mail {i}", "clean_body": f"Corpo do e-mail {i}", **fields},
+        )
+        for i in range(count)
+    ]
+    db.add_all(emails)
+    db.commit()
+    return [email.id for email in emails]
+
+
+def _job(job_id: int) -> AnalysisJob:
+    db = SessionLocal()
+    try:
+        job = db.get(AnalysisJob, job_id)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+def _run_until_done(job_id: int, max_slices: int = 20) -> AnalysisJob:
+    for _ in range(max_slices):
+        db = SessionLocal()
+        try:
+            claimed = claim_next_job(db, "w1")
+        finally:
+            db.close()
+        if claimed is None:
+            break
+        assert claimed == job_id
+        run_job(job_id, "w1")
+    return _job(job_id)
+
+
+# ── Lease ─────────────────────────────────────────────────────────────────────
+
+def test_only_one_worker_claims_a_job(db, user):
+    _inbox(db, user, 1)
+    job = enqueue_job(db, user.id)
+
+    assert claim_next_job(db, "w1") == job.id
+    assert claim_next_job(db, "w2") is None
+
+
+def test_fenced_update_ignores_other_worker(db, user):
+    _inbox(db, user, 1)
+    job = enqueue_job(db, user.id)
+    claim_next_job(db, "w1")
+
+    assert analysis_jobs._fenced(db, job.id, "w2").update({"done": 99}, synchronize_session=False) == 0
+    assert analysis_jobs._fenced(db, job.id, "w1").update({"done": 1}, synchronize_session=False) == 1
+
+
+def test_worker_that_lost_the_lease_writes_nothing(db, user, gemini):
+    _inbox(db, user, 3)
+    job = enqueue_job(db, user.id)
+    claim_next_job(db, "w1")
+    # O lease de w1 expira (ex: pausa longa de GC) e w2 assume o job
+    db.query(AnalysisJob).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert claim_next_job(db, "w2") == job.id
+
+    run_job(job.id, "w1")
+
+    job = _job(job.id)
+    assert job.worker_id == "w2"
+    assert job.status == "running"
+    assert job.done == 0
+    assert db.query(EmailAnalysis).count() == 0
+
+
+# ── Fatias e progresso ────────────────────────────────────────────────────────
+
+def test_job_completes_in_slices(db, user, gemini, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "ANALYSIS_JOB_SLICE", 2)
+    ids = _inbox(db, user, 5)
+    job = enqueue_job(db, user.id)
+
+    job = _run_until_done(job.id)
+
+    assert (job.status, job.total, job.done, job.errors) == ("completed", 5, 5, 0)
+    assert {row.email_id for row in db.query(EmailAnalysis)} == set(ids)
+    assert db.query(AnalysisJobItem).count() == 0
+
+
+def test_emails_analyzed_elsewhere_count_as_done(db, user, gemini, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "ANALYSIS_JOB_SLICE", 2)
+    _inbox(db, user, 5)
+    job = enqueue_job(db, user.id)
+    claim_next_job(db, "w1")
+    run_job(job.id, "w1")
+
+    # Outra rota (ex: abrir o e-mail) analisa um dos próximos da ordem antes da fatia dele
+    elsewhere = (
+        db.query(AnalysisJobItem.email_id)
+        .filter(AnalysisJobItem.job_id == job.id, AnalysisJobItem.position >= _job(job.id).next_position)
+        .order_by(AnalysisJobItem.position)
+        .first()
+        .email_id
+    )
+    db.add(EmailAnalysis(email_id=elsewhere, **_analysis()))
+    db.commit()
+
+    job = _run_until_done(job.id)
+
+    assert (job.status, job.done, job.errors) == ("completed", 5, 0)
+    assert db.get(Email, elsewhere).subject not in gemini
+    assert len(gemini) == 4
+
+
+def test_slice_redone_after_crash_does_not_count_twice(db, user, gemini):
+    ids = _inbox(db, user, 3)
+    job = enqueue_job(db, user.id)
+    claim_next_job(db, "w1")
+    job = db.get(AnalysisJob, job.id)
+    analysis_jobs._plan_job(db, job, "w1")
+
+    # w1 grava a análise do primeiro e-mail da fatia e cai antes de terminar
+    positions = {item.email_id: item.position for item in db.query(AnalysisJobItem)}
+    first = min(positions, key=positions.get)
+    analysis_jobs._save_analyses(db, job, "w1", [(first, _analysis())], [], positions)
+    db.query(AnalysisJob).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    assert claim_next_job(db, "w2") == job.id
+    run_job(job.id, "w2")
+
+    job = _job(job.id)
+    assert (job.status, job.total, job.done) == ("completed", 3, 3)
+    assert db.get(Email, first).subject not in gemini
+    assert len(gemini) == 2
+    assert {row.email_id for row in db.query(EmailAnalysis)} == set(ids)
+
+
+# ── Corpos no Gmail ───────────────────────────────────────────────────────────
+
+def test_body_fetch_error_backs_off_instead_of_failing_emails(db, user, gemini, monkeypatch):
+    _inbox(db, user, 2, body=None, clean_body=None, body_loaded=False)
+    job = enqueue_job(db, user.id)
+
+    def unavailable(*args, **kwargs):
+        raise body_hydration.BodyFetchError("token revogado")
+
+    monkeypatch.setattr(body_hydration, "hydrate", unavailable)
+    claim_next_job(db, "w1")
+    run_job(job.id, "w1")
+
+    job = _job(job.id)
+    assert (job.status, job.worker_id, job.errors, job.done) == ("running", None, 0, 0)
+    assert job.fetch_failures == 1
+    assert job.not_before > datetime.utcnow()
+    assert gemini == []
+    # Em backoff: nenhum worker pega o job antes de not_before
+    assert claim_next_job(db, "w2") is None
+
+
+def test_body_fetch_error_fails_job_after_repeated_failures(db, user, gemini, monkeypatch):
+    _inbox(db, user, 1, body=None, clean_body=None, body_loaded=False)
+    job = enqueue_job(db, user.id)
+    db.query(AnalysisJob).update({"fetch_failures": analysis_jobs._BODY_FETCH_MAX_FAILURES - 1})
+    db.commit()
+
+    def unavailable(*args, **kwargs):
+        raise body_hydration.BodyFetchError("token revogado")
+
+    monkeypatch.setattr(body_hydration, "hydrate", unavailable)
+    claim_next_job(db, "w1")
+    run_job(job.id, "w1")
+
+    job = _job(job.id)
+    assert job.status == "failed"
+    assert "token revogado" in job.error
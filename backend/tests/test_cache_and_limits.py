@@ -0,0 +1,68 @@
+from app.models.analysis_cache_model import AnalysisCacheEntry
+from app.models.rate_limit_model import RateLimitBucket
+from app.services.analysis_cache import AnalysisCache
+from app.services.rate_limiter import DatabaseTokenBucket, MemoryTokenBucket
+
+
+def _analysis() -> dict:
+    return {"summary": "Resumo.", "category": "marketing", "urgency": "baixa", "suggested_reply": ""}
+
+
+# ── Cache de análises ─────────────────────────────────────────────────────────
+
+def test_cache_hits_are_flushed_in_batches(db):
+    cache = AnalysisCache(max_entries=100)
+    cache.put("a", _analysis())
+    cache.put("b", _analysis())
+
+    for key in ("a", "a", "b", "a"):
+        assert cache.get(key) == _analysis()
+    assert cache.get("inexistente") is None
+
+    # A leitura não grava nada até o flush
+    assert [entry.hits for entry in db.query(AnalysisCacheEntry).order_by(AnalysisCacheEntry.content_hash)] == [0, 0]
+
+    cache.flush_touches(db)
+    db.expire_all()
+    assert [entry.hits for entry in db.query(AnalysisCacheEntry).order_by(AnalysisCacheEntry.content_hash)] == [3, 1]
+    assert cache.stats()["hits"] == 4 and cache.stats()["misses"] == 1
+
+
+def test_cache_eviction_keeps_recently_hit_entries(db):
+    cache = AnalysisCache(max_entries=2)
+    cache.put("antiga", _analysis())
+    cache.put("usada", _analysis())
+    cache.get("antiga")           # acerto ainda só em memória
+    cache.put("nova", _analysis())
+
+    cache._evict(db)
+
+    assert {entry.content_hash for entry in db.query(AnalysisCacheEntry)} == {"antiga", "nova"}
+
+
+# ── Rate limiter ──────────────────────────────────────────────────────────────
+
+def test_database_bucket_refund_is_capped_at_capacity(db):
+    bucket = DatabaseTokenBucket("teste", capacity=10, per_minute=60)
+    assert bucket.try_acquire(4) == 0.0
+
+    bucket.refund(100)
+
+    assert db.get(RateLimitBucket, "teste").tokens == 10
+
+
+def test_database_bucket_refund_below_capacity_adds_tokens(db):
+    bucket = DatabaseTokenBucket("teste", capacity=10, per_minute=60)
+    bucket.try_acquire(4)
+
+    bucket.refund(3)
+
+    assert db.get(RateLimitBucket, "teste").tokens == 9
+
+
+def test_memory_bucket_refund_is_capped_at_capacity():
+    bucket = MemoryTokenBucket(capacity=10, per_minute=60)
+    bucket.try_acquire(4)
+    bucket.refund(100)
+    assert bucket.try_acquire(10) == 0.0
+    assert bucket.try_acquire(1) > 0
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+
+from app.services import gmail_async
+from app.services.gmail_service import parse_history
+
+
+# ── parse_history ─────────────────────────────────────────────────────────────
+
+def test_parse_history_last_event_wins():
+    records = [
+        {"labelsRemoved": [{"message": {"id": "a"}, "labelIds": ["UNREAD"]}]},
+        {"labelsAdded": [{"message": {"id": "a"}, "labelIds": ["UNREAD"]}]},
+        {"labelsRemoved": [{"message": {"id": "b"}, "labelIds": ["UNREAD"]}]},
+    ]
+    assert parse_history(records) == ([], {"a": False, "b": True})
+
+
+def test_parse_history_fetches_messages_entering_the_inbox():
+    records = [
+        {"messagesAdded": [{"message": {"id": "novo", "labelIds": ["INBOX", "UNREAD"]}}]},
+        {"messagesAdded": [{"message": {"id": "enviado", "labelIds": ["SENT"]}}]},
+        {"labelsAdded": [{"message": {"id": "movido"}, "labelIds": ["INBOX"]}]},
+        # Leitura de uma mensagem que será buscada: o estado vem com ela
+        {"labelsRemoved": [{"message": {"id": "novo"}, "labelIds": ["UNREAD"]}]},
+    ]
+    added, read_changes = parse_history(records)
+    assert added == ["novo", "movido"]
+    assert read_changes == {}
+
+
+# ── Batch HTTP (gmail_async) ──────────────────────────────────────────────────
+
+def _message(msg_id: str) -> dict:
+    return {
+        "id": msg_id,
+        "threadId": f"t-{msg_id}",
+        "snippet": "Reunião às 10h ☕",
+        "labelIds": ["INBOX"],
+        "internalDate": "1717400000000",
+        "payload": {"headers": [{"name": "Subject", "value": f"Orçamento {msg_id} 🎉"}]},
+    }
+
+
+def _batch_response(parts: list[tuple[str, int, bytes]]) -> httpx.Response:
+    boundary = "batch_resposta"
+    body = b"".join(
+        f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{msg_id}>\r\n\r\n"
+        f"HTTP/1.1 {status} X\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n".encode()
+        + payload + b"\r\n"
+        for msg_id, status, payload in parts
+    ) + f"--{boundary}--\r\n".encode()
+    return httpx.Response(200, headers={"content-type": f"multipart/mixed; boundary={boundary}"}, content=body)
+
+
+def _json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def test_parse_batch_response_keeps_utf8_and_sorts_out_failures():
+    response = _batch_response([
+        ("a", 200, _json(_message("a"))),
+        ("b", 429, _json({"error": {"message": "rateLimitExceeded"}})),
+        ("c", 404, _json({"error": {"message": "Not Found"}})),
+        ("d", 200, b"{truncado"),
+    ])
+    results, gone = gmail_async._parse_batch_response(response)
+
+    assert list(results) == ["a"]
+    assert results["a"]["snippet"] == "Reunião às 10h ☕"
+    assert results["a"]["payload"]["headers"][0]["value"] == "Orçamento a 🎉"
+    assert gone == {"c"}
+
+
+class _FakeGmail:
+    """Gmail falso para o MockTransport: history.list e batch, com falhas programadas por mensagem."""
+
+    def __init__(self, history: list[dict], failures: dict[str, int]):
+        self.history = history
+        self.failures = failures      # id -> quantas vezes ainda responde 429
+        self.batch_calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/history"):
+            return httpx.Response(200, json={"history": self.history, "historyId": "200"})
+        if request.url.path.endswith("/batch/gmail/v1"):
+            self.batch_calls += 1
+            parts = []
+            for msg_id in re.findall(r"Content-ID: <([^>]+)>", request.content.decode()):
+                if self.failures.get(msg_id, 0) > 0:
+                    self.failures[msg_id] -= 1
+                    parts.append((msg_id, 429, _json({"error": {"message": "rateLimitExceeded"}})))
+                else:
+                    parts.append((msg_id, 200, _json(_message(msg_id))))
+            return _batch_response(parts)
+        return httpx.Response(404, json={"error": {"message": "rota desconhecida"}})
+
+
+@pytest.fixture
+def fake_gmail(monkeypatch):
+    def install(history: list[dict], failures: dict[str, int]) -> _FakeGmail:
+        gmail = _FakeGmail(history, failures)
+        monkeypatch.setattr(
+            gmail_async, "_client",
+            httpx.AsyncClient(base_url=gmail_async._BASE_URL, transport=httpx.MockTransport(gmail)),
+        )
+        monkeypatch.setattr(gmail_async.client_manager, "get_token", lambda *args: "token")
+        return gmail
+    yield install
+    gmail_async._client = None
+
+
+def _added(*msg_ids: str) -> list[dict]:
+    return [{"messagesAdded": [{"message": {"id": msg_id, "labelIds": ["INBOX"]}}]} for msg_id in msg_ids]
+
+
+def test_incremental_sync_retries_rate_limited_messages(fake_gmail):
+    gmail = fake_gmail(_added("a", "b", "c"), failures={"b": 2})
+
+    result = asyncio.run(gmail_async.sync_mailbox_async("token", None, history_id="100"))
+
+    assert [email["gmail_id"] for email in result["emails"]] == ["a", "b", "c"]
+    assert result["history_id"] == "200"
+    assert gmail.batch_calls == 3
+
+
+def test_incremental_sync_keeps_history_id_while_messages_are_missing(fake_gmail):
+    fake_gmail(_added("a", "b"), failures={"b": 100})
+
+    result = asyncio.run(gmail_async.sync_mailbox_async("token", None, history_id="100"))
+
+    assert [email["gmail_id"] for email in result["emails"]] == ["a"]
+    # O próximo sync relê o histórico desde 100 e busca "b" de novo
+    assert result["history_id"] == "100"
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.email_model import Email
+from app.routers.email_router import _decode_cursor, _encode_cursor, _keyset_page
+
+
+@pytest.fixture
+def inbox(db, user) -> list[int]:
+    """E-mails com datas repetidas e sem data; retorna os ids na ordem esperada da listagem."""
+    base = datetime(2024, 6, 3, 10, 0)
+    dates = [base, base, base - timedelta(days=1), None, base + timedelta(hours=1), None, base - timedelta(days=1)]
+    emails = [Email(user_id=user.id, gmail_id=f"m{i}", date=date) for i, date in enumerate(dates)]
+    db.add_all(emails)
+    db.commit()
+    dated = sorted((e for e in emails if e.date), key=lambda e: (e.date, e.id), reverse=True)
+    undated = sorted((e for e in emails if not e.date), key=lambda e: e.id, reverse=True)
+    return [e.id for e in dated + undated]
+
+
+def _walk(db, user_id: int, limit: int) -> list[int]:
+    query = db.query(Email).filter(Email.user_id == user_id)
+    seen, cursor = [], ""
+    while True:
+        page = _keyset_page(query, cursor, limit + 1)
+        seen.extend(email.id for email in page[:limit])
+        if len(page) <= limit:
+            return seen
+        cursor = _encode_cursor(page[limit - 1])
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_keyset_walk_matches_full_order(db, user, inbox, limit):
+    assert _walk(db, user.id, limit) == inbox
+
+
+def test_keyset_page_after_undated_cursor(db, user, inbox):
+    query = db.query(Email).filter(Email.user_id == user.id)
+    first_undated = db.get(Email, inbox[-2])
+    page = _keyset_page(query, _encode_cursor(first_undated), 10)
+    assert [email.id for email in page] == inbox[-1:]
+
+
+def test_cursor_round_trip():
+    email = Email(id=7, date=datetime(2024, 6, 3, 10, 0, 5))
+    assert _decode_cursor(_encode_cursor(email)) == (email.date, 7)
+    assert _decode_cursor(_encode_cursor(Email(id=3, date=None))) == (None, 3)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("não-é-um-cursor")
+    assert error.value.status_code == 400
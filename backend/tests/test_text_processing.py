@@ -0,0 +1,80 @@
+from sqlalchemy import text
+
+from app.core.types import CompressedText
+from app.models.email_model import Email
+from app.services.analysis_cache import content_hash
+from app.services.email_preprocessing import strip_seen_lines
+
+
+# ── CompressedText ────────────────────────────────────────────────────────────
+
+def test_compressed_text_round_trip(db, user):
+    bodies = [
+        "curto",
+        "<p>" + "Reunião às 10h — orçamento aprovado 🎉 " * 50 + "</p>",
+        "",
+        None,
+    ]
+    for i, body in enumerate(bodies):
+        db.add(Email(user_id=user.id, gmail_id=f"m{i}", body=body, clean_body=body))
+    db.commit()
+    db.expunge_all()
+
+    stored = {email.gmail_id: email for email in db.query(Email)}
+    assert [stored[f"m{i}"].body for i in range(len(bodies))] == bodies
+    assert [stored[f"m{i}"].clean_body for i in range(len(bodies))] == bodies
+
+
+def test_compressed_text_compresses_long_values_only():
+    column = CompressedText()
+    short = column.process_bind_param("oi", None)
+    long = column.process_bind_param("a" * 1000, None)
+    assert short == b"\x00oi"
+    assert len(long) < 100
+    assert column.process_result_value(long, None) == "a" * 1000
+
+
+def test_compressed_text_reads_legacy_plain_text(db, user):
+    """Linhas gravadas antes da compressão (texto puro) continuam legíveis."""
+    db.add(Email(user_id=user.id, gmail_id="legado"))
+    db.commit()
+    db.execute(text("UPDATE emails SET body = 'texto antigo' WHERE gmail_id = 'legado'"))
+    db.commit()
+    db.expunge_all()
+    assert db.query(Email).filter(Email.gmail_id == "legado").one().body == "texto antigo"
+
+
+# ── strip_seen_lines ──────────────────────────────────────────────────────────
+
+def test_strip_seen_lines_drops_quoted_history():
+    seen: set[str] = set()
+    first = "Podemos marcar a reunião de orçamento na terça?\nObrigado"
+    second = "Terça funciona para mim, às 10h no escritório.\n\nPodemos marcar a reunião de orçamento na terça?"
+
+    assert strip_seen_lines(first, seen) == first
+    assert strip_seen_lines(second, seen) == "Terça funciona para mim, às 10h no escritório."
+
+
+def test_strip_seen_lines_ignores_case_and_spacing():
+    seen: set[str] = set()
+    strip_seen_lines("O contrato segue anexo para revisão final", seen)
+    assert strip_seen_lines("o  CONTRATO segue anexo\tpara revisão final  ", seen) == ""
+
+
+def test_strip_seen_lines_keeps_short_lines():
+    """Linhas curtas ("Obrigado", "Abs") se repetem sem ser histórico e ficam."""
+    seen: set[str] = set()
+    strip_seen_lines("Obrigado\nAbs", seen)
+    assert strip_seen_lines("Obrigado\nAbs", seen) == "Obrigado\nAbs"
+    assert seen == set()
+
+
+# ── content_hash ──────────────────────────────────────────────────────────────
+
+def test_content_hash_normalizes_whitespace():
+    assert content_hash("Promoção", "50% off\n\nsó hoje") == content_hash(" Promoção ", "50%   off só hoje")
+
+
+def test_content_hash_separates_subject_and_body():
+    assert content_hash("a b", "c") != content_hash("a", "b c")
+    assert content_hash("Promoção", "50% off") != content_hash("Promoção", "60% off")
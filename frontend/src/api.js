@@ -36,7 +36,43 @@ export const api = {
   syncEmails: () => request("/emails/sync", { method: "POST" }),
   getStats: () => request("/emails/stats"),
   analyzeEmail: (id) => request(`/ai/analyze/${id}`, { method: "POST" }),
+  // Análise em streaming: onEvent(nome, dados) para "field", "reply", "done" e "error"
+  analyzeEmailStream: async (id, onEvent) => {
+    const res = await fetch(`${BASE_URL}/ai/analyze/${id}/stream`, {
+      method: "POST",
+      headers: { Authorization: `Bearer ${getToken()}` },
+    });
+    if (res.status === 401) {
+      localStorage.removeItem("token");
+      window.location.href = "/";
+      return;
+    }
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({}));
+      throw new Error(err.detail || "Erro na requisição");
+    }
+    const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      const blocks = buffer.split("\n\n");
+      buffer = blocks.pop();
+      for (const block of blocks) {
+        const name = block.match(/^event: (.*)$/m)?.[1];
+        const data = block.match(/^data: (.*)$/m)?.[1];
+        if (name && data) onEvent(name, JSON.parse(data));
+      }
+    }
+  },
   analyzeAll: () => request("/ai/analyze-all", { method: "POST" }),
+  // Stream SSE do analyze-all: eventos "progress" e "result". O EventSource não envia
+  // headers, então a URL leva um token de stream de curta duração, nunca o JWT da sessão
+  analyzeAllEvents: async () => {
+    const { token } = await request("/ai/stream-token", { method: "POST" });
+    return new EventSource(`${BASE_URL}/ai/analyze-all/events?token=${encodeURIComponent(token)}`);
+  },
   replyEmail: (id, message) =>
     request(`/emails/${id}/reply`, {
       method: "POST",
@@ -107,13 +107,33 @@ export default function EmailDetailPage() {
     }
   }
 
+  // Análise em streaming: o painel aparece com o primeiro campo pronto e a resposta
+  // sugerida vai sendo escrita conforme a IA gera
+  function mergeAnalysis(fields) {
+    setEmail((prev) => ({ ...prev, analysis: { ...prev.analysis, ...fields } }));
+  }
+
   async function handleAnalyze() {
+    let completed = false;
+    let failure = null;
     try {
       setAnalyzing(true);
-      await api.analyzeEmail(id);
-      await loadEmail();
+      setReplyText("");
+      setReplyEdited(false);
+      await api.analyzeEmailStream(id, (name, data) => {
+        if (name === "field") mergeAnalysis({ [data.name]: data.value });
+        else if (name === "reply") setReplyText((prev) => prev + data.delta);
+        else if (name === "done") {
+          completed = true;
+          mergeAnalysis(data);
+          setReplyText(data.suggested_reply || "");
+        } else if (name === "error") failure = data.detail;
+      });
+      if (!completed) throw new Error(failure || "A análise foi interrompida.");
       setMessage({ type: "success", text: "E-mail analisado com sucesso!" });
     } catch (e) {
+      // Análise interrompida: descarta os campos parciais para o botão voltar
+      if (!completed) setEmail((prev) => prev && { ...prev, analysis: null });
       setMessage({ type: "error", text: e.message });
     } finally {
       setAnalyzing(false);
@@ -311,6 +331,13 @@ export default function EmailDetailPage() {
                       ))}
                     </div>
                   )
+                ) : email.body_loaded === false ? (
+                  <div style={{ fontSize: "14px", color: c.text, lineHeight: "1.8" }}>
+                    {email.snippet}
+                    <div style={{ color: c.muted, fontSize: "12px", marginTop: "8px" }}>
+                      Não foi possível carregar o conteúdo completo do Gmail agora. Tente abrir o e-mail novamente.
+                    </div>
+                  </div>
                 ) : (
                   <span style={{ color: c.muted, fontSize: "14px" }}>(sem conteúdo)</span>
                 )}
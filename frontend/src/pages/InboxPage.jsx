@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import Sidebar, { MobileHeader } from "../components/Sidebar";
 import { api } from "../api";
@@ -60,8 +60,12 @@ export default function InboxPage() {
   const [syncing, setSyncing] = useState(false);
   const [analyzing, setAnalyzing] = useState(false);
   const [message, setMessage] = useState(null);
+  const eventsRef = useRef(null);
 
-  useEffect(() => { loadEmails(); }, []);
+  useEffect(() => {
+    loadEmails();
+    return () => eventsRef.current?.close();
+  }, []);
 
   async function loadEmails() {
     try {
@@ -89,17 +93,55 @@ export default function InboxPage() {
     }
   }
 
+  function finishAnalyzeAll(text, type = "success") {
+    eventsRef.current?.close();
+    eventsRef.current = null;
+    setAnalyzing(false);
+    setMessage({ type, text });
+    setTimeout(() => setMessage(null), 3000);
+    loadEmails();
+  }
+
+  // Acompanha o job pelo stream SSE; o token de stream vale pouco, então cada
+  // reconexão depois de um erro pede um novo
+  async function followAnalyzeAll(jobId) {
+    const events = await api.analyzeAllEvents();
+    eventsRef.current = events;
+    events.addEventListener("result", (e) => {
+      const { email_id, category, urgency } = JSON.parse(e.data);
+      setEmails((prev) => prev.map((email) =>
+        email.id === email_id ? { ...email, analysis: { ...email.analysis, category, urgency } } : email
+      ));
+    });
+    events.addEventListener("progress", (e) => {
+      const progress = JSON.parse(e.data);
+      if (progress.job_id !== jobId) return;
+      if (progress.status === "completed") {
+        finishAnalyzeAll(`${progress.done} e-mails analisados pela IA.`);
+      } else if (progress.status === "failed") {
+        finishAnalyzeAll("A análise em lote falhou.", "error");
+      } else {
+        setMessage({ type: "success", text: `Analisando com IA... ${progress.done}/${progress.total}` });
+      }
+    });
+    events.onerror = () => {
+      if (events.readyState === EventSource.CLOSED && eventsRef.current === events) {
+        followAnalyzeAll(jobId).catch((err) => finishAnalyzeAll(err.message, "error"));
+      }
+    };
+  }
+
   async function handleAnalyzeAll() {
     try {
       setAnalyzing(true);
       const res = await api.analyzeAll();
-      setMessage({ type: "success", text: `${res.processados} e-mails analisados pela IA.` });
-      await loadEmails();
+      if (!res.job_id) {
+        finishAnalyzeAll(res.message);
+        return;
+      }
+      await followAnalyzeAll(res.job_id);
     } catch (e) {
-      setMessage({ type: "error", text: e.message });
-    } finally {
-      setAnalyzing(false);
-      setTimeout(() => setMessage(null), 3000);
+      finishAnalyzeAll(e.message, "error");
     }
   }
 